@@ -1,3 +1,4 @@
+from opsbox_common import models  # noqa: F401  (registers the tables on Base.metadata)
 from opsbox_common.database import Base
 from opsbox_common.settings import DATABASE_URL
 from sqlalchemy import pool
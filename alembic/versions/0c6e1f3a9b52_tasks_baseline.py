@@ -0,0 +1,54 @@
+"""tasks baseline
+
+Revision ID: 0c6e1f3a9b52
+Revises:
+Create Date: 2026-10-18 16:00:00.000000
+
+The tasks table and task_status enum as they were before migrations were introduced,
+so `alembic upgrade head` works on an empty database. Databases that already have
+tasks (made by init_db's create_all) are left as they are.
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import context, op
+
+# revision identifiers, used by Alembic.
+revision: str = "0c6e1f3a9b52"
+down_revision: str | Sequence[str] | None = None
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+TASK_STATUS = postgresql.ENUM(
+    "NEW", "PENDING", "RUNNING", "SUCCEEDED", "FAILED", name="task_status", create_type=False
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not context.is_offline_mode() and sa.inspect(op.get_bind()).has_table("tasks"):
+        return
+    if op.get_context().dialect.name == "postgresql":
+        TASK_STATUS.create(op.get_bind(), checkfirst=not context.is_offline_mode())
+    op.create_table(
+        "tasks",
+        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("title", sa.String(length=255), nullable=True),
+        sa.Column("status", TASK_STATUS, nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("result", sa.String(length=255), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_tasks_title", "tasks", ["title"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_tasks_title", table_name="tasks")
+    op.drop_table("tasks")
+    if op.get_context().dialect.name == "postgresql":
+        TASK_STATUS.drop(op.get_bind(), checkfirst=False)
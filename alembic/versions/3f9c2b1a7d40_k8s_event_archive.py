@@ -0,0 +1,58 @@
+"""k8s event archive
+
+Revision ID: 3f9c2b1a7d40
+Revises: 0c6e1f3a9b52
+Create Date: 2026-10-18 16:05:00.000000
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3f9c2b1a7d40"
+down_revision: str | Sequence[str] | None = "0c6e1f3a9b52"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "k8s_events",
+        sa.Column("uid", sa.String(length=64), nullable=False),
+        sa.Column("namespace", sa.String(length=253), nullable=True),
+        sa.Column("name", sa.String(length=253), nullable=False),
+        sa.Column("type", sa.String(length=32), nullable=True),
+        sa.Column("reason", sa.String(length=128), nullable=True),
+        sa.Column("message", sa.Text(), nullable=True),
+        sa.Column("count", sa.Integer(), nullable=True),
+        sa.Column("first_timestamp", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_timestamp", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("event_time", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_seen", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("involved_kind", sa.String(length=64), nullable=True),
+        sa.Column("involved_name", sa.String(length=253), nullable=True),
+        sa.Column("involved_namespace", sa.String(length=253), nullable=True),
+        sa.Column("involved_uid", sa.String(length=64), nullable=True),
+        sa.Column("involved_field_path", sa.String(length=253), nullable=True),
+        sa.Column("source_component", sa.String(length=253), nullable=True),
+        sa.Column("source_host", sa.String(length=253), nullable=True),
+        sa.Column("reporting_controller", sa.String(length=253), nullable=True),
+        sa.Column("reporting_instance", sa.String(length=253), nullable=True),
+        sa.PrimaryKeyConstraint("uid"),
+    )
+    op.create_index("ix_k8s_events_last_seen", "k8s_events", ["last_seen"])
+    op.create_index("ix_k8s_events_namespace_last_seen", "k8s_events", ["namespace", "last_seen"])
+    op.create_index("ix_k8s_events_reason_last_seen", "k8s_events", ["reason", "last_seen"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_k8s_events_reason_last_seen", table_name="k8s_events")
+    op.drop_index("ix_k8s_events_namespace_last_seen", table_name="k8s_events")
+    op.drop_index("ix_k8s_events_last_seen", table_name="k8s_events")
+    op.drop_table("k8s_events")
@@ -0,0 +1,52 @@
+"""task status notify trigger
+
+Revision ID: 5a7c3e9d1b20
+Revises: 8b1d4e6f2a93
+Create Date: 2026-10-18 17:20:00.000000
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5a7c3e9d1b20"
+down_revision: str | Sequence[str] | None = "8b1d4e6f2a93"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_context().dialect.name != "postgresql":
+        return  # SQLite: /tasks/stream polls instead
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION tasks_notify_status() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('task_status', json_build_object(
+                'id', NEW.id, 'status', NEW.status, 'result', NEW.result,
+                'updated_at', NEW.updated_at
+            )::text);
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER tasks_notify_status
+        AFTER UPDATE OF status ON tasks
+        FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+        EXECUTE FUNCTION tasks_notify_status()
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_context().dialect.name != "postgresql":
+        return
+    op.execute("DROP TRIGGER IF EXISTS tasks_notify_status ON tasks")
+    op.execute("DROP FUNCTION IF EXISTS tasks_notify_status()")
@@ -0,0 +1,40 @@
+"""task keyset indexes
+
+Revision ID: 8b1d4e6f2a93
+Revises: 3f9c2b1a7d40
+Create Date: 2026-10-18 16:40:00.000000
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8b1d4e6f2a93"
+down_revision: str | Sequence[str] | None = "3f9c2b1a7d40"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+INDEXES = {
+    "ix_tasks_created_at_id": ["created_at", "id"],
+    "ix_tasks_status_created_at_id": ["status", "created_at", "id"],
+    "ix_tasks_updated_at_id": ["updated_at", "id"],
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY cannot run inside a transaction, and keeps tasks writable meanwhile
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(
+                name, "tasks", columns, postgresql_concurrently=True, if_not_exists=True
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(name, table_name="tasks", postgresql_concurrently=True, if_exists=True)
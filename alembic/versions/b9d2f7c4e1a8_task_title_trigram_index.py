@@ -0,0 +1,65 @@
+"""task title trigram index
+
+Revision ID: b9d2f7c4e1a8
+Revises: e7b3d9a4c6f1
+Create Date: 2026-10-18 19:30:00.000000
+
+GIN (gin_trgm_ops) index on tasks.title for GET /tasks?q=. tasks is partitioned, and
+CREATE INDEX CONCURRENTLY does not work on a partitioned table: the parent index is
+created ON ONLY tasks (invalid, no data), each existing partition's index is built
+concurrently and attached, and the parent index becomes valid with the last one.
+Partitions created afterwards get theirs from the parent.
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import context, op
+
+# revision identifiers, used by Alembic.
+revision: str = "b9d2f7c4e1a8"
+down_revision: str | Sequence[str] | None = "e7b3d9a4c6f1"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+INDEX = "ix_tasks_title_trgm"
+
+PARTITIONS_SQL = sa.text(
+    """
+    SELECT c.relname
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'tasks'::regclass
+    ORDER BY c.relname
+    """
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_context().dialect.name != "postgresql":
+        return  # SQLite: searches scan the table
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    if context.is_offline_mode():
+        # --sql cannot list the partitions: one CREATE INDEX, blocking writes while it builds
+        op.execute(f"CREATE INDEX IF NOT EXISTS {INDEX} ON tasks USING gin (title gin_trgm_ops)")
+        return
+    op.execute(f"CREATE INDEX IF NOT EXISTS {INDEX} ON ONLY tasks USING gin (title gin_trgm_ops)")
+    names = list(op.get_bind().execute(PARTITIONS_SQL).scalars())
+
+    for name in names:
+        partition_index = f"ix_{name}_title_trgm"
+        with op.get_context().autocommit_block():
+            op.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{partition_index}" '
+                f'ON "{name}" USING gin (title gin_trgm_ops)'
+            )
+        op.execute(f'ALTER INDEX {INDEX} ATTACH PARTITION "{partition_index}"')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_context().dialect.name != "postgresql":
+        return
+    # the partitions' indexes go with it; pg_trgm stays, other objects may use it
+    op.execute(f"DROP INDEX IF EXISTS {INDEX}")
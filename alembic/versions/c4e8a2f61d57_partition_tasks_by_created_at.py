@@ -0,0 +1,146 @@
+"""partition tasks by created_at
+
+Revision ID: c4e8a2f61d57
+Revises: 5a7c3e9d1b20
+Create Date: 2026-10-18 18:05:00.000000
+
+The existing table is not copied: it becomes the first partition, tasks_legacy, for
+every created_at before LEGACY_DAYS days from now (midnight UTC), and daily
+partitions follow, plus a DEFAULT partition, tasks_default, for rows no daily partition
+covers yet. A validated CHECK constraint and the (id, created_at) index of the
+new primary key, both built beforehand without blocking writes, make the ATTACH
+itself instant. Task ids stay uuid4s but are only unique together with created_at.
+The worker's retention run creates the partitions after these and drops tasks_legacy
+once it only holds expired finished tasks.
+"""
+
+from collections.abc import Sequence
+from datetime import UTC, datetime, timedelta
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e8a2f61d57"
+down_revision: str | Sequence[str] | None = "5a7c3e9d1b20"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+LEGACY_DAYS = 2  # rows keep landing in tasks_legacy until then
+PREMAKE_DAYS = 7
+
+INDEXES = {
+    "ix_tasks_title": ["title"],
+    "ix_tasks_created_at_id": ["created_at", "id"],
+    "ix_tasks_status_created_at_id": ["status", "created_at", "id"],
+    "ix_tasks_updated_at_id": ["updated_at", "id"],
+}
+
+NOTIFY_TRIGGER = """
+    CREATE TRIGGER tasks_notify_status
+    AFTER UPDATE OF status ON tasks
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION tasks_notify_status()
+"""
+
+
+def _legacy_bound() -> datetime:
+    today = datetime.now(UTC).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+    return today + timedelta(days=LEGACY_DAYS)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_context().dialect.name != "postgresql":
+        return  # SQLite: retention falls back to batched deletes
+    bound = _legacy_bound()
+
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TABLE tasks DROP CONSTRAINT IF EXISTS tasks_legacy_bound")
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_tasks_id_created_at "
+            "ON tasks (id, created_at)"
+        )
+        op.execute(
+            "ALTER TABLE tasks ADD CONSTRAINT tasks_legacy_bound "
+            f"CHECK (created_at IS NOT NULL AND created_at < '{bound.isoformat()}') NOT VALID"
+        )
+        op.execute("ALTER TABLE tasks VALIDATE CONSTRAINT tasks_legacy_bound")
+
+    # the parent's trigger is cloned onto partitions; the old one would clash with it
+    op.execute("DROP TRIGGER IF EXISTS tasks_notify_status ON tasks")
+    op.execute("ALTER TABLE tasks RENAME TO tasks_legacy")
+    # a partition's primary key must be the parent's, (id, created_at)
+    op.execute(
+        "ALTER TABLE tasks_legacy DROP CONSTRAINT tasks_pkey, "
+        "ADD CONSTRAINT tasks_legacy_pkey PRIMARY KEY USING INDEX ix_tasks_id_created_at"
+    )
+    for name in INDEXES:
+        legacy = name.replace("ix_tasks_", "ix_tasks_legacy_")
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {legacy}")
+
+    op.execute(
+        """
+        CREATE TABLE tasks (
+            id UUID NOT NULL,
+            title VARCHAR(255),
+            status task_status NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            result VARCHAR(255),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    for name, columns in INDEXES.items():
+        op.create_index(name, "tasks", columns)
+    op.execute(NOTIFY_TRIGGER)
+
+    # matching indexes of tasks_legacy are attached, not rebuilt; the CHECK skips the scan
+    op.execute(
+        "ALTER TABLE tasks ATTACH PARTITION tasks_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ('{bound.isoformat()}')"
+    )
+    op.execute("ALTER TABLE tasks_legacy DROP CONSTRAINT tasks_legacy_bound")
+
+    for n in range(PREMAKE_DAYS):
+        day = bound + timedelta(days=n)
+        upper = day + timedelta(days=1)
+        op.execute(
+            f"CREATE TABLE tasks_p{day:%Y%m%d} PARTITION OF tasks "
+            f"FOR VALUES FROM ('{day.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+    # inserts keep working if retention stops creating partitions for a while
+    op.execute("CREATE TABLE tasks_default PARTITION OF tasks DEFAULT")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_context().dialect.name != "postgresql":
+        return
+    # back to one plain table: every partition's rows are copied
+    op.execute("ALTER TABLE tasks RENAME TO tasks_partitioned")
+    op.execute(
+        "ALTER TABLE tasks_partitioned RENAME CONSTRAINT tasks_pkey TO tasks_partitioned_pkey"
+    )
+    for name in INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_partitioned")
+    op.execute(
+        """
+        CREATE TABLE tasks (
+            id UUID NOT NULL PRIMARY KEY,
+            title VARCHAR(255),
+            status task_status NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            result VARCHAR(255)
+        )
+        """
+    )
+    op.execute(
+        "INSERT INTO tasks (id, title, status, created_at, updated_at, result) "
+        "SELECT id, title, status, created_at, updated_at, result FROM tasks_partitioned"
+    )
+    op.execute("DROP TABLE tasks_partitioned CASCADE")
+    for name, columns in INDEXES.items():
+        op.create_index(name, "tasks", columns)
+    op.execute(NOTIFY_TRIGGER)
@@ -0,0 +1,39 @@
+"""task run keys
+
+Revision ID: d5a1c8e3b7f2
+Revises: b9d2f7c4e1a8
+Create Date: 2026-10-18 20:10:00.000000
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d5a1c8e3b7f2"
+down_revision: str | Sequence[str] | None = "b9d2f7c4e1a8"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "task_run_keys",
+        sa.Column("key", sa.String(length=255), nullable=False),
+        sa.Column("task_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("job_id", sa.String(length=64), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("key"),
+    )
+    op.create_index("ix_task_run_keys_created_at", "task_run_keys", ["created_at"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_task_run_keys_created_at", table_name="task_run_keys")
+    op.drop_table("task_run_keys")
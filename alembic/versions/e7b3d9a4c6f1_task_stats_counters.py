@@ -0,0 +1,48 @@
+"""task stats counters
+
+Revision ID: e7b3d9a4c6f1
+Revises: c4e8a2f61d57
+Create Date: 2026-10-18 18:50:00.000000
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e7b3d9a4c6f1"
+down_revision: str | Sequence[str] | None = "c4e8a2f61d57"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "task_status_counts",
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("count", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("status"),
+    )
+    op.create_table(
+        "task_stats_minutes",
+        sa.Column("minute", sa.DateTime(), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("bucket", sa.SmallInteger(), nullable=False),
+        sa.Column("count", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("minute", "status", "bucket"),
+    )
+    # starting point; from here on writers keep the counters up to date
+    op.execute(
+        "INSERT INTO task_status_counts (status, count) "
+        "SELECT CAST(status AS VARCHAR(16)), count(*) FROM tasks GROUP BY status"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("task_stats_minutes")
+    op.drop_table("task_status_counts")
@@ -0,0 +1,65 @@
+"""task status count shards
+
+Revision ID: f2a6c9d4e8b1
+Revises: d5a1c8e3b7f2
+Create Date: 2026-10-18 21:30:00.000000
+
+task_status_counts gets a shard column in its key: writers spread their upserts over
+the shards of a status instead of all queuing on one row. The table holds a handful of
+rows, so it is rebuilt; the existing counts become shard 0.
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f2a6c9d4e8b1"
+down_revision: str | Sequence[str] | None = "d5a1c8e3b7f2"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "task_status_counts_sharded",
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("shard", sa.SmallInteger(), nullable=False),
+        sa.Column("count", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("status", "shard"),
+    )
+    op.execute(
+        "INSERT INTO task_status_counts_sharded (status, shard, count) "
+        "SELECT status, 0, count FROM task_status_counts"
+    )
+    op.drop_table("task_status_counts")
+    op.rename_table("task_status_counts_sharded", "task_status_counts")
+    if op.get_context().dialect.name == "postgresql":
+        op.execute(
+            "ALTER TABLE task_status_counts "
+            "RENAME CONSTRAINT task_status_counts_sharded_pkey TO task_status_counts_pkey"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_table(
+        "task_status_counts_single",
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("count", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("status"),
+    )
+    op.execute(
+        "INSERT INTO task_status_counts_single (status, count) "
+        "SELECT status, sum(count) FROM task_status_counts GROUP BY status"
+    )
+    op.drop_table("task_status_counts")
+    op.rename_table("task_status_counts_single", "task_status_counts")
+    if op.get_context().dialect.name == "postgresql":
+        op.execute(
+            "ALTER TABLE task_status_counts "
+            "RENAME CONSTRAINT task_status_counts_single_pkey TO task_status_counts_pkey"
+        )
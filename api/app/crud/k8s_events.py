@@ -1,48 +1,127 @@
 import datetime
+import json
+import os
+import threading
 from typing import Annotated, Any
 
 from fastapi import Query
+from fastapi.encoders import jsonable_encoder
+from kubernetes import watch
 
-from app.infra.kube import get_k8s_client
+from app.crud.k8s_ns import resolve_namespaces
+from app.infra import event_archive, watch_cache
+from app.infra.broadcast import Broadcaster
+from app.infra.conditional import delta_list
+from app.infra.fanout import fan_out
+from app.infra.fieldsets import Extractors, Selection, parse_fields, project
+from app.infra.kube import KUBE_REQUEST_TIMEOUT, ApiException, core_v1, json_body, parse_time
+
+# Upstream watches are re-issued this often, which also bounds how long a stream whose
+# last subscriber left keeps its apiserver connection
+EVENT_STREAM_WATCH_TIMEOUT = int(os.getenv("EVENT_STREAM_WATCH_TIMEOUT", "60"))
 
 NAMESPACE_DESC = Query(None)
 FIELD_SELECTOR_DESC = Query(None)
 CONTINUE_DESC = Query(None)
 SINCE_TIME_DESC = Query(None)
 ONLY_WARNING_DESC = Query(False)
+CONSISTENT_DESC = Query(False)
+
+
+EVENT_FIELDS: Extractors = {
+    "name": lambda e: e.metadata.name,
+    "namespace": lambda e: e.metadata.namespace,
+    "type": lambda e: e.type,  # Normal | Warning
+    "reason": lambda e: e.reason,  # e.g., BackOff
+    "message": lambda e: e.message,
+    "count": lambda e: e.count,
+    "first_timestamp": lambda e: e.first_timestamp,
+    "last_timestamp": lambda e: e.last_timestamp,
+    "event_time": lambda e: getattr(e, "event_time", None),
+    "involved_object": lambda e: {
+        "kind": e.involved_object.kind,
+        "name": e.involved_object.name,
+        "namespace": e.involved_object.namespace,
+        "uid": e.involved_object.uid,
+        "fieldPath": e.involved_object.field_path,
+    },
+    "source": lambda e: {
+        "component": getattr(e.source, "component", None),
+        "host": getattr(e.source, "host", None),
+    },
+    "reporting_controller": lambda e: (
+        getattr(e, "reporting_component", None) or getattr(e, "reporting_controller", None)
+    ),
+    "reporting_instance": lambda e: getattr(e, "reporting_instance", None),
+}
 
 
-def _event_to_dict(e) -> dict[str, Any]:
-    meta = e.metadata
-    involved = e.involved_object
+def _event_to_dict(e, sel: Selection | None = None) -> dict[str, Any]:
+    return project(e, EVENT_FIELDS, sel)
 
+
+def _raw_involved(e: dict[str, Any]) -> dict[str, Any]:
+    involved = e.get("involvedObject") or {}
     return {
-        "name": meta.name,
-        "namespace": meta.namespace,
-        "type": e.type,  # Normal | Warning
-        "reason": e.reason,  # e.g., BackOff
-        "message": e.message,
-        "count": e.count,
-        "first_timestamp": e.first_timestamp,
-        "last_timestamp": e.last_timestamp,
-        "event_time": getattr(e, "event_time", None),
-        "involved_object": {
-            "kind": involved.kind,
-            "name": involved.name,
-            "namespace": involved.namespace,
-            "uid": involved.uid,
-            "fieldPath": involved.field_path,
-        },
-        "source": {
-            "component": getattr(e.source, "component", None),
-            "host": getattr(e.source, "host", None),
-        },
-        "reporting_controller": getattr(e, "reporting_component", None)
-        or getattr(e, "reporting_controller", None),
-        "reporting_instance": getattr(e, "reporting_instance", None),
+        "kind": involved.get("kind"),
+        "name": involved.get("name"),
+        "namespace": involved.get("namespace"),
+        "uid": involved.get("uid"),
+        "fieldPath": involved.get("fieldPath"),
     }
 
 
+# Same projection as EVENT_FIELDS, from the apiserver's raw JSON
+EVENT_RAW_FIELDS: Extractors = {
+    "name": lambda e: e["metadata"]["name"],
+    "namespace": lambda e: e["metadata"].get("namespace"),
+    "type": lambda e: e.get("type"),
+    "reason": lambda e: e.get("reason"),
+    "message": lambda e: e.get("message"),
+    "count": lambda e: e.get("count"),
+    "first_timestamp": lambda e: parse_time(e.get("firstTimestamp")),
+    "last_timestamp": lambda e: parse_time(e.get("lastTimestamp")),
+    "event_time": lambda e: parse_time(e.get("eventTime")),
+    "involved_object": _raw_involved,
+    "source": lambda e: {
+        "component": (e.get("source") or {}).get("component"),
+        "host": (e.get("source") or {}).get("host"),
+    },
+    "reporting_controller": lambda e: e.get("reportingComponent") or None,
+    "reporting_instance": lambda e: e.get("reportingInstance"),
+}
+
+
+def _event_raw_to_dict(e: dict[str, Any], sel: Selection | None = None) -> dict[str, Any]:
+    return project(e, EVENT_RAW_FIELDS, sel)
+
+
+# Same projection as EVENT_FIELDS, from archived rows (opsbox_common.models.K8sEvent)
+EVENT_ARCHIVE_FIELDS: Extractors = {
+    "name": lambda r: r.name,
+    "namespace": lambda r: r.namespace,
+    "type": lambda r: r.type,
+    "reason": lambda r: r.reason,
+    "message": lambda r: r.message,
+    "count": lambda r: r.count,
+    "first_timestamp": lambda r: event_archive.utc(r.first_timestamp),
+    "last_timestamp": lambda r: event_archive.utc(r.last_timestamp),
+    "event_time": lambda r: event_archive.utc(r.event_time),
+    "involved_object": lambda r: {
+        "kind": r.involved_kind,
+        "name": r.involved_name,
+        "namespace": r.involved_namespace,
+        "uid": r.involved_uid,
+        "fieldPath": r.involved_field_path,
+    },
+    "source": lambda r: {"component": r.source_component, "host": r.source_host},
+    "reporting_controller": lambda r: r.reporting_controller,
+    "reporting_instance": lambda r: r.reporting_instance,
+}
+
+TIME_FIELDS = ("last_timestamp", "event_time", "first_timestamp")
+
+
 def _parse_since_time(since_time: str | None) -> datetime.datetime | None:
     if not since_time:
         return None
@@ -61,56 +140,181 @@ def list_events(
     since_seconds: Annotated[int | None, Query(ge=1)] = None,
     since_time: str | None = SINCE_TIME_DESC,
     only_warning: bool = ONLY_WARNING_DESC,
+    consistent: bool = CONSISTENT_DESC,
+    fields: str | None = None,
+    namespace_selector: str | None = None,
+    until_time: str | None = None,
+    since_resource_version: str | None = None,
 ):
-    k8s_client = get_k8s_client()
-    v1 = k8s_client.CoreV1Api()
+    """
+    Time windows (since_*/until_time) are served from the event archive when it is
+    running, newest first; everything else lists live events in apiserver order.
+    """
+    namespaces = resolve_namespaces(namespace, namespace_selector)
+    # a selector matching no namespace gives [], which must select nothing, not everything
+    scope = namespaces if namespaces is not None else ([namespace] if namespace else None)
+    cutoff: datetime.datetime | None = None
+    if since_seconds:
+        cutoff = datetime.datetime.now(datetime.UTC).replace(microsecond=0)  # cosmetic
+        cutoff = cutoff - datetime.timedelta(seconds=since_seconds)
+    elif since_time:
+        cutoff = _parse_since_time(since_time)
+    until = _parse_since_time(until_time)
 
     fs = field_selector
     if only_warning:
         fs = f"type=Warning{',' + field_selector if field_selector else ''}"
 
-    if namespace:
-        res = v1.list_namespaced_event(
-            namespace=namespace,
+    if since_resource_version:
+        sel = parse_fields(fields, EVENT_FIELDS)
+        return delta_list(
+            "events",
+            since_resource_version,
+            lambda e: _event_to_dict(e, sel),
+            namespaces=scope,
             label_selector=label_selector,
             field_selector=fs,
-            limit=limit,
-            _continue=_continue,
-        )
-    else:
-        res = v1.list_event_for_all_namespaces(
-            label_selector=label_selector,
-            field_selector=fs,
-            limit=limit,
-            _continue=_continue,
         )
 
-    items: list[dict[str, Any]] = [_event_to_dict(e) for e in res.items]
+    archived = bool(_continue and _continue.startswith(event_archive.CONTINUE_PREFIX))
+    if archived or (
+        (cutoff or until)
+        and not consistent
+        and event_archive.serving()
+        and event_archive.supports(label_selector, fs)
+    ):
+        sel = parse_fields(fields, EVENT_ARCHIVE_FIELDS)
+        rows, token = event_archive.query(
+            scope,
+            cutoff,
+            until,
+            fs,
+            limit,
+            _continue,
+        )
+        out = {"items": [project(r, EVENT_ARCHIVE_FIELDS, sel) for r in rows], "continue": token}
+        if namespaces is not None:
+            out["errors"] = {}
+        return out
 
-    cutoff: datetime.datetime | None = None
-    if since_seconds:
-        cutoff = (
-            datetime.datetime.now(datetime.UTC)
-            if since_seconds == 0
-            else datetime.datetime.now(datetime.UTC)
+    if namespaces is not None:
+        return fan_out(
+            namespaces,
+            lambda ns, token: list_events(
+                ns,
+                label_selector,
+                field_selector,
+                limit,
+                token,
+                since_seconds,
+                since_time,
+                only_warning,
+                consistent,
+                fields,
+                None,
+                until_time,
+            ),
+            _continue,
         )
-        cutoff = cutoff.replace(microsecond=0)  # cosmetic
-        cutoff = cutoff - datetime.timedelta(seconds=since_seconds)
-    elif since_time:
-        cutoff = _parse_since_time(since_time)
+    sel = parse_fields(fields, EVENT_FIELDS)
+    # the time filter reads the timestamps, so they are projected even if not requested
+    need = sel
+    if sel is not None and (cutoff or until):
+        need = {**sel, **dict.fromkeys(TIME_FIELDS)}
 
-    if cutoff:
+    resource_version = watch_cache.current_version("events")
+    cached = watch_cache.cached_list(
+        "events",
+        consistent,
+        namespace=namespace,
+        label_selector=label_selector,
+        field_selector=fs,
+        limit=limit,
+        _continue=_continue,
+    )
+    if cached is not None:
+        events, token = cached
+        items: list[dict[str, Any]] = [_event_to_dict(e, need) for e in events]
+    else:
+        v1 = core_v1()
+        if namespace:
+            res = v1.list_namespaced_event(
+                namespace=namespace,
+                label_selector=label_selector,
+                field_selector=fs,
+                limit=limit,
+                _continue=_continue,
+                _request_timeout=KUBE_REQUEST_TIMEOUT,
+                _preload_content=False,
+            )
+        else:
+            res = v1.list_event_for_all_namespaces(
+                label_selector=label_selector,
+                field_selector=fs,
+                limit=limit,
+                _continue=_continue,
+                _request_timeout=KUBE_REQUEST_TIMEOUT,
+                _preload_content=False,
+            )
+        data = json_body(res)
+        items = [_event_raw_to_dict(e, need) for e in data["items"]]
+        token = data["metadata"].get("continue")
+        resource_version = None  # an apiserver one, not known to the delta log
+
+    if cutoff or until:
 
-        def newer(d: dict[str, Any]) -> bool:
-            for k in ("last_timestamp", "event_time", "first_timestamp"):
+        def in_window(d: dict[str, Any]) -> bool:
+            for k in TIME_FIELDS:
                 t = d.get(k)
                 if t:
                     # k8s python client returns datetime objects already
                     tt = t if isinstance(t, datetime.datetime) else _parse_since_time(str(t))
-                    if tt and tt >= cutoff:
+                    if tt and (cutoff is None or tt >= cutoff) and (until is None or tt <= until):
                         return True
             return False
 
-        items = [d for d in items if newer(d)]
+        items = [d for d in items if in_window(d)]
+        if need is not sel:
+            items = [{k: v for k, v in d.items() if k in sel} for d in items]
+
+    return {"items": items, "continue": token, "resource_version": resource_version}
+
+
+# ---------- live event stream ----------
+def watch_events(key: tuple[str | None, bool], publish, stop: threading.Event) -> None:
+    """Broadcaster producer: one apiserver WATCH for a (namespace, only_warning) filter."""
+    namespace, only_warning = key
+    v1 = core_v1()
+    fn = v1.list_namespaced_event if namespace else v1.list_event_for_all_namespaces
+    kwargs: dict[str, Any] = {"namespace": namespace} if namespace else {}
+    if only_warning:
+        kwargs["field_selector"] = "type=Warning"
+
+    # start from "now": subscribers fetch history over HTTP, the stream only adds news
+    rv = fn(limit=1, **kwargs).metadata.resource_version
+    while not stop.is_set():
+        w = watch.Watch()
+        try:
+            for ev in w.stream(
+                fn,
+                resource_version=rv,
+                allow_watch_bookmarks=True,
+                timeout_seconds=EVENT_STREAM_WATCH_TIMEOUT,
+                **kwargs,
+            ):
+                if ev["type"] == "BOOKMARK":
+                    rv = ev["raw_object"]["metadata"]["resourceVersion"]
+                else:
+                    rv = ev["object"].metadata.resource_version
+                    if ev["type"] != "DELETED":
+                        publish(json.dumps(jsonable_encoder(_event_to_dict(ev["object"]))))
+                if stop.is_set():
+                    w.stop()
+        except ApiException as e:
+            if e.status != 410:
+                raise
+            # resourceVersion expired; skip ahead rather than replaying history
+            rv = fn(limit=1, **kwargs).metadata.resource_version
+
 
-    return {"items": items, "continue": res.metadata._continue}
+EVENT_STREAM = Broadcaster("events", watch_events)
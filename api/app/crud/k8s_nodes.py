@@ -2,13 +2,29 @@ from typing import Annotated, Any
 
 from fastapi import HTTPException, Query
 
-from app.infra.kube import get_k8s_client
+from app.crud.k8s_ns import resolve_namespaces
+from app.infra import usage_history, watch_cache
+from app.infra.conditional import delta_list
+from app.infra.fanout import fan_out
+from app.infra.fieldsets import Extractors, Selection, parse_fields, project
+from app.infra.kube import (
+    KUBE_METRICS_TIMEOUT,
+    KUBE_REQUEST_TIMEOUT,
+    ApiException,
+    core_v1,
+    custom_objects,
+    json_body,
+    parse_time,
+)
 
 NAMESPACE_DESC = Query(None)
 LABEL_SELECTOR_DESC = Query(None)
 LIMIT_DESC = Annotated[int, Query(ge=1, le=2000)]
 CONTINUE_DESC = Query(None)
 INCLUDE_METRICS_DESC = Query(False)
+CONSISTENT_DESC = Query(False)
+WINDOW_SECONDS_DESC = Annotated[int, Query(ge=60, le=86400)]
+POINTS_DESC = Annotated[int, Query(ge=2, le=500)]
 
 
 def _node_ready(conditions) -> bool:
@@ -27,42 +43,130 @@ def _node_addr(status) -> dict[str, str | None]:
     }
 
 
-def _node_summary(n) -> dict[str, Any]:
-    s = n.status
-    ni = s.node_info
+def _node_info(n, attr: str):
+    return getattr(n.status.node_info, attr, None)
+
+
+NODE_FIELDS: Extractors = {
+    "name": lambda n: n.metadata.name,
+    "labels": lambda n: n.metadata.labels or {},
+    "taints": lambda n: [
+        {"key": t.key, "value": t.value, "effect": t.effect} for t in (n.spec.taints or [])
+    ],
+    "unschedulable": lambda n: bool(getattr(n.spec, "unschedulable", False)),
+    "ready": lambda n: _node_ready(n.status.conditions),
+    "addresses": lambda n: _node_addr(n.status),
+    "capacity": lambda n: n.status.capacity,
+    "allocatable": lambda n: n.status.allocatable,
+    "kubelet_version": lambda n: _node_info(n, "kubelet_version"),
+    "os_image": lambda n: _node_info(n, "os_image"),
+    "container_runtime": lambda n: _node_info(n, "container_runtime_version"),
+    "kernel_version": lambda n: _node_info(n, "kernel_version"),
+    "arch": lambda n: _node_info(n, "architecture"),
+    "images": lambda n: [
+        {"names": i.names, "size_bytes": i.size_bytes} for i in (n.status.images or [])
+    ][:10],  # top 10
+    "conditions": lambda n: [
+        {
+            "type": c.type,
+            "status": c.status,
+            "reason": c.reason,
+            "message": c.message,
+            "last_transition_time": c.last_transition_time,
+        }
+        for c in (n.status.conditions or [])
+    ],
+    "creation_timestamp": lambda n: n.metadata.creation_timestamp,
+}
+
+
+def _node_summary(n, sel: Selection | None = None) -> dict[str, Any]:
+    return project(n, NODE_FIELDS, sel)
+
+
+def _raw_status(n: dict[str, Any]) -> dict[str, Any]:
+    return n.get("status") or {}
+
+
+def _raw_node_info(n: dict[str, Any], key: str):
+    return (_raw_status(n).get("nodeInfo") or {}).get(key)
+
+
+def _raw_addresses(n: dict[str, Any]) -> dict[str, str | None]:
+    bytype = {a["type"]: a["address"] for a in (_raw_status(n).get("addresses") or [])}
     return {
-        "name": n.metadata.name,
-        "labels": n.metadata.labels or {},
-        "taints": [
-            {"key": t.key, "value": t.value, "effect": t.effect} for t in (n.spec.taints or [])
-        ],
-        "unschedulable": bool(getattr(n.spec, "unschedulable", False)),
-        "ready": _node_ready(s.conditions),
-        "addresses": _node_addr(s),
-        "capacity": s.capacity,
-        "allocatable": s.allocatable,
-        "kubelet_version": getattr(ni, "kubelet_version", None),
-        "os_image": getattr(ni, "os_image", None),
-        "container_runtime": getattr(ni, "container_runtime_version", None),
-        "kernel_version": getattr(ni, "kernel_version", None),
-        "arch": getattr(ni, "architecture", None),
-        "images": [{"names": i.names, "size_bytes": i.size_bytes} for i in (s.images or [])][
-            :10
-        ],  # top 10
-        "conditions": [
-            {
-                "type": c.type,
-                "status": c.status,
-                "reason": c.reason,
-                "message": c.message,
-                "last_transition_time": c.last_transition_time,
-            }
-            for c in (s.conditions or [])
-        ],
-        "creation_timestamp": n.metadata.creation_timestamp,
+        "internal": bytype.get("InternalIP"),
+        "external": bytype.get("ExternalIP"),
+        "hostname": bytype.get("Hostname"),
     }
 
 
+# Same projection as NODE_FIELDS, from the apiserver's raw JSON
+NODE_RAW_FIELDS: Extractors = {
+    "name": lambda n: n["metadata"]["name"],
+    "labels": lambda n: n["metadata"].get("labels") or {},
+    "taints": lambda n: [
+        {"key": t.get("key"), "value": t.get("value"), "effect": t.get("effect")}
+        for t in ((n.get("spec") or {}).get("taints") or [])
+    ],
+    "unschedulable": lambda n: bool((n.get("spec") or {}).get("unschedulable", False)),
+    "ready": lambda n: next(
+        (
+            c["status"] == "True"
+            for c in (_raw_status(n).get("conditions") or [])
+            if c["type"] == "Ready"
+        ),
+        False,
+    ),
+    "addresses": _raw_addresses,
+    "capacity": lambda n: _raw_status(n).get("capacity"),
+    "allocatable": lambda n: _raw_status(n).get("allocatable"),
+    "kubelet_version": lambda n: _raw_node_info(n, "kubeletVersion"),
+    "os_image": lambda n: _raw_node_info(n, "osImage"),
+    "container_runtime": lambda n: _raw_node_info(n, "containerRuntimeVersion"),
+    "kernel_version": lambda n: _raw_node_info(n, "kernelVersion"),
+    "arch": lambda n: _raw_node_info(n, "architecture"),
+    "images": lambda n: [
+        {"names": i.get("names"), "size_bytes": i.get("sizeBytes")}
+        for i in (_raw_status(n).get("images") or [])[:10]
+    ],  # top 10
+    "conditions": lambda n: [
+        {
+            "type": c["type"],
+            "status": c["status"],
+            "reason": c.get("reason"),
+            "message": c.get("message"),
+            "last_transition_time": parse_time(c.get("lastTransitionTime")),
+        }
+        for c in (_raw_status(n).get("conditions") or [])
+    ],
+    "creation_timestamp": lambda n: parse_time(n["metadata"].get("creationTimestamp")),
+}
+
+
+def _node_summary_raw(n: dict[str, Any], sel: Selection | None = None) -> dict[str, Any]:
+    return project(n, NODE_RAW_FIELDS, sel)
+
+
+def _node_usage_map() -> dict[str, dict[str, str]] | None:
+    # prefer the background sampler; only scrape metrics-server when it has nothing recent
+    latest = usage_history.fresh_latest("nodes")
+    if latest is not None:
+        return {
+            name: {"cpu": f"{round(s['cpu'] * 1000)}m", "memory": f"{int(s['memory']) // 1024}Ki"}
+            for name, s in latest.items()
+        }
+    try:
+        co = custom_objects()
+        m = co.list_cluster_custom_object(
+            "metrics.k8s.io", "v1beta1", "nodes", _request_timeout=KUBE_METRICS_TIMEOUT
+        )
+        return {i["metadata"]["name"]: i["usage"] for i in m.get("items", [])}
+    except Exception:
+        # metrics-server not installed or RBAC missing; keep going without usage
+        return None
+
+
 # ---------- list nodes ----------
 def list_nodes(
     label_selector: str | None = None,
@@ -70,41 +174,80 @@ def list_nodes(
     limit: LIMIT_DESC = 200,
     _continue: str | None = CONTINUE_DESC,
     include_metrics: bool = INCLUDE_METRICS_DESC,
+    consistent: bool = CONSISTENT_DESC,
+    fields: str | None = None,
+    since_resource_version: str | None = None,
 ):
-    k8s = get_k8s_client()
-    v1 = k8s.CoreV1Api()
-    res = v1.list_node(
-        label_selector=label_selector,
-        field_selector=field_selector,
-        limit=limit,
-        _continue=_continue,
-    )
-    items = [_node_summary(n) for n in res.items]
+    sel = parse_fields(fields, NODE_FIELDS)
+    # usage is joined on the node name, so project it even when fields leaves it out
+    drop_name = include_metrics and sel is not None and "name" not in sel
+    if drop_name:
+        sel = {**sel, "name": None}
+    if since_resource_version:
+        out = delta_list(
+            "nodes",
+            since_resource_version,
+            lambda n: _node_summary(n, sel),
+            label_selector=label_selector,
+            field_selector=field_selector,
+        )
+    else:
+        resource_version = watch_cache.current_version("nodes")
+        cached = watch_cache.cached_list(
+            "nodes",
+            consistent,
+            label_selector=label_selector,
+            field_selector=field_selector,
+            limit=limit,
+            _continue=_continue,
+        )
+        if cached is not None:
+            nodes, token = cached
+            out = {
+                "items": [_node_summary(n, sel) for n in nodes],
+                "continue": token,
+                "resource_version": resource_version,
+            }
+        else:
+            v1 = core_v1()
+            res = v1.list_node(
+                label_selector=label_selector,
+                field_selector=field_selector,
+                limit=limit,
+                _continue=_continue,
+                _request_timeout=KUBE_REQUEST_TIMEOUT,
+                _preload_content=False,
+            )
+            data = json_body(res)
+            out = {
+                "items": [_node_summary_raw(n, sel) for n in data["items"]],
+                "continue": data["metadata"].get("continue"),
+            }
 
     if include_metrics:
-        try:
-            co = k8s.CustomObjectsApi()
-            m = co.list_cluster_custom_object("metrics.k8s.io", "v1beta1", "nodes")
-            usage_map = {i["metadata"]["name"]: i["usage"] for i in m.get("items", [])}
-            for it in items:
+        usage_map = _node_usage_map()
+        if usage_map is not None:
+            for it in out["items"]:
                 it["usage"] = usage_map.get(
                     it["name"]
                 )  # cpu (e.g., "123m"), memory (e.g., "1024Mi")
-        except Exception:
-            # metrics-server not installed or RBAC missing; keep going without usage
-            pass
+        if drop_name:
+            for it in out["items"]:
+                del it["name"]
 
-    return {"items": items, "continue": res.metadata._continue}
+    return out
 
 
 # ---------- node detail ----------
-def get_node(name: str):
-    k8s = get_k8s_client()
-    v1 = k8s.CoreV1Api()
-    try:
-        n = v1.read_node(name)
+def get_node(name: str, consistent: bool = CONSISTENT_DESC):
+    n = watch_cache.cached_get("nodes", name, consistent)
+    if n is not None:
         return _node_summary(n)
-    except k8s.exceptions.ApiException as e:  # type: ignore[attr-defined]
+    v1 = core_v1()
+    try:
+        res = v1.read_node(name, _request_timeout=KUBE_REQUEST_TIMEOUT, _preload_content=False)
+        return _node_summary_raw(json_body(res))
+    except ApiException as e:
         if e.status == 404:
             raise HTTPException(status_code=404, detail="Node not found") from e
         raise
@@ -112,12 +255,13 @@ def get_node(name: str):
 
 # ---------- node metrics only ----------
 def get_node_metrics(name: str):
-    k8s = get_k8s_client()
-    co = k8s.CustomObjectsApi()
+    co = custom_objects()
     try:
-        data = co.get_cluster_custom_object("metrics.k8s.io", "v1beta1", "nodes", name)
+        data = co.get_cluster_custom_object(
+            "metrics.k8s.io", "v1beta1", "nodes", name, _request_timeout=KUBE_METRICS_TIMEOUT
+        )
         return data  # includes .usage.cpu and .usage.memory
-    except k8s.exceptions.ApiException as e:  # type: ignore[attr-defined]
+    except ApiException as e:
         if e.status == 404:
             raise HTTPException(
                 status_code=404, detail="Metrics not found (is metrics-server installed?)"
@@ -125,6 +269,17 @@ def get_node_metrics(name: str):
         raise
 
 
+# ---------- node usage history ----------
+def get_node_usage(name: str, window_seconds: WINDOW_SECONDS_DESC = 3600, points: POINTS_DESC = 60):
+    history = usage_history.collector.history("nodes", name, window_seconds, points)
+    if history is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No usage samples yet (is metrics-server installed and the collector on?)",
+        )
+    return {"name": name, **history}
+
+
 # ---------- pods scheduled on a node ----------
 def list_node_pods(
     name: str,
@@ -132,10 +287,42 @@ def list_node_pods(
     label_selector: str | None = LABEL_SELECTOR_DESC,
     limit: LIMIT_DESC = 200,
     _continue: str | None = CONTINUE_DESC,
+    consistent: bool = CONSISTENT_DESC,
+    namespace_selector: str | None = None,
 ):
-    k8s = get_k8s_client()
-    v1 = k8s.CoreV1Api()
+    namespaces = resolve_namespaces(namespace, namespace_selector)
+    if namespaces is not None:
+        return fan_out(
+            namespaces,
+            lambda ns, token: list_node_pods(name, ns, label_selector, limit, token, consistent),
+            _continue,
+        )
     field_selector = f"spec.nodeName={name}"
+    cached = watch_cache.cached_list(
+        "pods",
+        consistent,
+        namespace=namespace,
+        label_selector=label_selector,
+        field_selector=field_selector,
+        limit=limit,
+        _continue=_continue,
+    )
+    if cached is not None:
+        pods, token = cached
+        # return minimal pod info for table
+        items = [
+            {
+                "name": p.metadata.name,
+                "namespace": p.metadata.namespace,
+                "phase": p.status.phase,
+                "start_time": p.status.start_time,
+                "labels": p.metadata.labels or {},
+            }
+            for p in pods
+        ]
+        return {"items": items, "continue": token}
+
+    v1 = core_v1()
     if namespace:
         res = v1.list_namespaced_pod(
             namespace,
@@ -143,6 +330,8 @@ def list_node_pods(
             field_selector=field_selector,
             limit=limit,
             _continue=_continue,
+            _request_timeout=KUBE_REQUEST_TIMEOUT,
+            _preload_content=False,
         )
     else:
         res = v1.list_pod_for_all_namespaces(
@@ -150,16 +339,18 @@ def list_node_pods(
             field_selector=field_selector,
             limit=limit,
             _continue=_continue,
+            _request_timeout=KUBE_REQUEST_TIMEOUT,
+            _preload_content=False,
         )
-    # return minimal pod info for table
+    data = json_body(res)
     items = [
         {
-            "name": p.metadata.name,
-            "namespace": p.metadata.namespace,
-            "phase": p.status.phase,
-            "start_time": p.status.start_time,
-            "labels": p.metadata.labels or {},
+            "name": p["metadata"]["name"],
+            "namespace": p["metadata"].get("namespace"),
+            "phase": (p.get("status") or {}).get("phase"),
+            "start_time": parse_time((p.get("status") or {}).get("startTime")),
+            "labels": p["metadata"].get("labels") or {},
         }
-        for p in res.items
+        for p in data["items"]
     ]
-    return {"items": items, "continue": res.metadata._continue}
+    return {"items": items, "continue": data["metadata"].get("continue")}
@@ -3,30 +3,55 @@ from typing import Annotated, Any
 
 from fastapi import HTTPException, Query
 
-from app.infra.kube import get_k8s_client
+from app.infra import watch_cache
+from app.infra.conditional import delta_list
+from app.infra.fanout import split_namespaces
+from app.infra.fieldsets import Extractors, Selection, parse_fields, project
+from app.infra.kube import KUBE_REQUEST_TIMEOUT, ApiException, core_v1, json_body, parse_time
 
 LIMIT_DESC = Annotated[int, Query(ge=1, le=2000)]
 CONTINUE_DESC = Query(None)
+CONSISTENT_DESC = Query(False)
 
 
-def _ns(item) -> dict[str, Any]:
-    s = getattr(item, "status", None)
-    return {
-        "name": item.metadata.name,
-        "status": getattr(s, "phase", None) or getattr(s, "phase", "Active"),
-        "labels": item.metadata.labels or {},
-        "annotations": item.metadata.annotations or {},
-        "creation_timestamp": item.metadata.creation_timestamp,
-        "age_seconds": (
-            int(
-                (
-                    datetime.utcnow() - item.metadata.creation_timestamp.replace(tzinfo=None)
-                ).total_seconds()
-            )
-            if item.metadata.creation_timestamp
-            else None
-        ),
-    }
+def _age_seconds(created: datetime | None) -> int | None:
+    if not created:
+        return None
+    return int((datetime.utcnow() - created.replace(tzinfo=None)).total_seconds())
+
+
+NS_FIELDS: Extractors = {
+    "name": lambda item: item.metadata.name,
+    "status": lambda item: (
+        getattr(getattr(item, "status", None), "phase", None)
+        or getattr(getattr(item, "status", None), "phase", "Active")
+    ),
+    "labels": lambda item: item.metadata.labels or {},
+    "annotations": lambda item: item.metadata.annotations or {},
+    "creation_timestamp": lambda item: item.metadata.creation_timestamp,
+    "age_seconds": lambda item: _age_seconds(item.metadata.creation_timestamp),
+}
+
+
+def _ns(item, sel: Selection | None = None) -> dict[str, Any]:
+    return project(item, NS_FIELDS, sel)
+
+
+# Same projection as NS_FIELDS, from the apiserver's raw JSON
+NS_RAW_FIELDS: Extractors = {
+    "name": lambda item: item["metadata"]["name"],
+    "status": lambda item: (
+        item["status"].get("phase") if item.get("status") is not None else "Active"
+    ),
+    "labels": lambda item: item["metadata"].get("labels") or {},
+    "annotations": lambda item: item["metadata"].get("annotations") or {},
+    "creation_timestamp": lambda item: parse_time(item["metadata"].get("creationTimestamp")),
+    "age_seconds": lambda item: _age_seconds(parse_time(item["metadata"].get("creationTimestamp"))),
+}
+
+
+def _ns_raw(item: dict[str, Any], sel: Selection | None = None) -> dict[str, Any]:
+    return project(item, NS_RAW_FIELDS, sel)
 
 
 def get_namespaces(
@@ -34,22 +59,81 @@ def get_namespaces(
     label_selector: str | None = None,
     limit: LIMIT_DESC = 200,
     _continue: str | None = CONTINUE_DESC,
+    consistent: bool = CONSISTENT_DESC,
+    fields: str | None = None,
+    since_resource_version: str | None = None,
 ):
-    k8s = get_k8s_client()
-    v1 = k8s.CoreV1Api()
+    sel = parse_fields(fields, NS_FIELDS)
+    if since_resource_version:
+        return delta_list(
+            "namespaces",
+            since_resource_version,
+            lambda n: _ns(n, sel),
+            label_selector=label_selector,
+            field_selector=f"metadata.name={namespace}" if namespace else None,
+        )
+    v1 = core_v1()
 
     if namespace:
+        n = watch_cache.cached_get("namespaces", namespace, consistent)
+        if n is not None:
+            return {"items": [_ns(n, sel)], "continue": None}
         try:
-            n = v1.read_namespace(name=namespace)
-            return {"items": [_ns(n)], "continue": None}
-        except k8s.exceptions.ApiException as e:  # type: ignore[attr-defined]
+            res = v1.read_namespace(
+                name=namespace, _request_timeout=KUBE_REQUEST_TIMEOUT, _preload_content=False
+            )
+            return {"items": [_ns_raw(json_body(res), sel)], "continue": None}
+        except ApiException as e:
             if e.status == 404:
                 raise HTTPException(status_code=404, detail="Namespace not found") from e
             raise
 
-    res = v1.list_namespace(label_selector=label_selector, limit=limit, _continue=_continue)
+    resource_version = watch_cache.current_version("namespaces")
+    cached = watch_cache.cached_list(
+        "namespaces", consistent, label_selector=label_selector, limit=limit, _continue=_continue
+    )
+    if cached is not None:
+        namespaces, token = cached
+        return {
+            "items": [_ns(n, sel) for n in namespaces],
+            "continue": token,
+            "resource_version": resource_version,
+        }
 
+    res = v1.list_namespace(
+        label_selector=label_selector,
+        limit=limit,
+        _continue=_continue,
+        _request_timeout=KUBE_REQUEST_TIMEOUT,
+        _preload_content=False,
+    )
+    data = json_body(res)
     return {
-        "items": [_ns(n) for n in res.items],
-        "continue": res.metadata._continue,
+        "items": [_ns_raw(n, sel) for n in data["items"]],
+        "continue": data["metadata"].get("continue"),
     }
+
+
+def resolve_namespaces(
+    namespace: str | None, namespace_selector: str | None = None
+) -> list[str] | None:
+    """
+    Namespaces to fan a list query out to: a comma separated `namespace`, and/or those
+    matching `namespace_selector`. None means a plain single/all-namespace query.
+    """
+    names = split_namespaces(namespace)
+    if not namespace_selector:
+        return names
+    selected: list[str] = []
+    token = None
+    while True:
+        page = get_namespaces(
+            None, namespace_selector, watch_cache.KUBE_LIST_PAGE_SIZE, token, False, "name"
+        )
+        selected.extend(n["name"] for n in page["items"])
+        token = page["continue"]
+        if not token:
+            break
+    if names is None and namespace:
+        names = [namespace]
+    return sorted(set(selected) & set(names)) if names is not None else sorted(selected)
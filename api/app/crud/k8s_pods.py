@@ -1,8 +1,21 @@
+import heapq
+import itertools
+import os
+import queue
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from typing import Annotated, Any
 
 from fastapi import HTTPException, Query
 
-from app.infra.kube import get_k8s_client
+from app.crud.k8s_ns import resolve_namespaces
+from app.infra import usage_history, watch_cache
+from app.infra.conditional import delta_list
+from app.infra.fanout import fan_out
+from app.infra.fieldsets import Extractors, Selection, parse_fields, project
+from app.infra.kube import KUBE_REQUEST_TIMEOUT, ApiException, core_v1, json_body, parse_time
 
 NAMESPACE_DESC = Query(None)
 LABEL_SELECTOR_DESC = Query(None)
@@ -12,9 +25,24 @@ CONTINUE_DESC = Query(None)
 TAIL_LINES_DESC = Annotated[int, Query(ge=1, le=10000)]
 SINCE_SECONDS_DESC = Annotated[int | None, Query(ge=1)]
 PREVIOUS_DESC = Query(False)
+CONSISTENT_DESC = Query(False)
+WINDOW_SECONDS_DESC = Annotated[int, Query(ge=60, le=86400)]
+POINTS_DESC = Annotated[int, Query(ge=2, le=500)]
 
+# Hard cap on bytes relayed per log request; also sent upstream as limit_bytes
+LOG_STREAM_MAX_BYTES = int(os.getenv("LOG_STREAM_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_STREAM_CHUNK_BYTES = 16 * 1024
+LOG_MAX_LINE_BYTES = 64 * 1024
 
-def _pod(p) -> dict[str, Any]:
+# Merged (multi-pod) log tails
+LOG_MERGE_MAX_PODS = int(os.getenv("LOG_MERGE_MAX_PODS", "50"))
+LOG_MERGE_MAX_CONCURRENT = int(os.getenv("LOG_MERGE_MAX_CONCURRENT", "10"))  # upstream conns
+LOG_MERGE_GRACE_SECONDS = float(os.getenv("LOG_MERGE_GRACE_SECONDS", "2"))  # follow reorder
+LOG_MERGE_QUEUE_SIZE = 1024  # pending upstream batches
+LOG_MERGE_BATCH = 500  # lines per relayed batch
+
+
+def _containers(p) -> list[dict[str, Any]]:
     containers = p.spec.containers or []
     statuses = p.status.container_statuses or []
     cstate = []
@@ -52,19 +80,92 @@ def _pod(p) -> dict[str, Any]:
                 },
             }
         )
-    return {
-        "name": p.metadata.name,
-        "namespace": p.metadata.namespace,
-        "node": p.spec.node_name,
-        "phase": p.status.phase,
-        "start_time": p.status.start_time,
-        "labels": p.metadata.labels or {},
-        "annotations": p.metadata.annotations or {},
-        "qos_class": getattr(p.status, "qos_class", None),
-        "containers": cstate,
-        "host_ip": p.status.host_ip,
-        "pod_ip": p.status.pod_ip,
-    }
+    return cstate
+
+
+POD_FIELDS: Extractors = {
+    "name": lambda p: p.metadata.name,
+    "namespace": lambda p: p.metadata.namespace,
+    "node": lambda p: p.spec.node_name,
+    "phase": lambda p: p.status.phase,
+    "start_time": lambda p: p.status.start_time,
+    "labels": lambda p: p.metadata.labels or {},
+    "annotations": lambda p: p.metadata.annotations or {},
+    "qos_class": lambda p: getattr(p.status, "qos_class", None),
+    "containers": _containers,
+    "host_ip": lambda p: p.status.host_ip,
+    "pod_ip": lambda p: p.status.pod_ip,
+}
+
+
+def _pod(p, sel: Selection | None = None) -> dict[str, Any]:
+    return project(p, POD_FIELDS, sel)
+
+
+def _containers_raw(p: dict[str, Any]) -> list[dict[str, Any]]:
+    spec = p.get("spec") or {}
+    statuses = (p.get("status") or {}).get("containerStatuses") or []
+    cstate = []
+    for i, c in enumerate(spec.get("containers") or []):
+        st = statuses[i] if i < len(statuses) else None
+        state_obj = st.get("state") if st else None
+        if state_obj and state_obj.get("waiting") is not None:
+            w = state_obj["waiting"]
+            state = {"state": "Waiting", "reason": w.get("reason"), "message": w.get("message")}
+        elif state_obj and state_obj.get("terminated") is not None:
+            t = state_obj["terminated"]
+            state = {
+                "state": "Terminated",
+                "reason": t.get("reason"),
+                "exit_code": t.get("exitCode"),
+                "finished_at": parse_time(t.get("finishedAt")),
+            }
+        elif state_obj and state_obj.get("running") is not None:
+            state = {
+                "state": "Running",
+                "started_at": parse_time(state_obj["running"].get("startedAt")),
+            }
+        else:
+            state = {"state": "Unknown"}
+        resources = c.get("resources") or {}
+        cstate.append(
+            {
+                "name": c["name"],
+                "image": c.get("image"),
+                "ready": st.get("ready") if st else None,
+                "restarts": st.get("restartCount") if st else 0,
+                "state": state,
+                "resources": {
+                    "requests": resources.get("requests"),
+                    "limits": resources.get("limits"),
+                },
+            }
+        )
+    return cstate
+
+
+def _status(p: dict[str, Any]) -> dict[str, Any]:
+    return p.get("status") or {}
+
+
+# Same projection as POD_FIELDS, from the apiserver's raw JSON
+POD_RAW_FIELDS: Extractors = {
+    "name": lambda p: p["metadata"]["name"],
+    "namespace": lambda p: p["metadata"].get("namespace"),
+    "node": lambda p: (p.get("spec") or {}).get("nodeName"),
+    "phase": lambda p: _status(p).get("phase"),
+    "start_time": lambda p: parse_time(_status(p).get("startTime")),
+    "labels": lambda p: p["metadata"].get("labels") or {},
+    "annotations": lambda p: p["metadata"].get("annotations") or {},
+    "qos_class": lambda p: _status(p).get("qosClass"),
+    "containers": _containers_raw,
+    "host_ip": lambda p: _status(p).get("hostIP"),
+    "pod_ip": lambda p: _status(p).get("podIP"),
+}
+
+
+def _pod_raw(p: dict[str, Any], sel: Selection | None = None) -> dict[str, Any]:
+    return project(p, POD_RAW_FIELDS, sel)
 
 
 def get_pods(
@@ -73,9 +174,52 @@ def get_pods(
     field_selector: str | None = FIELD_SELECTOR_DESC,
     limit: LIMIT_DESC = 200,
     _continue: str | None = CONTINUE_DESC,
+    consistent: bool = CONSISTENT_DESC,
+    fields: str | None = None,
+    namespace_selector: str | None = None,
+    since_resource_version: str | None = None,
 ):
-    k8s = get_k8s_client()
-    v1 = k8s.CoreV1Api()
+    namespaces = resolve_namespaces(namespace, namespace_selector)
+    # a selector matching no namespace gives [], which must select nothing, not everything
+    scope = namespaces if namespaces is not None else ([namespace] if namespace else None)
+    if since_resource_version:
+        sel = parse_fields(fields, POD_FIELDS)
+        return delta_list(
+            "pods",
+            since_resource_version,
+            lambda p: _pod(p, sel),
+            namespaces=scope,
+            label_selector=label_selector,
+            field_selector=field_selector,
+        )
+    if namespaces is not None:
+        return fan_out(
+            namespaces,
+            lambda ns, token: get_pods(
+                ns, label_selector, field_selector, limit, token, consistent, fields
+            ),
+            _continue,
+        )
+    sel = parse_fields(fields, POD_FIELDS)
+    resource_version = watch_cache.current_version("pods")
+    cached = watch_cache.cached_list(
+        "pods",
+        consistent,
+        namespace=namespace,
+        label_selector=label_selector,
+        field_selector=field_selector,
+        limit=limit,
+        _continue=_continue,
+    )
+    if cached is not None:
+        pods, token = cached
+        return {
+            "items": [_pod(p, sel) for p in pods],
+            "continue": token,
+            "resource_version": resource_version,
+        }
+
+    v1 = core_v1()
     if namespace:
         res = v1.list_namespaced_pod(
             namespace=namespace,
@@ -83,6 +227,8 @@ def get_pods(
             field_selector=field_selector,
             limit=limit,
             _continue=_continue,
+            _request_timeout=KUBE_REQUEST_TIMEOUT,
+            _preload_content=False,
         )
     else:
         res = v1.list_pod_for_all_namespaces(
@@ -90,51 +236,333 @@ def get_pods(
             field_selector=field_selector,
             limit=limit,
             _continue=_continue,
+            _request_timeout=KUBE_REQUEST_TIMEOUT,
+            _preload_content=False,
         )
+    data = json_body(res)
     return {
-        "items": [_pod(p) for p in res.items],
-        "continue": res.metadata._continue,
+        "items": [_pod_raw(p, sel) for p in data["items"]],
+        "continue": data["metadata"].get("continue"),
     }
 
 
-def get_pod(namespace: str, name: str):
-    k8s = get_k8s_client()
-    v1 = k8s.CoreV1Api()
-    try:
-        p = v1.read_namespaced_pod(name=name, namespace=namespace)
+def get_pod(namespace: str, name: str, consistent: bool = CONSISTENT_DESC):
+    p = watch_cache.cached_get("pods", f"{namespace}/{name}", consistent)
+    if p is not None:
         return _pod(p)
-    except k8s.exceptions.ApiException as e:  # type: ignore[attr-defined]
+    v1 = core_v1()
+    try:
+        res = v1.read_namespaced_pod(
+            name=name,
+            namespace=namespace,
+            _request_timeout=KUBE_REQUEST_TIMEOUT,
+            _preload_content=False,
+        )
+        return _pod_raw(json_body(res))
+    except ApiException as e:
         if e.status == 404:
             raise HTTPException(status_code=404, detail="Pod not found") from e
         raise
 
 
-def get_pod_logs(
+def get_pod_usage(
+    namespace: str,
+    name: str,
+    window_seconds: WINDOW_SECONDS_DESC = 3600,
+    points: POINTS_DESC = 60,
+):
+    history = usage_history.collector.history("pods", f"{namespace}/{name}", window_seconds, points)
+    if history is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No usage samples yet (is metrics-server installed and the collector on?)",
+        )
+    return {"name": name, "namespace": namespace, **history}
+
+
+def open_pod_logs(
     namespace: str,
     name: str,
     container: str | None = None,
     tail_lines: TAIL_LINES_DESC = 500,
-    since_seconds: int | None = SINCE_SECONDS_DESC,
+    since_seconds: SINCE_SECONDS_DESC = None,
     previous: bool = PREVIOUS_DESC,
+    follow: bool = False,
+    limit_bytes: int = LOG_STREAM_MAX_BYTES,
 ):
     """
+    Open the kubelet log stream without buffering it (`_preload_content=False`).
+    The caller must close() the returned response.
+
     Security note: expose only if you intend to show logs in the UI.
     Consider RBAC/authorization at your API layer if needed.
     """
-    k8s = get_k8s_client()
-    v1 = k8s.CoreV1Api()
+    v1 = core_v1()
     try:
-        data = v1.read_namespaced_pod_log(
+        return v1.read_namespaced_pod_log(
             name=name,
             namespace=namespace,
             container=container,
             tail_lines=tail_lines,
             since_seconds=since_seconds,
             previous=previous,
+            follow=follow,
+            limit_bytes=limit_bytes,
             timestamps=True,
+            _preload_content=False,
+            # a followed stream may legitimately stay idle, so no read timeout then
+            _request_timeout=(KUBE_REQUEST_TIMEOUT, None if follow else KUBE_REQUEST_TIMEOUT),
         )
-        return {"container": container, "lines": data.splitlines()}
-    except k8s.exceptions.ApiException as e:  # type: ignore[attr-defined]
+    except ApiException as e:
         if e.status == 404:
             raise HTTPException(status_code=404, detail="Pod or container not found") from e
+        if e.status == 400:
+            # e.g. container name required for multi-container pods, or not started yet
+            raise HTTPException(status_code=400, detail=e.body or e.reason) from e
         raise
+
+
+def parse_log_line(raw: bytes) -> dict[str, str | None]:
+    """Split `<RFC3339 timestamp> <message>` as produced with timestamps=True."""
+    text = raw.decode("utf-8", errors="replace")
+    ts, sep, line = text.partition(" ")
+    if not sep or not ts[:4].isdigit():
+        return {"ts": None, "line": text}
+    return {"ts": ts, "line": line}
+
+
+def iter_log_batches(resp, max_bytes: int = LOG_STREAM_MAX_BYTES) -> Iterator[list[bytes]]:
+    """
+    Yield complete log lines, one batch per upstream read, holding at most one chunk
+    plus one partial line in memory. Stops once `max_bytes` have been read.
+    """
+    carry = b""
+    read = 0
+    for chunk in resp.stream(LOG_STREAM_CHUNK_BYTES):
+        read += len(chunk)
+        lines = (carry + chunk).split(b"\n")
+        carry = lines.pop()
+        if len(carry) > LOG_MAX_LINE_BYTES:
+            # pathological single line: flush what we have instead of growing the buffer
+            lines.append(carry)
+            carry = b""
+        if lines:
+            yield lines
+        if read >= max_bytes:
+            return
+    if carry:
+        yield [carry]
+
+
+def _ts_key(ts: str) -> str:
+    """RFC3339Nano drops trailing zeros; pad the fraction so keys compare as strings."""
+    head, _, frac = ts.rstrip("Z").partition(".")
+    return f"{head}.{frac.ljust(9, '0')}"
+
+
+_EOF = object()
+
+
+class MergedPodLogs:
+    """
+    K-way merge of several pods' log streams into one timestamp-ordered stream.
+
+    Each pod is read in its own pool thread (at most `max_concurrent` upstream
+    connections) into a shared bounded queue. A line is emitted once every pod still
+    streaming has buffered at least one line, which makes it the global minimum. When
+    following, a quiet pod would stall that forever, so lines older than the grace
+    window are released anyway; ordering is then only guaranteed within the window.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        pods: list[str],
+        *,
+        container: str | None = None,
+        tail_lines: int = 100,
+        since_seconds: int | None = None,
+        follow: bool = False,
+        limit_bytes: int = LOG_STREAM_MAX_BYTES,
+        max_concurrent: int = LOG_MERGE_MAX_CONCURRENT,
+        grace_seconds: float = LOG_MERGE_GRACE_SECONDS,
+    ):
+        self.namespace = namespace
+        self.pods = pods
+        self.container = container
+        self.tail_lines = tail_lines
+        self.since_seconds = since_seconds
+        self.follow = follow
+        # the byte budget is shared by all pods so the response stays bounded
+        self.pod_limit_bytes = max(limit_bytes // max(len(pods), 1), LOG_MAX_LINE_BYTES)
+        self.grace_seconds = grace_seconds
+        self._queue: queue.Queue[tuple[str, Any]] = queue.Queue(LOG_MERGE_QUEUE_SIZE)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._responses: set[Any] = set()
+        self._executor = ThreadPoolExecutor(max_concurrent, thread_name_prefix="pod-logs")
+
+    def start(self) -> "MergedPodLogs":
+        for pod in self.pods:
+            self._executor.submit(self._read, pod)
+        return self
+
+    def close(self) -> None:
+        self._stop.set()
+        with self._lock:
+            responses = list(self._responses)
+        for resp in responses:
+            # unblocks the reader thread sitting in a socket read
+            resp.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _put(self, pod: str, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put((pod, item), timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self, pod: str) -> None:
+        resp = None
+        try:
+            if self._stop.is_set():
+                return
+            resp = open_pod_logs(
+                self.namespace,
+                pod,
+                self.container,
+                self.tail_lines,
+                self.since_seconds,
+                False,
+                self.follow,
+                self.pod_limit_bytes,
+            )
+            with self._lock:
+                self._responses.add(resp)
+            for batch in iter_log_batches(resp, self.pod_limit_bytes):
+                if not self._put(pod, batch):
+                    return
+        except HTTPException as e:
+            self._put(pod, {"ts": None, "pod": pod, "error": str(e.detail)})
+        except Exception as e:
+            if not self._stop.is_set():
+                self._put(pod, {"ts": None, "pod": pod, "error": str(e)})
+        finally:
+            if resp is not None:
+                with self._lock:
+                    self._responses.discard(resp)
+                resp.close()
+                resp.release_conn()
+            self._put(pod, _EOF)
+
+    def __iter__(self) -> Iterator[list[dict[str, Any]]]:
+        heap: list[tuple[str, int, str, str | None, str, float]] = []
+        pending = dict.fromkeys(self.pods, 0)  # buffered lines per pod still streaming
+        last_key = dict.fromkeys(self.pods, "")
+        seq = itertools.count()
+
+        def absorb(pod: str, item: Any, out: list[dict[str, Any]]) -> None:
+            if item is _EOF:
+                pending.pop(pod, None)
+            elif isinstance(item, dict):
+                out.append(item)  # per-pod errors go out right away
+            else:
+                now = time.monotonic()
+                for raw in item:
+                    rec = parse_log_line(raw)
+                    # continuation lines without a timestamp stay behind their predecessor
+                    key = _ts_key(rec["ts"]) if rec["ts"] else last_key[pod]
+                    last_key[pod] = key
+                    heapq.heappush(heap, (key, next(seq), pod, rec["ts"], rec["line"], now))
+                    pending[pod] += 1
+
+        def ready(out: list[dict[str, Any]]) -> None:
+            now = time.monotonic()
+            while heap and len(out) < LOG_MERGE_BATCH:
+                key, _, pod, ts, line, arrived = heap[0]
+                complete = all(n > 0 for n in pending.values())
+                if not complete and not (self.follow and now - arrived >= self.grace_seconds):
+                    return
+                heapq.heappop(heap)
+                if pod in pending:
+                    pending[pod] -= 1
+                out.append({"ts": ts, "pod": pod, "line": line})
+
+        while not self._stop.is_set():
+            out: list[dict[str, Any]] = []
+            ready(out)
+            if out:
+                yield out
+                continue
+            if not pending and not heap:
+                return
+            timeout = 1.0
+            if self.follow and heap:
+                timeout = max(0.0, heap[0][5] + self.grace_seconds - time.monotonic())
+            try:
+                pod, item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            absorb(pod, item, out)
+            # take whatever else already arrived before deciding what can go out
+            for _ in range(LOG_MERGE_QUEUE_SIZE):
+                try:
+                    pod, item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                absorb(pod, item, out)
+            if out:
+                yield out
+
+
+def merged_pod_logs(
+    namespace: str,
+    label_selector: str,
+    container: str | None = None,
+    tail_lines: int = 100,
+    since_seconds: int | None = None,
+    follow: bool = False,
+    limit_bytes: int = LOG_STREAM_MAX_BYTES,
+) -> MergedPodLogs:
+    """Start reading logs of every pod matching `label_selector`; caller must close()."""
+    cached = watch_cache.cached_list(
+        "pods", namespace=namespace, label_selector=label_selector, limit=LOG_MERGE_MAX_PODS + 1
+    )
+    if cached is not None:
+        pods = cached[0]
+    else:
+        pods = (
+            core_v1()
+            .list_namespaced_pod(
+                namespace=namespace,
+                label_selector=label_selector,
+                limit=LOG_MERGE_MAX_PODS + 1,
+                _request_timeout=KUBE_REQUEST_TIMEOUT,
+            )
+            .items
+        )
+    names = sorted(p.metadata.name for p in pods)
+    if not names:
+        raise HTTPException(status_code=404, detail="No pods match the label selector")
+    if len(names) > LOG_MERGE_MAX_PODS:
+        raise HTTPException(
+            status_code=400, detail=f"Selector matches more than {LOG_MERGE_MAX_PODS} pods"
+        )
+    if follow and len(names) > LOG_MERGE_MAX_CONCURRENT:
+        # followed streams never end, so pods beyond the connection limit would never start
+        raise HTTPException(
+            status_code=400,
+            detail=f"Can follow at most {LOG_MERGE_MAX_CONCURRENT} pods; narrow the selector",
+        )
+    return MergedPodLogs(
+        namespace,
+        names,
+        container=container,
+        tail_lines=tail_lines,
+        since_seconds=since_seconds,
+        follow=follow,
+        limit_bytes=limit_bytes,
+    ).start()
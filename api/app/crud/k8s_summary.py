@@ -0,0 +1,132 @@
+import datetime
+import os
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterator
+from typing import Any
+
+from fastapi import Query
+from kubernetes.utils import parse_quantity
+
+from app.crud.k8s_nodes import _node_ready
+from app.infra import usage_history, watch_cache
+from app.infra.kube import KUBE_METRICS_TIMEOUT, KUBE_REQUEST_TIMEOUT, core_v1, custom_objects
+
+SUMMARY_TTL_SECONDS = float(os.getenv("SUMMARY_TTL_SECONDS", "10"))
+WARNING_WINDOW_SECONDS = 900
+
+CONSISTENT_DESC = Query(False)
+
+_lock = threading.Lock()
+_cached: tuple[float, dict[str, Any]] | None = None
+
+
+def _all(resource: str, list_method: str, consistent: bool, **kwargs) -> Iterator[Any]:
+    """Every object of `resource`: from the watch cache if synced, else paged live LISTs."""
+    cached = watch_cache.cached_list(resource, consistent, **kwargs)
+    if cached is not None:
+        yield from cached[0]
+        return
+    fn = getattr(core_v1(), list_method)
+    token = None
+    while True:
+        res = fn(
+            limit=watch_cache.KUBE_LIST_PAGE_SIZE,
+            _continue=token,
+            _request_timeout=KUBE_REQUEST_TIMEOUT,
+            **kwargs,
+        )
+        yield from res.items
+        token = res.metadata._continue
+        if not token:
+            return
+
+
+def _event_time(e) -> datetime.datetime | None:
+    return e.last_timestamp or getattr(e, "event_time", None) or e.first_timestamp
+
+
+def _node_usage() -> dict[str, dict[str, Any]] | None:
+    latest = usage_history.fresh_latest("nodes")
+    if latest is not None:
+        return latest
+    try:
+        m = custom_objects().list_cluster_custom_object(
+            "metrics.k8s.io", "v1beta1", "nodes", _request_timeout=KUBE_METRICS_TIMEOUT
+        )
+    except Exception:
+        # metrics-server not installed or RBAC missing
+        return None
+    return {i["metadata"]["name"]: i["usage"] for i in m.get("items", [])}
+
+
+def _compute(consistent: bool) -> dict[str, Any]:
+    namespaces = sum(1 for _ in _all("namespaces", "list_namespace", consistent))
+
+    phases: Counter[str] = Counter()
+    for p in _all("pods", "list_pod_for_all_namespaces", consistent):
+        phases[p.status.phase or "Unknown"] += 1
+
+    usage = _node_usage()
+    ready = not_ready = 0
+    cpu = {"allocatable": 0.0, "usage": 0.0 if usage is not None else None}
+    memory = {"allocatable": 0, "usage": 0 if usage is not None else None}
+    for n in _all("nodes", "list_node", consistent):
+        if _node_ready(n.status.conditions):
+            ready += 1
+        else:
+            not_ready += 1
+        alloc = n.status.allocatable or {}
+        cpu["allocatable"] += float(parse_quantity(alloc.get("cpu", "0")))
+        memory["allocatable"] += int(parse_quantity(alloc.get("memory", "0")))
+        if usage is not None and n.metadata.name in usage:
+            u = usage[n.metadata.name]
+            cpu["usage"] += float(parse_quantity(u.get("cpu", "0")))
+            memory["usage"] += int(parse_quantity(u.get("memory", "0")))
+
+    cutoff = datetime.datetime.now(datetime.UTC) - datetime.timedelta(
+        seconds=WARNING_WINDOW_SECONDS
+    )
+    reasons: Counter[str] = Counter()
+    events = _all(
+        "events", "list_event_for_all_namespaces", consistent, field_selector="type=Warning"
+    )
+    for e in events:
+        t = _event_time(e)
+        if t and t >= cutoff:
+            reasons[e.reason or "Unknown"] += 1
+
+    return {
+        "namespaces": namespaces,
+        "pods": {"total": sum(phases.values()), "by_phase": dict(phases)},
+        "nodes": {"total": ready + not_ready, "ready": ready, "not_ready": not_ready},
+        "cpu": cpu,  # cores
+        "memory": memory,  # bytes
+        "warnings": {
+            "window_seconds": WARNING_WINDOW_SECONDS,
+            "total": sum(reasons.values()),
+            "top_reasons": dict(reasons.most_common(5)),
+        },
+        "generated_at": datetime.datetime.now(datetime.UTC),
+    }
+
+
+def get_summary(consistent: bool = CONSISTENT_DESC) -> dict[str, Any]:
+    """
+    Cluster KPIs for the dashboard in one pass, cached for SUMMARY_TTL_SECONDS.
+    Concurrent requests on an expired cache share one recomputation through the
+    route's run_shared; `_lock` only guards swapping the snapshot, never a kube call,
+    so a computation abandoned by a timeout cannot hold up later requests.
+    """
+    global _cached
+    cached = _cached
+    if not consistent and cached and time.monotonic() - cached[0] < SUMMARY_TTL_SECONDS:
+        return cached[1]
+    started = time.monotonic()
+    summary = _compute(consistent)
+    with _lock:
+        # a slow computation finishing late must not replace a newer snapshot
+        if _cached is None or _cached[0] < started:
+            _cached = (started, summary)
+    return summary
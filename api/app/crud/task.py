@@ -1,37 +1,264 @@
-from typing import Annotated, TypeAlias
-from uuid import UUID
+import base64
+import binascii
+import json
+from datetime import UTC, datetime, timedelta
+from typing import Annotated, Literal, TypeAlias
+from uuid import UUID, uuid4
 
-from fastapi import Depends
-from opsbox_common.database import get_db
-from opsbox_common.models import Task, TaskStatus
-from sqlalchemy.orm import Session
+from fastapi import Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from opsbox_common import task_stats
+from opsbox_common.database import get_async_db
+from opsbox_common.models import Task, TaskRunKey, TaskStatus
+from sqlalchemy import and_, case, func, insert, literal, or_, select, tuple_, update as update_stmt
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.run_queue import enqueue_run_task
-from app.schemas import TaskCreate, TaskUpdate
+from app.infra import task_cache
+from app.run_queue import enqueue_run_task, enqueue_run_tasks
+from app.schemas import TaskCreate, TaskOut, TaskUpdate
 
-DBSession: TypeAlias = Annotated[Session, Depends(get_db)]
+DBSession: TypeAlias = Annotated[AsyncSession, Depends(get_async_db)]
 
+RUN_BLOCKING_STATUSES = {
+    TaskStatus.PENDING,  # claimed by POST /tasks/{id}/run
+    TaskStatus.RUNNING,
+    TaskStatus.SUCCEEDED,
+    TaskStatus.FAILED,
+}
 
-def create(db: DBSession, payload: TaskCreate) -> Task:
+TaskSort: TypeAlias = Literal["created_at", "updated_at"]
+SortOrder: TypeAlias = Literal["asc", "desc"]
+
+# a shorter search has no full trigram to look up, so it only matches title prefixes
+SEARCH_SUBSTRING_MIN = 3
+
+
+async def _record(db: DBSession, stmts: list) -> None:
+    # task_stats counters, in the transaction of the change they count
+    for stmt in stmts:
+        await db.execute(stmt)
+
+
+def _dialect(db: DBSession) -> str:
+    return db.get_bind().dialect.name
+
+
+async def create(db: DBSession, payload: TaskCreate) -> Task:
     task = Task(**payload.dict(), status=TaskStatus.NEW)
     db.add(task)
-    db.commit()
-    db.refresh(task)
+    await _record(db, task_stats.transition(_dialect(db), None, TaskStatus.NEW))
+    await db.commit()
+    await db.refresh(task)
+    await task_cache.invalidate()
     return task
 
 
-def list_tasks(db: DBSession) -> list[Task]:
-    return db.query(Task).all()
+async def create_many(db: DBSession, payloads: list[TaskCreate]) -> list[UUID]:
+    """
+    Insert every task in one executemany INSERT ... RETURNING (batched into multi-row
+    statements by SQLAlchemy) and a single commit, instead of a commit + refresh each.
+    """
+    rows = [{**p.model_dump(), "status": TaskStatus.NEW} for p in payloads]
+    stmt = insert(Task).returning(Task.id, sort_by_parameter_order=True)
+    ids = list(await db.scalars(stmt, rows))
+    await _record(db, task_stats.count_changes(_dialect(db), {TaskStatus.NEW: len(ids)}))
+    await db.commit()
+    await task_cache.invalidate()
+    return ids
+
+
+def _naive_utc(t: datetime | None) -> datetime | None:
+    # timestamps are stored as naive UTC (datetime.utcnow)
+    if t is None or t.tzinfo is None:
+        return t
+    return t.astimezone(UTC).replace(tzinfo=None)
+
+
+def encode_cursor(task: Task, sort: TaskSort, order: SortOrder) -> str:
+    raw = json.dumps(
+        {"sort": sort, "order": order, "at": getattr(task, sort).isoformat(), "id": str(task.id)}
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: TaskSort, order: SortOrder) -> tuple[datetime, UUID]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor))
+        at, task_id = datetime.fromisoformat(data["at"]), UUID(data["id"])
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail="Malformed cursor") from e
+    if (data.get("sort"), data.get("order")) != (sort, order):
+        raise HTTPException(status_code=400, detail="Cursor was issued for another ordering")
+    return at, task_id
+
+
+def _like_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _search(db: DBSession, text: str):
+    """
+    The filter for `text` and the (tier, closeness) ranking of its matches: exact
+    titles first, then prefixes, then other substrings (case-insensitive); within a
+    tier the most similar titles by trigram similarity on Postgres, where the
+    ix_tasks_title_trgm index serves the ILIKE, and the shortest ones elsewhere.
+    """
+    escaped = _like_escape(text)
+    prefix = Task.title.ilike(f"{escaped}%", escape="\\")
+    if len(text) >= SEARCH_SUBSTRING_MIN:
+        match = Task.title.ilike(f"%{escaped}%", escape="\\")
+    else:
+        match = prefix
+    tier = case(
+        (func.lower(Task.title) == text.lower(), literal(0)),
+        (prefix, literal(1)),
+        else_=literal(2),
+    )
+    if _dialect(db) == "postgresql":
+        closeness = func.similarity(Task.title, text)
+    else:
+        closeness = -func.length(Task.title)
+    return match, tier, closeness
+
+
+def encode_search_cursor(text: str, tier: int, closeness: float, task_id: UUID) -> str:
+    raw = json.dumps({"q": text, "tier": tier, "closeness": closeness, "id": str(task_id)})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_search_cursor(cursor: str, text: str) -> tuple[int, float, UUID]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor))
+        after = int(data["tier"]), float(data["closeness"]), UUID(data["id"])
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail="Malformed cursor") from e
+    if data.get("q") != text:
+        raise HTTPException(status_code=400, detail="Cursor was issued for another search")
+    return after
+
+
+async def _search_tasks(
+    db: DBSession, q, text: str, limit: int, cursor: str | None
+) -> tuple[list[Task], str | None]:
+    """The page of `q` (already filtered) matching `text`, in keyset order on the rank."""
+    match, tier, closeness = _search(db, text)
+    q = q.add_columns(tier, closeness).where(match)
+    if cursor:
+        t, c, task_id = decode_search_cursor(cursor, text)
+        q = q.where(
+            or_(
+                tier > t,
+                and_(tier == t, or_(closeness < c, and_(closeness == c, Task.id > task_id))),
+            )
+        )
+    q = q.order_by(tier.asc(), closeness.desc(), Task.id.asc())
+
+    rows = (await db.execute(q.limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        task, t, c = rows[limit - 1]
+        next_cursor = encode_search_cursor(text, t, c, task.id)
+    return [row[0] for row in rows[:limit]], next_cursor
+
+
+async def list_tasks(
+    db: DBSession,
+    limit: int = 100,
+    cursor: str | None = None,
+    status: list[TaskStatus] | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    sort: TaskSort = "created_at",
+    order: SortOrder = "desc",
+    search: str | None = None,
+) -> tuple[list[Task], str | None]:
+    """
+    One page of tasks in keyset order on (sort column, id), so any page costs an index
+    range scan of `limit` rows however deep it is, plus the cursor of the next page.
+    With `search`, only tasks whose title matches it, best matches first (sort and
+    order do not apply).
+    """
+    q = select(Task)
+    if status:
+        q = q.where(Task.status.in_(status))
+    if created_after is not None:
+        q = q.where(Task.created_at >= _naive_utc(created_after))
+    if created_before is not None:
+        q = q.where(Task.created_at < _naive_utc(created_before))
+    if search:
+        return await _search_tasks(db, q, search, limit, cursor)
 
+    key = tuple_(getattr(Task, sort), Task.id)
+    if cursor:
+        after = decode_cursor(cursor, sort, order)
+        q = q.where(key < after if order == "desc" else key > after)
+    if order == "desc":
+        q = q.order_by(getattr(Task, sort).desc(), Task.id.desc())
+    else:
+        q = q.order_by(getattr(Task, sort).asc(), Task.id.asc())
 
-def get_task(db: DBSession, task_id: UUID) -> Task | None:
-    return db.get(Task, task_id)
+    tasks = list(await db.scalars(q.limit(limit + 1)))
+    next_cursor = encode_cursor(tasks[limit - 1], sort, order) if len(tasks) > limit else None
+    return tasks[:limit], next_cursor
 
 
-def update(db: DBSession, task_id: UUID, task_update: TaskUpdate) -> Task | None:
-    task = get_task(db, task_id)
+async def get_task(db: DBSession, task_id: UUID) -> Task | None:
+    return await db.get(Task, task_id)
+
+
+def _out(task: Task) -> dict:
+    return TaskOut.model_validate(task).model_dump(mode="json")
+
+
+async def get_task_cached(db: DBSession, task_id: UUID) -> dict | None:
+    """get_task as a TaskOut dict, read through the task cache."""
+
+    async def load() -> dict | None:
+        task = await get_task(db, task_id)
+        return _out(task) if task else None
+
+    return await task_cache.cached_task(task_id, load)
+
+
+async def list_tasks_cached(
+    db: DBSession,
+    limit: int = 100,
+    cursor: str | None = None,
+    status: list[TaskStatus] | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    sort: TaskSort = "created_at",
+    order: SortOrder = "desc",
+    search: str | None = None,
+) -> dict:
+    """list_tasks as a TaskPage dict, read through the task cache."""
+    args = (limit, cursor, status, created_after, created_before, sort, order, search)
+
+    async def load() -> dict:
+        tasks, next_cursor = await list_tasks(db, *args)
+        return {"items": [_out(t) for t in tasks], "next_cursor": next_cursor}
+
+    return await task_cache.cached_page(
+        {
+            "limit": limit,
+            "cursor": cursor,
+            "status": sorted(s.value for s in status or ()),
+            "created_after": created_after,
+            "created_before": created_before,
+            "sort": sort,
+            "order": order,
+            "q": search,
+        },
+        load,
+    )
+
+
+async def update(db: DBSession, task_id: UUID, task_update: TaskUpdate) -> Task | None:
+    task = await get_task(db, task_id)
     if not task:
         return None
+    before = task.status
     if task_update.title is not None:
         task.title = task_update.title
     if task_update.status is not None:
@@ -39,27 +266,154 @@ def update(db: DBSession, task_id: UUID, task_update: TaskUpdate) -> Task | None
     if task_update.result is not None:
         task.result = task_update.result
     db.add(task)
-    db.commit()
-    db.refresh(task)
+    now = datetime.utcnow()
+    await _record(
+        db, task_stats.transition(_dialect(db), before, task.status, task.created_at, now)
+    )
+    await db.commit()
+    await db.refresh(task)
+    await task_cache.invalidate([task_id])
     return task
 
 
-def delete(db: DBSession, task_id: UUID) -> bool:
-    task = get_task(db, task_id)
+async def delete(db: DBSession, task_id: UUID) -> bool:
+    task = await get_task(db, task_id)
     if not task:
         return False
-    db.delete(task)
-    db.commit()
+    await db.delete(task)
+    await _record(db, task_stats.removed(_dialect(db), [task.status]))
+    await db.commit()
+    await task_cache.invalidate([task_id])
     return True
 
 
-def run_task(db: DBSession, task_id: UUID) -> dict:
+async def _replay(db: DBSession, idempotency_key: str, task_id: UUID) -> dict | None:
+    """The response of the run that already used this key, if any."""
+    used = await db.get(TaskRunKey, idempotency_key)
+    if used is None:
+        return None
+    if used.task_id != task_id:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was used for another task")
+    return {"job_id": used.job_id, "task_id": used.task_id}
+
+
+async def _release(db: DBSession, task_ids: list[UUID], idempotency_key: str | None = None) -> None:
+    """Undo claims whose jobs could not be enqueued, so the tasks can be run again."""
+    release = (
+        update_stmt(Task)
+        .where(Task.id.in_(task_ids), Task.status == TaskStatus.PENDING)
+        .values(status=TaskStatus.NEW, updated_at=datetime.utcnow())
+        .returning(Task.id)
+    )
+    released = len((await db.execute(release)).all())
+    deltas = {TaskStatus.PENDING: -released, TaskStatus.NEW: released}
+    await _record(db, task_stats.count_changes(_dialect(db), deltas))
+    if idempotency_key:
+        used = await db.get(TaskRunKey, idempotency_key)
+        if used is not None:
+            await db.delete(used)
+    await db.commit()
+    await task_cache.invalidate(task_ids)
+
+
+async def run_task(db: DBSession, task_id: UUID, idempotency_key: str | None = None) -> dict:
+    """
+    Claim the task with one conditional UPDATE (NEW -> PENDING) and enqueue it only if
+    that matched, so concurrent calls cannot start it twice. A retry carrying the same
+    Idempotency-Key gets the first response back instead of a 409.
+    """
     # TODO: check worker status, if not running raise error
-    task = get_task(db, task_id)
-    if not task:
-        raise ValueError(404, "Task not found")
-    if task.status in {TaskStatus.RUNNING, TaskStatus.SUCCEEDED, TaskStatus.FAILED}:
-        raise ValueError(409, f"Task already {task.status}")
+    if idempotency_key and (replay := await _replay(db, idempotency_key, task_id)):
+        return replay
+
+    # the job id is chosen here so the key's row can be written with the claim
+    job_id = str(uuid4())
+    claim = (
+        update_stmt(Task)
+        .where(Task.id == task_id, Task.status == TaskStatus.NEW)
+        .values(status=TaskStatus.PENDING, updated_at=datetime.utcnow())
+        .returning(Task.id)
+    )
+    if (await db.execute(claim)).first() is None:
+        await db.rollback()
+        # a concurrent retry of this very request may have won the claim
+        if idempotency_key and (replay := await _replay(db, idempotency_key, task_id)):
+            return replay
+        current = await db.scalar(select(Task.status).where(Task.id == task_id))
+        if current is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        raise HTTPException(status_code=409, detail=f"Task already {current.value}")
+
+    await _record(db, task_stats.transition(_dialect(db), TaskStatus.NEW, TaskStatus.PENDING))
+    if idempotency_key:
+        db.add(TaskRunKey(key=idempotency_key, task_id=task_id, job_id=job_id))
+    try:
+        await db.commit()
+    except IntegrityError as e:  # the key was just taken by a run of another task
+        await db.rollback()
+        raise HTTPException(
+            status_code=422, detail="Idempotency-Key was used for another task"
+        ) from e
+    await task_cache.invalidate([task_id])
 
-    job_id = enqueue_run_task(task_id)
+    # the celery client is blocking; keep it off the event loop
+    try:
+        await run_in_threadpool(enqueue_run_task, task_id, job_id)
+    except Exception as e:
+        await _release(db, [task_id], idempotency_key)
+        raise HTTPException(status_code=503, detail="Could not enqueue the task") from e
     return {"job_id": job_id, "task_id": task_id}
+
+
+async def run_many(db: DBSession, task_ids: list[UUID]) -> list[dict]:
+    """
+    Claim every task in one conditional UPDATE (NEW -> PENDING), then enqueue them all in
+    one go. All or nothing: unless every task was claimed, nothing is and unknown ids
+    give 404, tasks already claimed, started or finished 409.
+    """
+    task_ids = list(dict.fromkeys(task_ids))
+    claim = (
+        update_stmt(Task)
+        .where(Task.id.in_(task_ids), Task.status == TaskStatus.NEW)
+        .values(status=TaskStatus.PENDING, updated_at=datetime.utcnow())
+        .returning(Task.id)
+    )
+    claimed = len((await db.execute(claim)).all())
+    if claimed < len(task_ids):
+        await db.rollback()
+        rows = await db.execute(select(Task.id, Task.status).where(Task.id.in_(task_ids)))
+        found = dict(rows.all())
+        missing = [str(i) for i in task_ids if i not in found]
+        if missing:
+            raise HTTPException(
+                status_code=404, detail={"message": "Tasks not found", "ids": missing}
+            )
+        blocked = {str(i): found[i].value for i in task_ids if found[i] in RUN_BLOCKING_STATUSES}
+        raise HTTPException(
+            status_code=409, detail={"message": "Tasks already started", "tasks": blocked}
+        )
+
+    deltas = {TaskStatus.NEW: -claimed, TaskStatus.PENDING: claimed}
+    await _record(db, task_stats.count_changes(_dialect(db), deltas))
+    await db.commit()
+    await task_cache.invalidate(task_ids)
+
+    try:
+        job_ids = await run_in_threadpool(enqueue_run_tasks, task_ids)
+    except Exception as e:
+        await _release(db, task_ids)
+        raise HTTPException(status_code=503, detail="Could not enqueue the tasks") from e
+    return [
+        {"task_id": task_id, "job_id": job_id}
+        for task_id, job_id in zip(task_ids, job_ids, strict=True)
+    ]
+
+
+async def stats(db: DBSession, window_minutes: int) -> dict:
+    """Counts by status plus throughput and durations of the last `window_minutes`."""
+    since = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(
+        minutes=window_minutes - 1
+    )
+    counts = (await db.execute(task_stats.COUNTS)).all()
+    window = (await db.execute(task_stats.window_query(since))).all()
+    return task_stats.summarize(counts, window, window_minutes)
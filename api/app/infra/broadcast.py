@@ -0,0 +1,217 @@
+"""Fan one upstream producer per key out to many asyncio subscribers.
+
+Producers are blocking (kube watch, DB listener) so each runs in a daemon thread and
+hands pre-encoded JSON strings to the subscribers' bounded queues on the event loop.
+The producer starts with the first subscriber of a key and stops after the last one
+leaves. A subscriber whose queue fills up is dropped rather than slowing everyone
+else down or growing memory without bound.
+"""
+
+import asyncio
+import contextlib
+import os
+import threading
+from collections.abc import AsyncIterator, Awaitable, Callable, Hashable
+from typing import Any
+
+import anyio
+from fastapi import WebSocket
+from opsbox_common.libs.loggin import get_logger
+from prometheus_client import Counter, Gauge
+
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "256"))  # per-client pending messages
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+
+SLOW_CONSUMER = "__slow_consumer__"
+
+log = get_logger(__name__)
+
+# Define metrics
+SUBSCRIBERS = Gauge("stream_subscribers", "Connected stream subscribers", ["stream"])
+UPSTREAMS = Gauge("stream_upstreams", "Running upstream producers", ["stream"])
+DROPPED = Counter("stream_slow_consumers_total", "Subscribers dropped as too slow", ["stream"])
+
+# producer(key, publish, stop) runs until `stop` is set; `publish` takes a JSON string
+# and, optionally, attributes of it that subscribers' `match` filters look at
+Producer = Callable[[Hashable, Callable[..., None], threading.Event], None]
+Match = Callable[[Any], bool]
+# messages sent to a subscriber first, once subscribed (e.g. the current state)
+Initial = Callable[[], Awaitable[list[str]]]
+
+
+class Subscriber:
+    def __init__(self, stream: str, maxsize: int, match: Match | None = None):
+        self.stream = stream
+        self.match = match
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize)
+        self.dropped = False
+
+    def offer(self, item: str) -> None:
+        """Enqueue without blocking; runs on the subscriber's event loop."""
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped = True
+            DROPPED.labels(self.stream).inc()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(SLOW_CONSUMER)
+
+    async def next_batch(self, max_items: int = 100) -> list[str]:
+        """Wait for one message, then take whatever else is already queued."""
+        batch = [await self.queue.get()]
+        while len(batch) < max_items and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+
+class _Topic:
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.subscribers: set[Subscriber] = set()
+        self.stop = threading.Event()
+        self.thread: threading.Thread | None = None
+
+
+class Broadcaster:
+    def __init__(self, name: str, producer: Producer, queue_size: int = STREAM_QUEUE_SIZE):
+        self.name = name
+        self.producer = producer
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._topics: dict[Hashable, _Topic] = {}
+
+    @contextlib.asynccontextmanager
+    async def subscribe(
+        self, key: Hashable, match: Match | None = None
+    ) -> AsyncIterator[Subscriber]:
+        sub = Subscriber(self.name, self.queue_size, match)
+        self._add(key, sub)
+        try:
+            yield sub
+        finally:
+            self._remove(key, sub)
+
+    def topics(self) -> dict[Hashable, int]:
+        with self._lock:
+            return {key: len(t.subscribers) for key, t in self._topics.items()}
+
+    def _add(self, key: Hashable, sub: Subscriber) -> None:
+        with self._lock:
+            topic = self._topics.get(key)
+            if topic is None:
+                topic = self._topics[key] = _Topic(key)
+            topic.subscribers.add(sub)
+            topic.stop.clear()
+            if topic.thread is None:
+                topic.thread = threading.Thread(
+                    target=self._run, args=(topic,), name=f"{self.name}-stream", daemon=True
+                )
+                topic.thread.start()
+                UPSTREAMS.labels(self.name).inc()
+        SUBSCRIBERS.labels(self.name).inc()
+
+    def _remove(self, key: Hashable, sub: Subscriber) -> None:
+        with self._lock:
+            topic = self._topics.get(key)
+            if topic is not None:
+                topic.subscribers.discard(sub)
+                if not topic.subscribers:
+                    topic.stop.set()
+        SUBSCRIBERS.labels(self.name).dec()
+
+    def _publish(self, topic: _Topic, item: str, attrs: Any = None) -> None:
+        with self._lock:
+            subs = list(topic.subscribers)
+        for sub in subs:
+            if sub.match is not None and not sub.match(attrs):
+                continue
+            with contextlib.suppress(RuntimeError):  # loop already closed
+                sub.loop.call_soon_threadsafe(sub.offer, item)
+
+    def _run(self, topic: _Topic) -> None:
+        backoff = 1.0
+        while True:
+            failed = False
+            try:
+                self.producer(topic.key, lambda *item: self._publish(topic, *item), topic.stop)
+            except Exception:
+                failed = True
+                log.exception("%s stream producer for %s failed", self.name, topic.key)
+            with self._lock:
+                if topic.stop.is_set() or not topic.subscribers:
+                    topic.thread = None
+                    if not topic.subscribers:
+                        self._topics.pop(topic.key, None)
+                    UPSTREAMS.labels(self.name).dec()
+                    return
+            if failed:
+                topic.stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+            else:
+                backoff = 1.0
+
+
+def _frame(batch: list[str]) -> str:
+    return batch[0] if len(batch) == 1 else "[" + ",".join(batch) + "]"
+
+
+async def serve_websocket(
+    websocket: WebSocket,
+    broadcaster: Broadcaster,
+    key: Hashable,
+    match: Match | None = None,
+    initial: Initial | None = None,
+) -> None:
+    """Pump a subscription into an accepted WebSocket until either side goes away."""
+    async with broadcaster.subscribe(key, match) as sub, anyio.create_task_group() as tg:
+
+        async def send() -> None:
+            if initial is not None:
+                for item in await initial():
+                    await websocket.send_text(item)
+            while True:
+                batch = await sub.next_batch()
+                if SLOW_CONSUMER in batch:
+                    await websocket.close(code=1013, reason="slow consumer")
+                    break
+                await websocket.send_text(_frame(batch))
+            tg.cancel_scope.cancel()
+
+        async def receive() -> None:
+            # client pings and other frames are ignored; we only care about disconnects
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+            tg.cancel_scope.cancel()
+
+        tg.start_soon(send)
+        tg.start_soon(receive)
+
+
+async def sse_stream(
+    broadcaster: Broadcaster,
+    key: Hashable,
+    match: Match | None = None,
+    initial: Initial | None = None,
+) -> AsyncIterator[str]:
+    """Server-Sent Events body for a subscription, with comment heartbeats."""
+    async with broadcaster.subscribe(key, match) as sub:
+        yield ": connected\n\n"
+        if initial is not None:
+            for item in await initial():
+                yield f"data: {item}\n\n"
+        while True:
+            try:
+                batch = await asyncio.wait_for(sub.next_batch(), STREAM_HEARTBEAT_SECONDS)
+            except TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if SLOW_CONSUMER in batch:
+                yield "event: error\ndata: slow consumer\n\n"
+                return
+            yield f"data: {_frame(batch)}\n\n"
@@ -0,0 +1,92 @@
+"""Conditional GETs for the kubectl reads.
+
+Responses carry a weak ETag hashed from the encoded body and `Cache-Control: no-cache`,
+so browsers revalidate every poll with If-None-Match on their own and an unchanged
+list costs a bodiless 304. Lists served from the watch cache also report the cache's
+resourceVersion in X-Resource-Version, the starting point for since_resource_version
+delta reads; it is kept out of the body so it does not change the ETag.
+"""
+
+import hashlib
+from collections.abc import Callable
+from typing import Any
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
+from prometheus_client import Counter
+
+from app.infra import watch_cache
+
+RESOURCE_VERSION_HEADER = "X-Resource-Version"
+
+# Define metrics
+CONDITIONAL = Counter(
+    "kube_conditional_responses_total", "kubectl reads by conditional outcome", ["result"]
+)
+
+
+def etag(body: bytes) -> str:
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def matches(if_none_match: str | None, tag: str) -> bool:
+    """If-None-Match uses weak comparison: W/ prefixes are ignored."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = tag.removeprefix("W/")
+    return any(t.strip().removeprefix("W/") == opaque for t in if_none_match.split(","))
+
+
+def conditional_response(request: Request, content: dict[str, Any]) -> Response:
+    """ORJSONResponse with an ETag, or a 304 if the client already holds this body."""
+    headers = {"Cache-Control": "no-cache"}
+    if "resource_version" in content:
+        if content["resource_version"]:
+            headers[RESOURCE_VERSION_HEADER] = content["resource_version"]
+        # the dict may be shared with coalesced requests, so it is copied, not popped
+        content = {k: v for k, v in content.items() if k != "resource_version"}
+    response = ORJSONResponse(content, headers=headers)
+    tag = etag(response.body)
+    headers["ETag"] = tag
+    if matches(request.headers.get("if-none-match"), tag):
+        CONDITIONAL.labels("not_modified").inc()
+        return Response(status_code=304, headers=headers)
+    CONDITIONAL.labels("modified").inc()
+    response.headers["ETag"] = tag
+    return response
+
+
+def delta_list(
+    resource: str,
+    since_resource_version: str,
+    to_dict: Callable[[Any], dict[str, Any]],
+    *,
+    namespaces: list[str] | None = None,
+    label_selector: str | None = None,
+    field_selector: str | None = None,
+) -> dict[str, Any]:
+    """
+    List body holding only what changed since `since_resource_version`: added/modified
+    items (upsert them by namespace/name) and "deleted" references. 410 Gone, as the
+    apiserver does for an expired resourceVersion, when the client must list again.
+    """
+    delta = watch_cache.cached_delta(
+        resource,
+        since_resource_version,
+        namespaces=namespaces,
+        label_selector=label_selector,
+        field_selector=field_selector,
+    )
+    if delta is None:
+        raise HTTPException(
+            status_code=410, detail="resourceVersion too old or not in the cache; list again"
+        )
+    changed, deleted, resource_version = delta
+    return {
+        "items": [to_dict(o) for o in changed],
+        "deleted": [{"namespace": o.metadata.namespace, "name": o.metadata.name} for o in deleted],
+        "continue": None,
+        "resource_version": resource_version,
+    }
@@ -0,0 +1,280 @@
+"""Persist Kubernetes events to Postgres so they outlive the apiserver's ~1h event TTL.
+
+The archiver listens to the events informer of the watch cache (one cluster-wide
+WATCH, shared with the /kubectl reads) and hands every ADDED/MODIFIED event to a
+writer thread, which upserts them by uid in batches: a repeated event only bumps
+`count`/`last_timestamp` of its row. Time-window queries on /kubectl/events are then
+answered from the `k8s_events` table, indexed by time, namespace and reason.
+"""
+
+import base64
+import binascii
+import datetime
+import os
+import queue
+import threading
+import time
+from typing import Any
+
+from fastapi import HTTPException
+from opsbox_common import database
+from opsbox_common.libs.loggin import get_logger
+from opsbox_common.models import K8sEvent
+from prometheus_client import Counter, Gauge
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.infra import watch_cache
+
+EVENT_ARCHIVE = os.getenv("EVENT_ARCHIVE", "1") == "1"
+EVENT_ARCHIVE_BATCH = int(os.getenv("EVENT_ARCHIVE_BATCH", "500"))
+EVENT_ARCHIVE_FLUSH_SECONDS = float(os.getenv("EVENT_ARCHIVE_FLUSH_SECONDS", "2"))
+EVENT_ARCHIVE_QUEUE_SIZE = int(os.getenv("EVENT_ARCHIVE_QUEUE_SIZE", "10000"))
+EVENT_ARCHIVE_RETENTION_DAYS = int(os.getenv("EVENT_ARCHIVE_RETENTION_DAYS", "30"))
+
+CONTINUE_PREFIX = "archive:"
+PRUNE_INTERVAL_SECONDS = 3600
+
+log = get_logger(__name__)
+
+# Define metrics
+ARCHIVED = Counter("event_archive_upserts_total", "Events upserted into the archive")
+DROPPED = Counter("event_archive_dropped_total", "Events dropped because the queue was full")
+PRUNED = Counter("event_archive_pruned_total", "Archived events deleted by retention")
+BACKLOG = Gauge("event_archive_queue_depth", "Events waiting to be written")
+
+# field selector path -> column, for the selectors the archive can evaluate
+FIELD_COLUMNS = {
+    "metadata.name": K8sEvent.name,
+    "metadata.namespace": K8sEvent.namespace,
+    "type": K8sEvent.type,
+    "reason": K8sEvent.reason,
+    "involvedObject.kind": K8sEvent.involved_kind,
+    "involvedObject.name": K8sEvent.involved_name,
+    "involvedObject.namespace": K8sEvent.involved_namespace,
+    "involvedObject.uid": K8sEvent.involved_uid,
+    "involvedObject.fieldPath": K8sEvent.involved_field_path,
+    "source": K8sEvent.source_component,
+}
+
+# columns refreshed when an event we already hold is seen again
+UPDATE_COLUMNS = (
+    "type",
+    "reason",
+    "message",
+    "count",
+    "last_timestamp",
+    "event_time",
+    "last_seen",
+    "source_component",
+    "source_host",
+    "reporting_controller",
+    "reporting_instance",
+)
+
+
+def utc(t: datetime.datetime | None) -> datetime.datetime | None:
+    """Timestamps are stored in UTC; SQLite hands them back naive."""
+    if t is None:
+        return None
+    return t.replace(tzinfo=datetime.UTC) if t.tzinfo is None else t.astimezone(datetime.UTC)
+
+
+def event_row(e) -> dict[str, Any]:
+    """Column values for a V1Event."""
+    source = e.source
+    involved = e.involved_object
+    last_seen = e.last_timestamp or e.event_time or e.first_timestamp
+    return {
+        "uid": e.metadata.uid,
+        "namespace": e.metadata.namespace,
+        "name": e.metadata.name,
+        "type": e.type,
+        "reason": e.reason,
+        "message": e.message,
+        "count": e.count,
+        "first_timestamp": utc(e.first_timestamp),
+        "last_timestamp": utc(e.last_timestamp),
+        "event_time": utc(e.event_time),
+        "last_seen": utc(last_seen) or datetime.datetime.now(datetime.UTC),
+        "involved_kind": involved.kind,
+        "involved_name": involved.name,
+        "involved_namespace": involved.namespace,
+        "involved_uid": involved.uid,
+        "involved_field_path": involved.field_path,
+        "source_component": getattr(source, "component", None),
+        "source_host": getattr(source, "host", None),
+        "reporting_controller": e.reporting_component or None,
+        "reporting_instance": e.reporting_instance,
+    }
+
+
+def upsert(session, rows: list[dict[str, Any]]) -> None:
+    """Insert rows, or refresh the existing row of the same uid unless it is newer."""
+    insert = pg_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(K8sEvent).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[K8sEvent.uid],
+        set_={c: stmt.excluded[c] for c in UPDATE_COLUMNS},
+        where=K8sEvent.last_seen <= stmt.excluded.last_seen,
+    )
+    session.execute(stmt)
+
+
+class EventArchiver:
+    def __init__(
+        self,
+        batch: int = EVENT_ARCHIVE_BATCH,
+        flush_seconds: float = EVENT_ARCHIVE_FLUSH_SECONDS,
+        retention_days: int = EVENT_ARCHIVE_RETENTION_DAYS,
+    ):
+        self.batch = batch
+        self.flush_seconds = flush_seconds
+        self.retention_days = retention_days
+        self._queue: queue.Queue[dict[str, Any]] = queue.Queue(EVENT_ARCHIVE_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # ---------- lifecycle ----------
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                informer = watch_cache.INFORMERS["events"]
+                informer.add_listener(self.offer)
+                # started directly: archiving does not depend on KUBE_WATCH_CACHE reads
+                informer.start()
+                self._thread = threading.Thread(
+                    target=self._run, name="event-archiver", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # ---------- writes ----------
+    def offer(self, event_type: str, obj) -> None:
+        """Informer listener: queue the event, never block the watch thread."""
+        if event_type == "DELETED":
+            return  # expired upstream; the archive keeps it
+        try:
+            self._queue.put_nowait(event_row(obj))
+        except queue.Full:
+            DROPPED.inc()
+
+    def _run(self) -> None:
+        last_prune = 0.0
+        while not self._stop.is_set():
+            pending = self._drain()
+            try:
+                self.write(list(pending.values()))
+                if time.monotonic() - last_prune > PRUNE_INTERVAL_SECONDS:
+                    self.prune()
+                    last_prune = time.monotonic()
+            except Exception:
+                log.exception("event archive write failed, dropping %d events", len(pending))
+
+    def _drain(self) -> dict[str, dict[str, Any]]:
+        """Collect up to `batch` events (latest per uid) or whatever arrived in flush_seconds."""
+        pending: dict[str, dict[str, Any]] = {}
+        deadline = time.monotonic() + self.flush_seconds
+        while len(pending) < self.batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                row = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            held = pending.get(row["uid"])
+            if held is None or held["last_seen"] <= row["last_seen"]:
+                pending[row["uid"]] = row
+        BACKLOG.set(self._queue.qsize())
+        return pending
+
+    def write(self, rows: list[dict[str, Any]]) -> None:
+        if not rows:
+            return
+        with database.session_scope() as session:
+            upsert(session, rows)
+        ARCHIVED.inc(len(rows))
+
+    def prune(self) -> None:
+        cutoff = datetime.datetime.now(datetime.UTC) - datetime.timedelta(days=self.retention_days)
+        with database.session_scope() as session:
+            res = session.execute(delete(K8sEvent).where(K8sEvent.last_seen < cutoff))
+        PRUNED.inc(res.rowcount or 0)
+
+
+archiver = EventArchiver()
+
+
+def serving() -> bool:
+    """Whether time-window reads should come from the archive."""
+    return EVENT_ARCHIVE and archiver.running
+
+
+# ---------- reads ----------
+def encode_continue(row: K8sEvent) -> str:
+    raw = f"{utc(row.last_seen).isoformat()}|{row.uid}"
+    return CONTINUE_PREFIX + base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_continue(token: str) -> tuple[datetime.datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(token[len(CONTINUE_PREFIX) :]).decode()
+        ts, uid = raw.split("|", 1)
+        return datetime.datetime.fromisoformat(ts), uid
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail="Malformed continue token") from e
+
+
+def supports(label_selector: str | None, field_selector: str | None) -> bool:
+    if label_selector:
+        return False  # labels are not archived
+    try:
+        reqs = watch_cache.parse_field_selector(field_selector)
+    except watch_cache.UnsupportedSelector:
+        return False
+    return all(path in FIELD_COLUMNS for path, _, _ in reqs)
+
+
+def query(
+    namespaces: list[str] | None,
+    since: datetime.datetime | None,
+    until: datetime.datetime | None,
+    field_selector: str | None,
+    limit: int,
+    _continue: str | None = None,
+) -> tuple[list[K8sEvent], str | None]:
+    """Archived events in [since, until], newest first, keyset-paginated."""
+    stmt = select(K8sEvent)
+    if namespaces is not None:
+        stmt = stmt.where(K8sEvent.namespace.in_(namespaces))
+    if since is not None:
+        stmt = stmt.where(K8sEvent.last_seen >= since)
+    if until is not None:
+        stmt = stmt.where(K8sEvent.last_seen <= until)
+    for path, op, value in watch_cache.parse_field_selector(field_selector):
+        col = FIELD_COLUMNS[path]
+        stmt = stmt.where(col == value if op == "=" else or_(col != value, col.is_(None)))
+    if _continue:
+        ts, uid = decode_continue(_continue)
+        stmt = stmt.where(
+            or_(K8sEvent.last_seen < ts, and_(K8sEvent.last_seen == ts, K8sEvent.uid < uid))
+        )
+    stmt = stmt.order_by(K8sEvent.last_seen.desc(), K8sEvent.uid.desc()).limit(limit + 1)
+
+    with database.session_scope() as session:
+        rows = list(session.scalars(stmt))
+        session.expunge_all()
+    token = encode_continue(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], token
@@ -0,0 +1,94 @@
+"""Run one list query per namespace concurrently and merge the pages.
+
+For users whose RBAC only covers some namespaces, so *-for-all-namespaces LISTs are
+not an option. Namespaces are queried on a bounded pool; a namespace that fails
+(403, 404, timeout) is reported under "errors" instead of failing the whole request.
+`limit` applies per namespace, and the continue token carries one token per
+namespace that still has more items.
+"""
+
+import base64
+import binascii
+import json
+import os
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from fastapi import HTTPException
+from prometheus_client import Counter
+
+from app.infra.kube import ApiException
+
+KUBE_FANOUT_WORKERS = int(os.getenv("KUBE_FANOUT_WORKERS", "8"))
+MULTI_PREFIX = "multi:"
+
+# Define metrics
+FANOUT_CALLS = Counter("kube_fanout_calls_total", "Per-namespace fan-out calls", ["result"])
+
+_pool = ThreadPoolExecutor(KUBE_FANOUT_WORKERS, thread_name_prefix="kube-fanout")
+
+# fetch(namespace, continue_token) -> {"items": [...], "continue": token}
+Fetch = Callable[[str, str | None], dict[str, Any]]
+
+
+def split_namespaces(namespace: str | None) -> list[str] | None:
+    """ "a,b" -> ["a", "b"]; a single namespace (or none) is not a fan-out."""
+    if not namespace or "," not in namespace:
+        return None
+    return sorted({ns.strip() for ns in namespace.split(",") if ns.strip()})
+
+
+def encode_continue(tokens: dict[str, str]) -> str | None:
+    if not tokens:
+        return None
+    raw = json.dumps(tokens, separators=(",", ":")).encode()
+    return MULTI_PREFIX + base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_continue(token: str) -> dict[str, str]:
+    if not token.startswith(MULTI_PREFIX):
+        raise HTTPException(status_code=400, detail="Continue token is not a multi-namespace one")
+    try:
+        tokens = json.loads(base64.urlsafe_b64decode(token[len(MULTI_PREFIX) :]))
+    except (binascii.Error, ValueError) as e:
+        raise HTTPException(status_code=400, detail="Malformed continue token") from e
+    return tokens
+
+
+def _error(e: Exception) -> dict[str, Any]:
+    if isinstance(e, HTTPException):
+        return {"status": e.status_code, "message": e.detail}
+    if isinstance(e, ApiException):
+        return {"status": e.status or 502, "message": e.reason}
+    return {"status": 502, "message": str(e) or type(e).__name__}
+
+
+def fan_out(namespaces: list[str], fetch: Fetch, _continue: str | None = None) -> dict[str, Any]:
+    """Merged page sorted by namespace (items within one keep apiserver order)."""
+    tokens: dict[str, str] = {}
+    if _continue:
+        tokens = decode_continue(_continue)
+        namespaces = [ns for ns in namespaces if ns in tokens]
+    futures = {ns: _pool.submit(fetch, ns, tokens.get(ns)) for ns in namespaces}
+
+    items: list[Any] = []
+    next_tokens: dict[str, str] = {}
+    errors: dict[str, dict[str, Any]] = {}
+    for ns in namespaces:
+        try:
+            page = futures[ns].result()
+        except Exception as e:
+            FANOUT_CALLS.labels("error").inc()
+            errors[ns] = _error(e)
+            continue
+        FANOUT_CALLS.labels("ok").inc()
+        items.extend(page["items"])
+        if page.get("continue"):
+            next_tokens[ns] = page["continue"]
+
+    if namespaces and len(errors) == len(namespaces):
+        # nothing to merge: surface the failure instead of an empty 200
+        first = errors[namespaces[0]]
+        raise HTTPException(status_code=first["status"], detail={"errors": errors})
+    return {"items": items, "continue": encode_continue(next_tokens), "errors": errors}
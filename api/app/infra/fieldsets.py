@@ -0,0 +1,67 @@
+"""Sparse fieldsets (`fields=name,phase,containers.name`) for the kubectl list endpoints.
+
+Each projection is a dict of top-level output key -> extractor, so a fieldset skips
+the extractors it does not ask for entirely. Dotted paths then trim nested dicts (and
+every element of nested lists) down to the requested keys.
+"""
+
+from collections.abc import Callable
+from typing import Any
+
+from fastapi import HTTPException
+
+Extractors = dict[str, Callable[[Any], Any]]
+# top-level key -> nested selection, or None for the whole value
+Selection = dict[str, "Selection | None"]
+
+
+def _merge(sel: Selection, parts: list[str]) -> None:
+    head, rest = parts[0], parts[1:]
+    if head in sel and sel[head] is None:
+        return  # already whole
+    if not rest:
+        sel[head] = None
+        return
+    _merge(sel.setdefault(head, {}), rest)  # type: ignore[arg-type]
+
+
+def parse_fields(fields: str | None, extractors: Extractors) -> Selection | None:
+    """Parse a comma separated fieldset; None means every field."""
+    if not fields:
+        return None
+    sel: Selection = {}
+    for path in fields.split(","):
+        parts = [p for p in path.strip().split(".") if p]
+        if not parts:
+            continue
+        if parts[0] not in extractors:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown field {parts[0]!r}; expected one of {', '.join(extractors)}",
+            )
+        _merge(sel, parts)
+    return sel or None
+
+
+def _prune(value: Any, sel: Selection) -> Any:
+    if isinstance(value, dict):
+        return {
+            k: value[k] if sub is None else _prune(value[k], sub)
+            for k, sub in sel.items()
+            if k in value
+        }
+    if isinstance(value, list):
+        return [_prune(v, sel) for v in value]
+    return value
+
+
+def project(obj: Any, extractors: Extractors, sel: Selection | None = None) -> dict[str, Any]:
+    """Build the output dict in the extractors' key order, computing only selected keys."""
+    if sel is None:
+        return {k: fn(obj) for k, fn in extractors.items()}
+    out = {}
+    for k, fn in extractors.items():
+        if k in sel:
+            sub = sel[k]
+            out[k] = fn(obj) if sub is None else _prune(fn(obj), sub)
+    return out
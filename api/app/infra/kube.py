@@ -1,11 +1,195 @@
+import contextlib
+import functools
+import os
+import threading
+from collections.abc import Callable
+from datetime import datetime
+from typing import Any
+
+import anyio
+import orjson
+from fastapi import HTTPException
 from kubernetes import client, config
+from kubernetes.client.exceptions import ApiException  # noqa: F401 - re-exported
+from prometheus_client import Counter, Gauge
+
+# Max connections kept per apiserver host; every in-flight kube call holds one
+KUBE_POOL_MAXSIZE = int(os.getenv("KUBE_POOL_MAXSIZE", "20"))
+# Threads for blocking kube calls made from async routes, separate from Starlette's pool
+KUBE_EXECUTOR_THREADS = int(os.getenv("KUBE_EXECUTOR_THREADS", str(KUBE_POOL_MAXSIZE)))
+# Socket timeout passed to every non-streaming kube request (_request_timeout)
+KUBE_REQUEST_TIMEOUT = float(os.getenv("KUBE_REQUEST_TIMEOUT", "10"))
+# metrics-server is optional and often slow; don't let it hold up the node list
+KUBE_METRICS_TIMEOUT = float(os.getenv("KUBE_METRICS_TIMEOUT", "3"))
+# Upper bound for a whole crud call from an async route, incl. waiting for a thread
+KUBE_CALL_TIMEOUT = float(os.getenv("KUBE_CALL_TIMEOUT", "15"))
+
+# Define metrics
+POOL_MAXSIZE = Gauge("kube_client_pool_maxsize", "Configured kube client connection pool size")
+POOL_IN_USE = Gauge("kube_client_pool_in_use", "Kube client connections currently checked out")
+POOL_IDLE = Gauge("kube_client_pool_idle", "Idle kube client connections kept alive")
+CONFIG_LOADS = Counter("kube_client_config_loads_total", "Kube client configuration loads")
+EXECUTOR_BUSY = Gauge("kube_executor_busy_threads", "Kube executor threads running a call")
+EXECUTOR_WAITING = Gauge("kube_executor_waiting_calls", "Kube calls waiting for a thread")
+CALL_TIMEOUTS = Counter("kube_call_timeouts_total", "Kube calls abandoned after timing out")
+
+
+class KubeClientManager:
+    """Process-wide kube ApiClient, loaded lazily on first use and shared by all calls.
+
+    The in-cluster loader installs a refresh hook on the Configuration that re-reads the
+    projected service-account token when it rotates, so no restart is needed.
+    """
+
+    def __init__(self, pool_maxsize: int = KUBE_POOL_MAXSIZE):
+        self.pool_maxsize = pool_maxsize
+        self._lock = threading.Lock()
+        self._api_client: client.ApiClient | None = None
+
+    def _load(self) -> client.ApiClient:
+        cfg = client.Configuration()
+        try:
+            # running inside a Pod
+            config.load_incluster_config(client_configuration=cfg)
+        except config.ConfigException:
+            # running locally
+            config.load_kube_config(client_configuration=cfg)
+        cfg.connection_pool_maxsize = self.pool_maxsize
+        CONFIG_LOADS.inc()
+        POOL_MAXSIZE.set(self.pool_maxsize)
+        return client.ApiClient(configuration=cfg)
+
+    @property
+    def api_client(self) -> client.ApiClient:
+        api_client = self._api_client
+        if api_client is None:
+            with self._lock:
+                if self._api_client is None:
+                    self._api_client = self._load()
+                api_client = self._api_client
+        return api_client
+
+    # API wrappers only hold a reference to the shared client, so they are cheap to build
+    def core_v1(self) -> client.CoreV1Api:
+        return client.CoreV1Api(self.api_client)
+
+    def custom_objects(self) -> client.CustomObjectsApi:
+        return client.CustomObjectsApi(self.api_client)
+
+    def reset(self) -> None:
+        """Drop the shared client; the next call reloads config (e.g. after a 401)."""
+        with self._lock:
+            old, self._api_client = self._api_client, None
+        if old is not None:
+            old.close()
+
+    def pool_stats(self) -> dict[str, int]:
+        in_use = idle = 0
+        api_client = self._api_client
+        if api_client is not None:
+            pools = api_client.rest_client.pool_manager.pools
+            for key in pools.keys():  # noqa: SIM118 - container refuses plain iteration
+                pool = pools.get(key)
+                if pool is None or pool.pool is None:
+                    continue
+                # the queue is pre-filled with None placeholders up to maxsize
+                in_use += pool.pool.maxsize - pool.pool.qsize()
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        return {"in_use": in_use, "idle": idle}
+
+
+kube = KubeClientManager()
+
+
+def json_body(resp) -> Any:
+    """
+    Parse a `_preload_content=False` response with orjson. Skips building the client's
+    OpenAPI models, which dominates CPU on large LISTs.
+    """
+    try:
+        return orjson.loads(resp.data)
+    finally:
+        resp.release_conn()
+
+
+def parse_time(value: str | None) -> datetime | None:
+    """RFC3339 (Micro)Time from raw JSON, as the models would hold it."""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else None
+
+
+POOL_IN_USE.set_function(lambda: kube.pool_stats()["in_use"])
+POOL_IDLE.set_function(lambda: kube.pool_stats()["idle"])
+
+
+def core_v1() -> client.CoreV1Api:
+    return kube.core_v1()
+
+
+def custom_objects() -> client.CustomObjectsApi:
+    return kube.custom_objects()
+
+
+KUBE_LIMITER = anyio.CapacityLimiter(KUBE_EXECUTOR_THREADS)
+# hands out threads to calls that already hold a KUBE_LIMITER token, so it never blocks
+_DISPATCH = anyio.CapacityLimiter(KUBE_EXECUTOR_THREADS)
+
+EXECUTOR_BUSY.set_function(lambda: KUBE_LIMITER.borrowed_tokens)
+EXECUTOR_WAITING.set_function(lambda: KUBE_LIMITER.statistics().tasks_waiting)
+
+
+class _Borrower:
+    """
+    KUBE_LIMITER borrower of one run_kube call. Its token is given back by whoever ends
+    up owning it: the thread once the call returns, or the caller if it stops waiting
+    before the thread started. A caller timing out therefore does not free the token of
+    a thread still blocked in the kube call.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._owner = "caller"  # caller -> thread, or caller -> nobody if it left first
+
+    def run(self, call: Callable[[], Any]) -> Any:
+        with self._lock:
+            if self._owner != "caller":
+                return None  # the caller gave up before this thread got to run
+            self._owner = "thread"
+        try:
+            return call()
+        finally:
+            # RuntimeError: the event loop is gone, and the limiter with it
+            with contextlib.suppress(RuntimeError):
+                anyio.from_thread.run_sync(KUBE_LIMITER.release_on_behalf_of, self)
+
+    def leave(self) -> None:
+        """Caller side, on the event loop, once it stops waiting for the thread."""
+        with self._lock:
+            if self._owner != "caller":
+                return
+            self._owner = "nobody"
+        KUBE_LIMITER.release_on_behalf_of(self)
 
 
-def get_k8s_client():
+async def run_kube(func: Callable[..., Any], *args: Any, timeout: float | None = None):
+    """
+    Run a blocking kube crud call on the dedicated kube threads, failing with 504 after
+    `timeout`. The worker thread is abandoned rather than interrupted, and keeps its
+    KUBE_LIMITER token until the call returns; the socket-level KUBE_REQUEST_TIMEOUT on
+    each request is what eventually frees it.
+    """
+    borrower = _Borrower()
     try:
-        # running inside a Pod
-        config.load_incluster_config()
-    except config.ConfigException:
-        # running locally
-        config.load_kube_config()
-    return client
+        with anyio.fail_after(timeout or KUBE_CALL_TIMEOUT):
+            await KUBE_LIMITER.acquire_on_behalf_of(borrower)
+            try:
+                return await anyio.to_thread.run_sync(
+                    borrower.run,
+                    functools.partial(func, *args),
+                    limiter=_DISPATCH,
+                    abandon_on_cancel=True,
+                )
+            finally:
+                borrower.leave()
+    except TimeoutError as e:
+        CALL_TIMEOUTS.inc()
+        raise HTTPException(status_code=504, detail="Kubernetes API timed out") from e
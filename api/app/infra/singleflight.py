@@ -0,0 +1,77 @@
+"""Coalesce identical concurrent kube reads into one upstream call (singleflight).
+
+When several clients ask for the same thing at once (dashboards refreshing together),
+the first request starts the crud call on the kube threads and the others await that
+same call instead of issuing their own. Calls are keyed by the crud function and its
+arguments, `functools.partial` keywords included; the entry is dropped as soon as the
+call finishes, so nothing is cached beyond the in-flight window. Reads asking for
+`consistent=True` are never joined to a call that started before them.
+"""
+
+import asyncio
+import functools
+from collections.abc import Callable, Hashable
+from typing import Any
+
+from prometheus_client import Counter
+
+from app.infra.kube import run_kube
+
+# Define metrics
+CALLS = Counter(
+    "kube_singleflight_calls_total", "kube reads by coalescing outcome", ["function", "result"]
+)
+
+_inflight: dict[Hashable, asyncio.Future] = {}
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, list | tuple):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, set):
+        return frozenset(value)
+    hash(value)  # TypeError for anything else unhashable
+    return value
+
+
+def call_key(func: Callable[..., Any], args: tuple[Any, ...]) -> Hashable | None:
+    """(function, normalized arguments), or None if the call must not be shared."""
+    kwargs: dict[str, Any] = {}
+    if isinstance(func, functools.partial):
+        args, kwargs, func = func.args + args, func.keywords, func.func
+    if kwargs.get("consistent"):
+        return None
+    try:
+        return (func.__module__, func.__qualname__, _freeze(args), _freeze(kwargs))
+    except TypeError:
+        return None
+
+
+def _name(func: Callable[..., Any]) -> str:
+    return getattr(getattr(func, "func", func), "__name__", "unknown")
+
+
+async def run_shared(func: Callable[..., Any], *args: Any, timeout: float | None = None):
+    """`run_kube(func, *args)`, sharing the result with identical calls already in flight."""
+    key = call_key(func, args)
+    if key is None:
+        return await run_kube(func, *args, timeout=timeout)
+    fut = _inflight.get(key)
+    if fut is None:
+        CALLS.labels(_name(func), "issued").inc()
+        # a task of its own, so a leader that disconnects does not cancel the followers
+        fut = asyncio.ensure_future(run_kube(func, *args, timeout=timeout))
+        _inflight[key] = fut
+
+        def forget(done: asyncio.Future) -> None:
+            if _inflight.get(key) is done:
+                del _inflight[key]
+            if not done.cancelled():
+                done.exception()  # retrieved, even if every waiter went away
+
+        fut.add_done_callback(forget)
+    else:
+        CALLS.labels(_name(func), "coalesced").inc()
+    return await asyncio.shield(fut)
@@ -0,0 +1,92 @@
+"""Relay blocking upstream iterators (kube log streams) as streaming HTTP bodies."""
+
+from collections.abc import AsyncIterator, Callable, Iterator
+from typing import Any, TypeVar
+
+import anyio
+import orjson
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+async def relay(iterator: Iterator[T], *, limiter: anyio.CapacityLimiter) -> AsyncIterator[T]:
+    """
+    Pull items from a blocking iterator in worker threads, one read at a time.
+
+    Nothing is read ahead: the next upstream read starts only after the previous item
+    has been handed to the ASGI server, so a slow client slows the upstream down
+    instead of piling data up in memory. When the client disconnects the pending read
+    is abandoned; closing the upstream (see UpstreamStreamingResponse) unblocks it.
+    """
+    while True:
+        item = await anyio.to_thread.run_sync(
+            next, iterator, _DONE, limiter=limiter, abandon_on_cancel=True
+        )
+        if item is _DONE:
+            return
+        yield item  # type: ignore[misc]
+
+
+class UpstreamStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse over an upstream opened before it was returned (so that opening
+    errors still get their own status), calling `close` once the response is over
+    however it ended: streamed out, client gone mid-body, or gone before the body
+    generator even started.
+    """
+
+    def __init__(self, content: Any, *, close: Callable[[], None], **kwargs: Any) -> None:
+        super().__init__(content, **kwargs)
+        self.close_upstream = close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.close_upstream()
+
+
+def dumps(obj: Any) -> str:
+    # same encoding as the ORJSONResponse list endpoints (datetimes as RFC 3339)
+    return orjson.dumps(obj).decode()
+
+
+def iter_pages(
+    fetch: Callable[..., dict[str, Any]],
+    *,
+    page_size: int,
+    max_items: int,
+    _continue: str | None = None,
+) -> Iterator[tuple[list[Any], str | None, dict[str, Any] | None]]:
+    """
+    Follow continue tokens server side, yielding (items, continue, errors) one page at a
+    time; errors are the per-namespace failures of a fan-out page, else None.
+    The last page is shortened so that stopping at `max_items` leaves a valid token
+    for resuming exactly where the stream ended.
+    """
+    sent = 0
+    token = _continue
+    while sent < max_items:
+        page = fetch(limit=min(page_size, max_items - sent), _continue=token)
+        items, token = page["items"], page.get("continue")
+        sent += len(items)
+        yield items, token, page.get("errors")
+        if not token:
+            return
+
+
+def ndjson(obj: Any) -> str:
+    return dumps(obj) + "\n"
+
+
+def sse(obj: Any, event: str | None = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {dumps(obj)}\n\n"
@@ -0,0 +1,107 @@
+"""Read-through Redis cache for GET /tasks/{id} and GET /tasks pages.
+
+Polling UIs re-read the same tasks every few seconds while jobs run; with
+TASK_CACHE_URL set those reads are answered from Redis and only a miss opens a
+database connection. Keys, TTLs and invalidation are shared with the worker through
+`opsbox_common.task_cache`. Any Redis error falls back to the database.
+"""
+
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Any
+
+import orjson
+from opsbox_common import task_cache
+from opsbox_common.libs.loggin import get_logger
+from opsbox_common.settings import TASK_CACHE_LIST_TTL, TASK_CACHE_TTL, TASK_CACHE_URL
+from prometheus_client import Counter
+from redis import RedisError
+from redis.asyncio import Redis
+
+log = get_logger(__name__)
+
+# Define metrics
+LOOKUPS = Counter("task_cache_lookups_total", "Task cache lookups", ["kind", "result"])
+INVALIDATIONS = Counter("task_cache_invalidations_total", "Task cache invalidations by the API")
+
+_client: Redis | None = None
+
+
+def client() -> Redis:
+    global _client
+    if _client is None:
+        _client = Redis.from_url(
+            TASK_CACHE_URL,
+            socket_timeout=task_cache.SOCKET_TIMEOUT,
+            socket_connect_timeout=task_cache.SOCKET_TIMEOUT,
+        )
+    return _client
+
+
+def _hit(kind: str, raw: bytes | None) -> bool:
+    LOOKUPS.labels(kind, "hit" if raw is not None else "miss").inc()
+    return raw is not None
+
+
+async def cached_task(task_id: Any, load: Callable[[], Awaitable[Any]]):
+    """`load()` (a JSON-able task or None), served from the cache when possible."""
+    if not task_cache.enabled():
+        return await load()
+    key = task_cache.task_key(task_id)
+    try:
+        raw, generation = await client().mget(key, task_cache.GENERATION_KEY)
+    except RedisError:
+        LOOKUPS.labels("task", "error").inc()
+        return await load()
+    if _hit("task", raw):
+        return orjson.loads(raw)
+    value = await load()
+    if value is not None:  # unknown ids are not cached, they may be created any moment
+        try:
+            # skipped if a write invalidated since `generation` was read: value may predate it
+            store = client().register_script(task_cache.SET_IF_GENERATION)
+            await store(
+                keys=[key, task_cache.GENERATION_KEY],
+                args=[orjson.dumps(value), TASK_CACHE_TTL, int(generation or 0)],
+            )
+        except RedisError:
+            log.warning("task cache write failed", exc_info=True)
+    return value
+
+
+async def cached_page(params: dict[str, Any], load: Callable[[], Awaitable[Any]]):
+    """`load()` (a JSON-able list page) for these query params, within the current generation."""
+    if not task_cache.enabled():
+        return await load()
+    try:
+        generation = int(await client().get(task_cache.GENERATION_KEY) or 0)
+        key = task_cache.list_key(generation, params)
+        raw = await client().get(key)
+    except RedisError:
+        LOOKUPS.labels("list", "error").inc()
+        return await load()
+    if _hit("list", raw):
+        return orjson.loads(raw)
+    value = await load()
+    try:
+        # a page loaded before a write lands under the generation that write retired
+        await client().set(key, orjson.dumps(value), ex=TASK_CACHE_LIST_TTL)
+    except RedisError:
+        log.warning("task cache write failed", exc_info=True)
+    return value
+
+
+async def invalidate(task_ids: Iterable[Any] = ()) -> None:
+    """Drop the cached tasks and every cached list page; call after the commit."""
+    if not task_cache.enabled():
+        return
+    keys = [task_cache.task_key(i) for i in task_ids]
+    try:
+        pipe = client().pipeline(transaction=False)
+        if keys:
+            pipe.delete(*keys)
+        pipe.incr(task_cache.GENERATION_KEY)
+        await pipe.execute()
+    except RedisError:
+        log.warning("task cache invalidation failed; entries expire by TTL", exc_info=True)
+        return
+    INVALIDATIONS.inc()
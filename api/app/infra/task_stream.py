@@ -0,0 +1,110 @@
+"""Task status changes pushed to /tasks/stream subscribers.
+
+One producer per API pod feeds every subscriber (a Broadcaster with a single topic),
+each filtering by task id and/or status. On Postgres the producer LISTENs on the
+channel the tasks trigger NOTIFYs on, so changes written by the worker arrive as soon
+as they commit. Elsewhere (SQLite in tests and local runs) it polls tasks in
+(updated_at, id) order, which reports any changed row, not only status changes.
+"""
+
+import os
+import threading
+from collections.abc import Callable
+from typing import Any
+from uuid import UUID
+
+import orjson
+import psycopg
+from opsbox_common import database
+from opsbox_common.models import TASK_STATUS_CHANNEL, Task, TaskStatus
+from prometheus_client import Counter
+from sqlalchemy import select, tuple_
+from sqlalchemy.engine import URL
+
+from app.infra.broadcast import Broadcaster, Initial, Match
+
+TASK_STREAM_POLL_SECONDS = float(os.getenv("TASK_STREAM_POLL_SECONDS", "1"))
+TASK_STREAM_POLL_BATCH = int(os.getenv("TASK_STREAM_POLL_BATCH", "500"))
+
+TOPIC = "tasks"
+LISTEN_TIMEOUT = 1.0  # seconds between checks for the last subscriber leaving
+
+# Define metrics
+CHANGES = Counter(
+    "task_stream_changes_total", "Task changes received for /tasks/stream", ["source"]
+)
+
+COLUMNS = (Task.id, Task.status, Task.result, Task.updated_at)
+
+
+def message(task_id, status, result, updated_at) -> tuple[str, tuple[str, str]]:
+    """(JSON message, (id, status) for the filters), shaped like the NOTIFY payload."""
+    status = status.value if isinstance(status, TaskStatus) else status
+    body = {"id": task_id, "status": status, "result": result, "updated_at": updated_at}
+    return orjson.dumps(body).decode(), (str(task_id), status)
+
+
+def _listen(url: URL, publish: Callable[..., None], stop: threading.Event) -> None:
+    conninfo = url.set(drivername="postgresql").render_as_string(hide_password=False)
+    # a connection of its own, held while anyone listens; not through PgBouncer
+    with psycopg.connect(conninfo, autocommit=True) as conn:
+        conn.execute(f"LISTEN {TASK_STATUS_CHANNEL}")
+        while not stop.is_set():
+            for notify in conn.notifies(timeout=LISTEN_TIMEOUT):
+                data = orjson.loads(notify.payload)
+                CHANGES.labels("notify").inc()
+                publish(notify.payload, (data["id"], data["status"]))
+
+
+def _poll(publish: Callable[..., None], stop: threading.Event) -> None:
+    latest = select(Task.updated_at, Task.id).order_by(Task.updated_at.desc(), Task.id.desc())
+    with database.session_scope() as session:
+        last = session.execute(latest.limit(1)).first()
+    while not stop.wait(TASK_STREAM_POLL_SECONDS):
+        stmt = select(*COLUMNS).order_by(Task.updated_at, Task.id).limit(TASK_STREAM_POLL_BATCH)
+        if last is not None:
+            stmt = stmt.where(tuple_(Task.updated_at, Task.id) > tuple(last))
+        with database.session_scope() as session:
+            rows = session.execute(stmt).all()
+        for row in rows:
+            CHANGES.labels("poll").inc()
+            publish(*message(*row))
+        if rows:
+            last = (rows[-1].updated_at, rows[-1].id)
+
+
+def produce(key: Any, publish: Callable[..., None], stop: threading.Event) -> None:
+    with database.session_scope() as session:
+        bind = session.get_bind()
+    if bind.dialect.name == "postgresql":
+        _listen(bind.url, publish, stop)
+    else:
+        _poll(publish, stop)
+
+
+TASK_STREAM = Broadcaster("tasks", produce)
+
+
+def subscription(
+    task_ids: list[UUID] | None, statuses: list[TaskStatus] | None
+) -> tuple[Match | None, Initial | None]:
+    """The filter for these query params and, for task ids, their current state."""
+    ids = {str(i) for i in task_ids or ()}
+    values = {s.value for s in statuses or ()}
+    if not ids and not values:
+        return None, None
+
+    def match(attrs: tuple[str, str]) -> bool:
+        task_id, status = attrs
+        return (not ids or task_id in ids) and (not values or status in values)
+
+    async def initial() -> list[str]:
+        # sent after subscribing, so a change racing the subscription is not missed
+        stmt = select(*COLUMNS).where(Task.id.in_(task_ids))
+        if values:
+            stmt = stmt.where(Task.status.in_(statuses))
+        async with database.AsyncSessionLocal() as db:
+            rows = (await db.execute(stmt)).all()
+        return [message(*row)[0] for row in rows]
+
+    return match, initial if ids else None
@@ -0,0 +1,226 @@
+"""Background sampler of metrics.k8s.io usage into per-node / per-pod ring buffers.
+
+One thread scrapes node and pod metrics every USAGE_SAMPLE_INTERVAL seconds (two
+cluster-wide LISTs, whatever the number of API clients) and appends the samples to
+fixed-size buffers backed by `array('d')`, so a series costs 3 * 8 bytes per slot and
+never grows. Series of nodes/pods that disappear are evicted once their samples age
+out of the history span.
+"""
+
+import math
+import os
+import threading
+import time
+from array import array
+from typing import Any
+
+from kubernetes.utils import parse_quantity
+from opsbox_common.libs.loggin import get_logger
+from prometheus_client import Counter, Gauge
+
+from app.infra.kube import KUBE_METRICS_TIMEOUT, ApiException, custom_objects, kube
+
+USAGE_COLLECTOR = os.getenv("USAGE_COLLECTOR", "1") == "1"
+USAGE_SAMPLE_INTERVAL = float(os.getenv("USAGE_SAMPLE_INTERVAL", "15"))  # seconds
+USAGE_HISTORY_SIZE = int(os.getenv("USAGE_HISTORY_SIZE", "240"))  # samples per series (1h)
+
+log = get_logger(__name__)
+
+# Define metrics
+SERIES = Gauge("usage_history_series", "Usage series held in memory", ["kind"])
+SCRAPES = Counter("usage_history_scrapes_total", "metrics.k8s.io scrapes", ["kind", "result"])
+
+
+class RingBuffer:
+    """Fixed-capacity (ts, cpu cores, memory bytes) samples, oldest overwritten first."""
+
+    __slots__ = ("capacity", "ts", "cpu", "memory", "head", "count")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ts = array("d", bytes(8 * capacity))
+        self.cpu = array("d", bytes(8 * capacity))
+        self.memory = array("d", bytes(8 * capacity))
+        self.head = 0  # next slot to write
+        self.count = 0
+
+    def append(self, ts: float, cpu: float, memory: float) -> None:
+        i = self.head
+        self.ts[i], self.cpu[i], self.memory[i] = ts, cpu, memory
+        self.head = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    @property
+    def last_ts(self) -> float:
+        return self.ts[(self.head - 1) % self.capacity] if self.count else 0.0
+
+    def window(self, since: float) -> tuple[array, array, array]:
+        """Samples with ts >= since, oldest first, as compact arrays."""
+        start = (self.head - self.count) % self.capacity
+        order = [(start + k) % self.capacity for k in range(self.count)]
+        order = [i for i in order if self.ts[i] >= since]
+        return (
+            array("d", (self.ts[i] for i in order)),
+            array("d", (self.cpu[i] for i in order)),
+            array("d", (self.memory[i] for i in order)),
+        )
+
+
+def p95(values: array) -> float | None:
+    """Nearest-rank 95th percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[math.ceil(0.95 * len(ordered)) - 1]
+
+
+def downsample(ts: array, values: array, points: int) -> list[tuple[float, float]]:
+    """Average into at most `points` buckets for sparklines."""
+    n = len(ts)
+    if n <= points:
+        return list(zip(ts, values, strict=True))
+    out = []
+    for b in range(points):
+        lo, hi = b * n // points, (b + 1) * n // points
+        out.append((ts[hi - 1], sum(values[lo:hi]) / (hi - lo)))
+    return out
+
+
+def _usage(containers_or_usage: Any) -> tuple[float, float]:
+    cpu = memory = 0.0
+    for u in containers_or_usage:
+        cpu += float(parse_quantity(u.get("cpu", "0")))
+        memory += float(parse_quantity(u.get("memory", "0")))
+    return cpu, memory
+
+
+class UsageCollector:
+    def __init__(
+        self, interval: float = USAGE_SAMPLE_INTERVAL, history_size: int = USAGE_HISTORY_SIZE
+    ):
+        self.interval = interval
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        # "nodes" -> {name: buf}, "pods" -> {"ns/name": buf}
+        self._series: dict[str, dict[str, RingBuffer]] = {"nodes": {}, "pods": {}}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # ---------- lifecycle ----------
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="usage-collector", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.sample()
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    # ---------- sampling ----------
+    def _scrape(self, kind: str) -> list[dict[str, Any]] | None:
+        try:
+            res = custom_objects().list_cluster_custom_object(
+                "metrics.k8s.io", "v1beta1", kind, _request_timeout=KUBE_METRICS_TIMEOUT
+            )
+        except ApiException as e:
+            SCRAPES.labels(kind, "error").inc()
+            if e.status == 401:
+                kube.reset()
+            log.debug("metrics.k8s.io %s scrape failed: %s", kind, e.status)
+            return None
+        except Exception:
+            SCRAPES.labels(kind, "error").inc()
+            log.debug("metrics.k8s.io %s scrape failed", kind, exc_info=True)
+            return None
+        SCRAPES.labels(kind, "ok").inc()
+        return res.get("items", [])
+
+    def sample(self) -> None:
+        now = time.time()
+        nodes = self._scrape("nodes")
+        if nodes is not None:
+            for item in nodes:
+                self.record("nodes", item["metadata"]["name"], now, *_usage([item["usage"]]))
+        pods = self._scrape("pods")
+        if pods is not None:
+            for item in pods:
+                meta = item["metadata"]
+                usage = _usage(c["usage"] for c in item.get("containers", []))
+                self.record("pods", f"{meta['namespace']}/{meta['name']}", now, *usage)
+        self.evict(now - self.interval * self.history_size)
+
+    def record(self, kind: str, key: str, ts: float, cpu: float, memory: float) -> None:
+        with self._lock:
+            buf = self._series[kind].get(key)
+            if buf is None:
+                buf = self._series[kind][key] = RingBuffer(self.history_size)
+            buf.append(ts, cpu, memory)
+            SERIES.labels(kind).set(len(self._series[kind]))
+
+    def evict(self, before: float) -> None:
+        with self._lock:
+            for kind, series in self._series.items():
+                for key in [k for k, b in series.items() if b.last_ts < before]:
+                    del series[key]
+                SERIES.labels(kind).set(len(series))
+
+    # ---------- reads ----------
+    def latest(self, kind: str) -> dict[str, dict[str, float]]:
+        """Most recent sample per series, e.g. to annotate the node list without a scrape."""
+        with self._lock:
+            out = {}
+            for key, buf in self._series[kind].items():
+                i = (buf.head - 1) % buf.capacity
+                out[key] = {"ts": buf.ts[i], "cpu": buf.cpu[i], "memory": buf.memory[i]}
+            return out
+
+    def history(
+        self, kind: str, key: str, window_seconds: float, points: int
+    ) -> dict[str, Any] | None:
+        with self._lock:
+            buf = self._series[kind].get(key)
+            if buf is None:
+                return None
+            ts, cpu, memory = buf.window(time.time() - window_seconds)
+        return {
+            "interval_seconds": self.interval,
+            "samples": len(ts),
+            "cpu": {  # cores
+                "latest": cpu[-1] if cpu else None,
+                "p95": p95(cpu),
+                "max": max(cpu) if cpu else None,
+                "points": downsample(ts, cpu, points),
+            },
+            "memory": {  # bytes
+                "latest": memory[-1] if memory else None,
+                "p95": p95(memory),
+                "max": max(memory) if memory else None,
+                "points": downsample(ts, memory, points),
+            },
+        }
+
+
+collector = UsageCollector()
+
+
+def fresh_latest(kind: str) -> dict[str, dict[str, float]] | None:
+    """Latest samples if the collector is running and recent, else None (read live)."""
+    if not USAGE_COLLECTOR:
+        return None
+    collector.start()
+    latest = collector.latest(kind)
+    cutoff = time.time() - 2 * collector.interval
+    if not latest or max(s["ts"] for s in latest.values()) < cutoff:
+        return None
+    return latest
@@ -0,0 +1,591 @@
+"""In-process list+watch cache (informer) for the kube resources behind /kubectl.
+
+Each informer does one paged LIST, then keeps a WATCH open from the returned
+resourceVersion, applying ADDED/MODIFIED/DELETED events to an in-memory store with
+namespace/node/label indexes. A 410 Gone (expired resourceVersion) triggers a relist.
+Informers start lazily on first read; until they have synced, reads go live.
+Each informer also keeps a bounded log of recent changes, so a client holding a list
+at some resourceVersion can fetch just what was added/modified/deleted since.
+"""
+
+import base64
+import bisect
+import os
+import re
+import threading
+from collections import deque
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from fastapi import HTTPException
+from kubernetes import watch
+from opsbox_common.libs.loggin import get_logger
+from prometheus_client import Counter, Gauge
+
+from app.infra.kube import ApiException, core_v1, kube
+
+KUBE_WATCH_CACHE = os.getenv("KUBE_WATCH_CACHE", "1") == "1"
+KUBE_WATCH_TIMEOUT = int(os.getenv("KUBE_WATCH_TIMEOUT", "300"))  # seconds per WATCH call
+KUBE_LIST_PAGE_SIZE = int(os.getenv("KUBE_LIST_PAGE_SIZE", "500"))
+KUBE_DELTA_HISTORY = int(os.getenv("KUBE_DELTA_HISTORY", "10000"))  # changes kept per resource
+
+CONTINUE_PREFIX = "cache:"
+
+log = get_logger(__name__)
+
+# Define metrics
+CACHE_ITEMS = Gauge("kube_watch_cache_items", "Objects held in the watch cache", ["resource"])
+CACHE_RELISTS = Counter(
+    "kube_watch_cache_relists_total", "Full LISTs issued by the watch cache", ["resource"]
+)
+KUBE_READS = Counter("kube_reads_total", "kubectl reads by source", ["resource", "source"])
+
+
+class UnsupportedSelector(ValueError):
+    """Selector the cache cannot evaluate; the caller should read live instead."""
+
+
+_REQ_RE = re.compile(
+    r"^\s*(?P<neg>!)?\s*(?P<key>[A-Za-z0-9_./-]+)\s*"
+    r"(?:(?P<op>==|!=|=|\s+in\s+|\s+notin\s+)\s*(?P<val>\([^)]*\)|[^,]*))?\s*$"
+)
+
+
+def _split_selector(selector: str) -> list[str]:
+    # split on commas that are not inside "in (a,b)" value lists
+    parts, depth, cur = [], 0, []
+    for ch in selector:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append("".join(cur))
+            cur = []
+        else:
+            cur.append(ch)
+    parts.append("".join(cur))
+    return [p for p in parts if p.strip()]
+
+
+def parse_label_selector(selector: str | None) -> list[tuple[str, str, tuple[str, ...]]]:
+    """Parse e.g. `app=api,tier!=db,env in (dev,qa),canary,!legacy` into requirements."""
+    reqs: list[tuple[str, str, tuple[str, ...]]] = []
+    for part in _split_selector(selector or ""):
+        m = _REQ_RE.match(part)
+        if not m:
+            raise UnsupportedSelector(part)
+        key, op, val = m.group("key"), (m.group("op") or "").strip(), m.group("val")
+        if m.group("neg"):
+            if op:
+                raise UnsupportedSelector(part)
+            reqs.append((key, "!", ()))
+        elif not op:
+            reqs.append((key, "exists", ()))
+        elif op in ("in", "notin"):
+            values = tuple(v.strip() for v in val.strip().strip("()").split(",") if v.strip())
+            reqs.append((key, op, values))
+        else:
+            reqs.append((key, "!=" if op == "!=" else "=", (val.strip(),)))
+    return reqs
+
+
+def match_labels(labels: dict[str, str] | None, reqs) -> bool:
+    labels = labels or {}
+    for key, op, values in reqs:
+        if op == "=" and labels.get(key) != values[0]:
+            return False
+        if op == "!=" and labels.get(key) == values[0]:
+            return False
+        if op == "in" and (key not in labels or labels[key] not in values):
+            return False
+        if op == "notin" and labels.get(key) in values:
+            return False
+        if op == "exists" and key not in labels:
+            return False
+        if op == "!" and key in labels:
+            return False
+    return True
+
+
+def parse_field_selector(selector: str | None) -> list[tuple[str, str, str]]:
+    reqs = []
+    for part in _split_selector(selector or ""):
+        for op in ("!=", "==", "="):
+            if op in part:
+                path, value = part.split(op, 1)
+                reqs.append((path.strip(), "!=" if op == "!=" else "=", value.strip()))
+                break
+        else:
+            raise UnsupportedSelector(part)
+    return reqs
+
+
+def _str(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _key(obj) -> str:
+    ns = obj.metadata.namespace
+    return f"{ns}/{obj.metadata.name}" if ns else obj.metadata.name
+
+
+class Informer:
+    def __init__(
+        self,
+        resource: str,
+        list_method: str,
+        *,
+        fields: dict[str, Callable[[Any], Any]],
+        indexers: dict[str, Callable[[Any], Iterable[str]]],
+        field_indexes: dict[str, str] | None = None,
+    ):
+        self.resource = resource
+        self.list_method = list_method
+        self.fields = fields
+        self.indexers = indexers
+        # field selector path -> index name, used to narrow candidates (e.g. spec.nodeName)
+        self.field_indexes = field_indexes or {}
+        self.resource_version: str | None = None
+
+        self._lock = threading.RLock()
+        self._items: dict[str, Any] = {}
+        self._keys: list[str] = []  # sorted like the apiserver (namespace/name)
+        self._indexes: dict[str, dict[str, set[str]]] = {name: {} for name in indexers}
+        self._synced = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._watch: watch.Watch | None = None
+        # called with (event_type, obj) for every applied change; relists replay as ADDED
+        self._listeners: list[Callable[[str, Any], None]] = []
+        # (resourceVersion, key, object before the change); key None for bookmarks
+        self._changes: deque[tuple[str, str | None, Any]] = deque(maxlen=KUBE_DELTA_HISTORY)
+        # the log is complete from this resourceVersion on
+        self._changes_floor: str | None = None
+
+    # ---------- lifecycle ----------
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name=f"informer-{self.resource}", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._watch is not None:
+            self._watch.stop()
+
+    def add_listener(self, fn: Callable[[str, Any], None]) -> None:
+        """Register `fn(event_type, obj)`; it runs on the watch thread and must not block."""
+        self._listeners.append(fn)
+
+    def _notify(self, event_type: str, obj) -> None:
+        for fn in self._listeners:
+            try:
+                fn(event_type, obj)
+            except Exception:
+                log.exception("%s listener failed", self.resource)
+
+    @property
+    def synced(self) -> bool:
+        return self._synced.is_set()
+
+    def wait_synced(self, timeout: float | None = None) -> bool:
+        return self._synced.wait(timeout)
+
+    def _list_fn(self):
+        return getattr(core_v1(), self.list_method)
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                self._relist()
+                backoff = 1.0
+                self._watch_loop()
+            except ApiException as e:
+                self._synced.clear()
+                if e.status == 410:
+                    log.info("%s watch expired (410 Gone), relisting", self.resource)
+                    continue
+                if e.status == 401:
+                    kube.reset()
+                log.warning("%s watch failed: %s %s", self.resource, e.status, e.reason)
+            except Exception:
+                self._synced.clear()
+                log.exception("%s watch failed", self.resource)
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def _relist(self) -> None:
+        CACHE_RELISTS.labels(self.resource).inc()
+        items: list[Any] = []
+        token = None
+        while True:
+            res = self._list_fn()(limit=KUBE_LIST_PAGE_SIZE, _continue=token)
+            items.extend(res.items)
+            token = res.metadata._continue
+            if not token:
+                break
+        self._replace(items, res.metadata.resource_version)
+        self._synced.set()
+
+    def _watch_loop(self) -> None:
+        while not self._stop.is_set():
+            self._watch = watch.Watch()
+            stream = self._watch.stream(
+                self._list_fn(),
+                resource_version=self.resource_version,
+                allow_watch_bookmarks=True,
+                timeout_seconds=KUBE_WATCH_TIMEOUT,
+            )
+            for ev in stream:
+                if ev["type"] == "BOOKMARK":
+                    self.bookmark(ev["raw_object"]["metadata"]["resourceVersion"])
+                    continue
+                self.apply(ev["type"], ev["object"])
+
+    # ---------- store ----------
+    def _index_add(self, key: str, obj) -> None:
+        for name, fn in self.indexers.items():
+            idx = self._indexes[name]
+            for value in fn(obj):
+                idx.setdefault(value, set()).add(key)
+
+    def _index_remove(self, key: str, obj) -> None:
+        for name, fn in self.indexers.items():
+            idx = self._indexes[name]
+            for value in fn(obj):
+                keys = idx.get(value)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del idx[value]
+
+    def _replace(self, items: list[Any], resource_version: str | None) -> None:
+        with self._lock:
+            self._items = {}
+            self._indexes = {name: {} for name in self.indexers}
+            for obj in items:
+                key = _key(obj)
+                self._items[key] = obj
+                self._index_add(key, obj)
+            self._keys = sorted(self._items)
+            self.resource_version = resource_version
+            self._changes.clear()
+            self._changes_floor = resource_version
+            CACHE_ITEMS.labels(self.resource).set(len(self._items))
+        for obj in items:
+            self._notify("ADDED", obj)
+
+    def apply(self, event_type: str, obj) -> None:
+        key = _key(obj)
+        with self._lock:
+            old = self._items.get(key)
+            if old is not None:
+                self._index_remove(key, old)
+            if event_type == "DELETED":
+                if old is not None:
+                    del self._items[key]
+                    i = bisect.bisect_left(self._keys, key)
+                    if i < len(self._keys) and self._keys[i] == key:
+                        del self._keys[i]
+            else:
+                if old is None:
+                    bisect.insort(self._keys, key)
+                self._items[key] = obj
+                self._index_add(key, obj)
+            self.resource_version = obj.metadata.resource_version
+            self._log_change(self.resource_version, key, old)
+            CACHE_ITEMS.labels(self.resource).set(len(self._items))
+        self._notify(event_type, obj)
+
+    def _log_change(self, resource_version: str | None, key: str | None, old) -> None:
+        if len(self._changes) == self._changes.maxlen:
+            self._changes_floor = self._changes[0][0]  # about to fall off
+        self._changes.append((resource_version, key, old))
+
+    def bookmark(self, resource_version: str) -> None:
+        with self._lock:
+            self.resource_version = resource_version
+            self._log_change(resource_version, None, None)
+
+    def get(self, key: str):
+        return self._items.get(key)
+
+    # ---------- queries ----------
+    def select(
+        self,
+        namespace: str | None = None,
+        label_selector: str | None = None,
+        field_selector: str | None = None,
+    ) -> list[tuple[str, Any]]:
+        """Return (key, obj) pairs matching the selectors, in apiserver order."""
+        label_reqs = parse_label_selector(label_selector)
+        field_reqs = parse_field_selector(field_selector)
+        for path, _, _ in field_reqs:
+            if path not in self.fields:
+                raise UnsupportedSelector(path)
+
+        with self._lock:
+            candidates: set[str] | None = None
+
+            def narrow(keys: set[str] | None) -> None:
+                nonlocal candidates
+                keys = keys or set()
+                candidates = set(keys) if candidates is None else candidates & keys
+
+            if namespace and "namespace" in self._indexes:
+                narrow(self._indexes["namespace"].get(namespace))
+            for path, op, value in field_reqs:
+                if op == "=" and path in self.field_indexes:
+                    narrow(self._indexes[self.field_indexes[path]].get(value))
+            if "label" in self._indexes:
+                for key, op, values in label_reqs:
+                    if op == "=":
+                        narrow(self._indexes["label"].get(f"{key}={values[0]}"))
+
+            keys = self._keys if candidates is None else sorted(candidates)
+            out = []
+            for key in keys:
+                obj = self._items[key]
+                if self._matches(obj, label_reqs, field_reqs):
+                    out.append((key, obj))
+            return out
+
+    def _matches(self, obj, label_reqs, field_reqs) -> bool:
+        if not match_labels(obj.metadata.labels, label_reqs):
+            return False
+        return not any(
+            (_str(self.fields[path](obj)) == value) != (op == "=") for path, op, value in field_reqs
+        )
+
+    def delta(
+        self,
+        since: str,
+        namespaces: list[str] | None = None,
+        label_selector: str | None = None,
+        field_selector: str | None = None,
+    ) -> tuple[list[Any], list[Any], str | None] | None:
+        """
+        (changed, deleted, resource_version) for objects matching the selectors since
+        `since`: changed holds current objects that were added/modified (or now match),
+        deleted the last state of those gone (or no longer matching). None when `since`
+        is older than the change log and the caller must list again.
+        """
+        label_reqs = parse_label_selector(label_selector)
+        field_reqs = parse_field_selector(field_selector)
+        for path, _, _ in field_reqs:
+            if path not in self.fields:
+                raise UnsupportedSelector(path)
+
+        def visible(obj) -> bool:
+            if obj is None:
+                return False
+            if namespaces is not None and obj.metadata.namespace not in namespaces:
+                return False
+            return self._matches(obj, label_reqs, field_reqs)
+
+        with self._lock:
+            if since == self._changes_floor:
+                start = 0
+            else:
+                rvs = [rv for rv, _, _ in self._changes]
+                if since not in rvs:
+                    return None
+                start = rvs.index(since) + 1
+            before: dict[str, Any] = {}
+            for i in range(start, len(self._changes)):
+                _, key, old = self._changes[i]
+                if key is not None and key not in before:
+                    before[key] = old
+            changed, deleted = [], []
+            for key in sorted(before):
+                now = self._items.get(key)
+                if visible(now):
+                    changed.append(now)
+                elif visible(before[key]):
+                    deleted.append(before[key])
+            return changed, deleted, self.resource_version
+
+    def page(
+        self,
+        namespace: str | None = None,
+        label_selector: str | None = None,
+        field_selector: str | None = None,
+        limit: int | None = None,
+        _continue: str | None = None,
+    ) -> tuple[list[Any], str | None]:
+        rows = self.select(namespace, label_selector, field_selector)
+        start = 0
+        if _continue:
+            after = decode_continue(_continue)
+            start = bisect.bisect_right([k for k, _ in rows], after)
+        page = rows[start : start + limit] if limit else rows[start:]
+        more = limit and start + limit < len(rows)
+        token = encode_continue(page[-1][0]) if more and page else None
+        return [obj for _, obj in page], token
+
+
+def encode_continue(last_key: str) -> str:
+    return CONTINUE_PREFIX + base64.urlsafe_b64encode(last_key.encode()).decode()
+
+
+def decode_continue(token: str) -> str:
+    return base64.urlsafe_b64decode(token[len(CONTINUE_PREFIX) :].encode()).decode()
+
+
+def _labels(obj) -> list[str]:
+    return [f"{k}={v}" for k, v in (obj.metadata.labels or {}).items()]
+
+
+INFORMERS: dict[str, Informer] = {
+    "pods": Informer(
+        "pods",
+        "list_pod_for_all_namespaces",
+        fields={
+            "metadata.name": lambda p: p.metadata.name,
+            "metadata.namespace": lambda p: p.metadata.namespace,
+            "spec.nodeName": lambda p: p.spec.node_name,
+            "spec.restartPolicy": lambda p: p.spec.restart_policy,
+            "spec.serviceAccountName": lambda p: p.spec.service_account_name,
+            "status.phase": lambda p: p.status.phase,
+            "status.podIP": lambda p: p.status.pod_ip,
+        },
+        indexers={
+            "namespace": lambda p: [p.metadata.namespace],
+            "node": lambda p: [p.spec.node_name] if p.spec.node_name else [],
+            "label": _labels,
+        },
+        field_indexes={"spec.nodeName": "node", "metadata.namespace": "namespace"},
+    ),
+    "nodes": Informer(
+        "nodes",
+        "list_node",
+        fields={
+            "metadata.name": lambda n: n.metadata.name,
+            "spec.unschedulable": lambda n: bool(n.spec.unschedulable),
+        },
+        indexers={"label": _labels},
+    ),
+    "namespaces": Informer(
+        "namespaces",
+        "list_namespace",
+        fields={
+            "metadata.name": lambda n: n.metadata.name,
+            "status.phase": lambda n: getattr(n.status, "phase", None),
+        },
+        indexers={"label": _labels},
+    ),
+    "events": Informer(
+        "events",
+        "list_event_for_all_namespaces",
+        fields={
+            "metadata.name": lambda e: e.metadata.name,
+            "metadata.namespace": lambda e: e.metadata.namespace,
+            "type": lambda e: e.type,
+            "reason": lambda e: e.reason,
+            "involvedObject.kind": lambda e: e.involved_object.kind,
+            "involvedObject.name": lambda e: e.involved_object.name,
+            "involvedObject.namespace": lambda e: e.involved_object.namespace,
+            "involvedObject.uid": lambda e: e.involved_object.uid,
+            "involvedObject.fieldPath": lambda e: e.involved_object.field_path,
+            "source": lambda e: getattr(e.source, "component", None),
+        },
+        indexers={"namespace": lambda e: [e.metadata.namespace], "label": _labels},
+        field_indexes={"metadata.namespace": "namespace"},
+    ),
+}
+
+
+def get_informer(resource: str) -> Informer | None:
+    """Return the (started) informer for `resource`, or None if the cache is disabled."""
+    if not KUBE_WATCH_CACHE:
+        return None
+    informer = INFORMERS[resource]
+    informer.start()
+    return informer
+
+
+def stop_all() -> None:
+    for informer in INFORMERS.values():
+        informer.stop()
+
+
+def cached_list(
+    resource: str,
+    consistent: bool = False,
+    *,
+    namespace: str | None = None,
+    label_selector: str | None = None,
+    field_selector: str | None = None,
+    limit: int | None = None,
+    _continue: str | None = None,
+) -> tuple[list[Any], str | None] | None:
+    """
+    Serve a LIST from the watch cache, or None when the caller must read live.
+    410 Gone for a continue token the cache issued while it is not synced: its store
+    may just have been cleared for a relist, and the apiserver cannot resume it either.
+    """
+    is_cache_token = bool(_continue and _continue.startswith(CONTINUE_PREFIX))
+    if consistent or (_continue and not is_cache_token):
+        KUBE_READS.labels(resource, "live").inc()
+        return None
+    informer = get_informer(resource)
+    if informer is None or not informer.synced:
+        if is_cache_token:
+            raise HTTPException(
+                status_code=410, detail="continue token expired (cache resyncing); list again"
+            )
+        KUBE_READS.labels(resource, "live").inc()
+        return None
+    try:
+        result = informer.page(namespace, label_selector, field_selector, limit, _continue)
+    except UnsupportedSelector:
+        KUBE_READS.labels(resource, "live").inc()
+        return None
+    KUBE_READS.labels(resource, "cache").inc()
+    return result
+
+
+def current_version(resource: str) -> str | None:
+    """resourceVersion of a synced cache, for clients to pass back as since_resource_version."""
+    informer = get_informer(resource)
+    return informer.resource_version if informer is not None and informer.synced else None
+
+
+def cached_delta(
+    resource: str,
+    since_resource_version: str,
+    *,
+    namespaces: list[str] | None = None,
+    label_selector: str | None = None,
+    field_selector: str | None = None,
+) -> tuple[list[Any], list[Any], str | None] | None:
+    """Changes since a resourceVersion; None when the cache cannot tell (relist instead)."""
+    informer = get_informer(resource)
+    if informer is None or not informer.synced:
+        return None
+    try:
+        result = informer.delta(since_resource_version, namespaces, label_selector, field_selector)
+    except UnsupportedSelector:
+        return None
+    KUBE_READS.labels(resource, "delta" if result is not None else "delta_expired").inc()
+    return result
+
+
+def cached_get(resource: str, key: str, consistent: bool = False):
+    """Return the cached object for `key`; None means read live (miss, cold or disabled)."""
+    informer = None if consistent else get_informer(resource)
+    obj = informer.get(key) if informer is not None and informer.synced else None
+    KUBE_READS.labels(resource, "live" if obj is None else "cache").inc()
+    return obj
@@ -3,12 +3,13 @@ import time
 from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
+from opsbox_common import database, db_metrics
 from opsbox_common.database import init_db
-from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 
-from app.routes.k8s import kubectl
-from app.routes.task import LAT, REQS
-from app.routes.task import route as task
+from app.infra import event_archive, usage_history, watch_cache
+from app.routes.k8s import kubectl, ws_kubectl
+from app.routes.task import LAT, REQS, route as task, ws_route as ws_task
 
 app = FastAPI(
     title="OpsBox API",
@@ -22,8 +23,15 @@ origins = [
     "http://127.0.0.1:3000",
 ]
 
+# DB pool metrics: the async engine serves /tasks, the sync one the event archive
+REGISTRY.register(db_metrics.registry)
+db_metrics.watch(database.async_engine.sync_engine, "async")
+db_metrics.watch(database.engine, "sync")
+
 app.include_router(task)
+app.include_router(ws_task)
 app.include_router(kubectl)
+app.include_router(ws_kubectl)
 
 app.add_middleware(
     CORSMiddleware,
@@ -39,6 +47,17 @@ app.add_middleware(
 def on_startup() -> None:
     # For dev/test convenience. In production use Alembic.
     init_db()
+    if usage_history.USAGE_COLLECTOR:
+        usage_history.collector.start()
+    if event_archive.EVENT_ARCHIVE:
+        event_archive.archiver.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown() -> None:
+    watch_cache.stop_all()
+    usage_history.collector.stop()
+    event_archive.archiver.stop()
 
 
 # Create middleware records
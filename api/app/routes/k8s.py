@@ -1,13 +1,41 @@
-from typing import Annotated
+import os
+from collections.abc import Callable
+from functools import partial
+from typing import Annotated, Any, Literal
 
-from fastapi import APIRouter, Query
+import anyio
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket
+from fastapi.responses import StreamingResponse
 
-from app.crud import k8s_events, k8s_nodes, k8s_ns, k8s_pods
+from app.crud import k8s_events, k8s_nodes, k8s_ns, k8s_pods, k8s_summary
+from app.infra.broadcast import serve_websocket, sse_stream
+from app.infra.conditional import conditional_response
+from app.infra.kube import run_kube
+from app.infra.singleflight import run_shared
+from app.infra.streaming import (
+    NDJSON_MEDIA_TYPE,
+    SSE_HEADERS,
+    SSE_MEDIA_TYPE,
+    UpstreamStreamingResponse,
+    dumps,
+    iter_pages,
+    ndjson,
+    relay,
+    sse,
+)
 
 kubectl = APIRouter(prefix="/kubectl", tags=["kubectl"])
+# the web client opens sockets under /api/ws/..., so websocket routes are mounted twice
+ws_kubectl = APIRouter(prefix="/ws/kubectl", tags=["kubectl"])
 
 
 NAMESPACE_DESC = Query(None, description="If set, get this namespace only")
+NAMESPACES_DESC = Query(
+    None, description="If set, only these namespaces; a comma separated list is queried in parallel"
+)
+NAMESPACE_SELECTOR_DESC = Query(
+    None, description="Query every namespace matching this label selector, e.g. team=payments"
+)
 LABEL_SELECTOR_DESC = Query(None, description="e.g. app=api,component=web")
 FIELD_SELECTOR_DESC = Query(None, description="e.g. status.phase=Running")
 LIMIT_DESC = Annotated[int, Query(ge=1, le=2000)]
@@ -18,111 +46,440 @@ SINCE_SECONDS_DESC = Annotated[
 SINCE_TIME_DESC = Query(
     None, description='Return events newer than this time, e.g. "2025-09-26T04:00:00Z"'
 )
+UNTIL_TIME_DESC = Query(
+    None, description='Return events older than this time, e.g. "2025-09-26T05:00:00Z"'
+)
 ONLY_WARNING_DESC = Query(False, description="Filter to type=Warning")
 INCLUDE_METRICS_DESC = Query(
     False, description="Join CPU/mem usage from metrics.k8s.io if available"
 )
+CONSISTENT_DESC = Query(
+    False, description="Bypass the watch cache and read live from the apiserver"
+)
+FIELDS_DESC = Query(
+    None,
+    description="Comma separated output fields, dotted for nested ones, e.g. "
+    "name,phase,containers.name; the rest is not computed",
+)
+# List/get results are returned as ORJSONResponse (via conditional_response): orjson
+# encodes the datetimes and nested dicts directly, skipping FastAPI's jsonable_encoder
+# walk over every item
+WINDOW_SECONDS_DESC = Annotated[
+    int, Query(ge=60, le=86400, description="History window, bounded by the buffer size")
+]
+POINTS_DESC = Annotated[int, Query(ge=2, le=500, description="Max points per series")]
+TAIL_LINES_DESC = Annotated[int, Query(ge=1, le=10000, description="Lines from the end")]
+PREVIOUS_DESC = Query(False, description="Logs of the previous (crashed) container instance")
+FOLLOW_DESC = Query(False, description="Keep streaming new lines until the client disconnects")
+LIMIT_BYTES_DESC = Annotated[
+    int, Query(ge=1, le=k8s_pods.LOG_STREAM_MAX_BYTES, description="Stop after this many bytes")
+]
+STREAM_FORMAT_DESC = Query("ndjson", description="ndjson (chunked) or sse")
+
+# all=true: upstream LIST page size and the cap on streamed items, independent of `limit`
+LIST_STREAM_PAGE_SIZE = int(os.getenv("LIST_STREAM_PAGE_SIZE", "500"))
+LIST_STREAM_MAX_ITEMS = int(os.getenv("LIST_STREAM_MAX_ITEMS", "100000"))
+ALL_PAGES_DESC = Query(
+    False, alias="all", description="Follow continue tokens server side and stream every page"
+)
+LIST_FORMAT_DESC = Query(
+    "json",
+    description='json, or ndjson: one item per line, then {"continue": token} if more remain',
+)
+SINCE_RESOURCE_VERSION_DESC = Query(
+    None,
+    description="X-Resource-Version of an earlier response: return only what was added or "
+    'modified since (items) and "deleted"; 410 when too old to tell, then list again',
+)
+MAX_ITEMS_DESC = Annotated[
+    int | None,
+    Query(ge=1, le=LIST_STREAM_MAX_ITEMS, description="With all=true, stop after N items"),
+]
+
+# Log streams hold a worker thread while waiting on the kubelet, so they get their own
+# thread budget instead of competing with the regular kube calls
+LOG_STREAM_MAX_CONCURRENT = int(os.getenv("LOG_STREAM_MAX_CONCURRENT", "32"))
+LOG_STREAM_LIMITER = anyio.CapacityLimiter(LOG_STREAM_MAX_CONCURRENT)
+
+
+async def _list_response(
+    request: Request,
+    fetch: Callable[..., dict[str, Any]],
+    *,
+    limit: int,
+    _continue: str | None,
+    all_pages: bool,
+    max_items: int | None,
+    format: str,
+    since_resource_version: str | None = None,
+):
+    """
+    A single page as JSON (with an ETag, 304 if unchanged), or a streamed body when
+    all=true / format=ndjson. Streaming holds one upstream page at a time, so memory
+    stays flat whatever the cluster size. `fetch(limit=, _continue=)` is a partial of
+    the crud function, which is what identical concurrent JSON reads are coalesced on.
+    Per-namespace fan-out failures close a stream: the "errors" key of the JSON body,
+    or a last `{"errors": ...}` ndjson record.
+    """
+    if since_resource_version and (all_pages or format != "json"):
+        raise HTTPException(
+            status_code=400, detail="since_resource_version returns a single JSON body"
+        )
+    if not all_pages and format == "json":
+        page = await run_shared(partial(fetch, limit=limit, _continue=_continue))
+        return conditional_response(request, page)
+    pages = iter_pages(
+        fetch,
+        page_size=LIST_STREAM_PAGE_SIZE if all_pages else limit,
+        max_items=(max_items or LIST_STREAM_MAX_ITEMS) if all_pages else limit,
+        _continue=_continue,
+    )
+    # the first page is read up front so bad selectors/tokens still get a proper status
+    first = await run_kube(next, pages)
+
+    async def body():
+        sent = False
+
+        def frame(items: list[Any]) -> str:
+            nonlocal sent
+            if format == "ndjson":
+                return "".join(ndjson(i) for i in items)
+            if not items:
+                return ""
+            chunk = ("," if sent else "") + ",".join(dumps(i) for i in items)
+            sent = True
+            return chunk
+
+        items, token, page_errors = first
+        # fan-out failures of every page; a namespace that failed is not retried later
+        errors = dict(page_errors) if page_errors is not None else None
+        if format == "json":
+            yield '{"items":['
+        yield frame(items)
+        # each further page is a run_kube call too: same threads, tokens and timeout
+        while token and (page := await run_kube(next, pages, None)) is not None:
+            items, token, page_errors = page
+            yield frame(items)
+            if page_errors is not None:
+                errors = {**(errors or {}), **page_errors}
+        if format == "json":
+            trailer = f',"errors":{dumps(errors)}' if errors is not None else ""
+            yield f'],"continue":{dumps(token)}{trailer}}}'
+        else:
+            if token:
+                yield ndjson({"continue": token})
+            if errors:
+                yield ndjson({"errors": errors})
+
+    media_type = NDJSON_MEDIA_TYPE if format == "ndjson" else "application/json"
+    return StreamingResponse(body(), media_type=media_type)
+
+
+@kubectl.get("/summary")
+async def get_summary(consistent: bool = CONSISTENT_DESC):
+    """
+    Dashboard KPIs: namespace count, pods by phase, node readiness, CPU/memory usage vs
+    allocatable and recent warnings, computed in one pass and cached for a few seconds
+    """
+    return await run_shared(partial(k8s_summary.get_summary, consistent=consistent))
 
 
 @kubectl.get("/namespaces")
-def get_namespace(
+async def get_namespace(
+    request: Request,
     namespace: str | None = NAMESPACE_DESC,
     label_selector: str | None = LABEL_SELECTOR_DESC,
     limit: LIMIT_DESC = 200,
     _continue: str | None = CONTINUE_DESC,
+    consistent: bool = CONSISTENT_DESC,
+    fields: str | None = FIELDS_DESC,
+    all_pages: bool = ALL_PAGES_DESC,
+    format: Literal["json", "ndjson"] = LIST_FORMAT_DESC,
+    max_items: MAX_ITEMS_DESC = None,
+    since_resource_version: str | None = SINCE_RESOURCE_VERSION_DESC,
 ):
     """
     Get details of a specific namespace.
     """
-    namespace_info = k8s_ns.get_namespaces(namespace, label_selector, limit, _continue)
-    if namespace_info:
-        return namespace_info
-    return {"error": "Namespace not found"}
+
+    fetch = partial(
+        k8s_ns.get_namespaces,
+        namespace=namespace,
+        label_selector=label_selector,
+        consistent=consistent,
+        fields=fields,
+        since_resource_version=since_resource_version,
+    )
+
+    return await _list_response(
+        request,
+        fetch,
+        limit=limit,
+        _continue=_continue,
+        all_pages=all_pages,
+        max_items=max_items,
+        format=format,
+        since_resource_version=since_resource_version,
+    )
 
 
 @kubectl.get("/pods")
-def list_pods(
-    namespace: str | None = NAMESPACE_DESC,
+async def list_pods(
+    request: Request,
+    namespace: str | None = NAMESPACES_DESC,
     label_selector: str | None = LABEL_SELECTOR_DESC,
     field_selector: str | None = FIELD_SELECTOR_DESC,
-    limit: int = LIMIT_DESC,
+    limit: LIMIT_DESC = 200,
     _continue: str | None = CONTINUE_DESC,
+    consistent: bool = CONSISTENT_DESC,
+    fields: str | None = FIELDS_DESC,
+    all_pages: bool = ALL_PAGES_DESC,
+    format: Literal["json", "ndjson"] = LIST_FORMAT_DESC,
+    max_items: MAX_ITEMS_DESC = None,
+    namespace_selector: str | None = NAMESPACE_SELECTOR_DESC,
+    since_resource_version: str | None = SINCE_RESOURCE_VERSION_DESC,
 ):
     """
     List all pods in a specific namespace.
+    With several namespaces, `limit` applies per namespace and failures are reported
+    per namespace under "errors".
     """
-    pods = k8s_pods.get_pods(namespace, label_selector, field_selector, limit, _continue)
-    if pods:
-        return pods
-    return {"error": "Pod not found"}
+
+    fetch = partial(
+        k8s_pods.get_pods,
+        namespace=namespace,
+        label_selector=label_selector,
+        field_selector=field_selector,
+        consistent=consistent,
+        fields=fields,
+        namespace_selector=namespace_selector,
+        since_resource_version=since_resource_version,
+    )
+
+    return await _list_response(
+        request,
+        fetch,
+        limit=limit,
+        _continue=_continue,
+        all_pages=all_pages,
+        max_items=max_items,
+        format=format,
+        since_resource_version=since_resource_version,
+    )
 
 
 @kubectl.get("/pods/{namespace}/{name}")
-def get_pod(
+async def get_pod(
+    request: Request,
     namespace: str,
     name: str,
+    consistent: bool = CONSISTENT_DESC,
 ):
     """
     Get details of a specific pod in a specific namespace.
     """
-    pod = k8s_pods.get_pod(namespace, name)
+    pod = await run_shared(partial(k8s_pods.get_pod, namespace, name, consistent=consistent))
     if pod:
-        return pod
+        return conditional_response(request, pod)
     return {"error": "Pod not found"}
 
 
+@kubectl.get("/pods/{namespace}/{name}/usage")
+async def get_pod_usage(
+    namespace: str,
+    name: str,
+    window_seconds: WINDOW_SECONDS_DESC = 3600,
+    points: POINTS_DESC = 60,
+):
+    """
+    CPU (cores) / memory (bytes) history of a pod from the background sampler, with p95
+    """
+    return k8s_pods.get_pod_usage(namespace, name, window_seconds, points)
+
+
+@kubectl.get("/pods/{namespace}/{name}/logs")
+async def stream_pod_logs(
+    namespace: str,
+    name: str,
+    container: str | None = None,
+    tail_lines: TAIL_LINES_DESC = 500,
+    since_seconds: SINCE_SECONDS_DESC = None,
+    previous: bool = PREVIOUS_DESC,
+    follow: bool = FOLLOW_DESC,
+    limit_bytes: LIMIT_BYTES_DESC = k8s_pods.LOG_STREAM_MAX_BYTES,
+    format: Literal["ndjson", "sse"] = STREAM_FORMAT_DESC,
+):
+    """
+    Stream container logs as NDJSON ({"ts", "line"} per line) or SSE, without buffering
+    """
+    resp = await run_kube(
+        k8s_pods.open_pod_logs,
+        namespace,
+        name,
+        container,
+        tail_lines,
+        since_seconds,
+        previous,
+        follow,
+        limit_bytes,
+    )
+    frame = sse if format == "sse" else ndjson
+
+    def close() -> None:
+        resp.close()
+        resp.release_conn()
+
+    async def body():
+        batches = k8s_pods.iter_log_batches(resp, limit_bytes)
+        async for batch in relay(batches, limiter=LOG_STREAM_LIMITER):
+            yield "".join(frame(k8s_pods.parse_log_line(raw)) for raw in batch)
+
+    if format == "sse":
+        return UpstreamStreamingResponse(
+            body(), close=close, media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS
+        )
+    return UpstreamStreamingResponse(body(), close=close, media_type=NDJSON_MEDIA_TYPE)
+
+
+@kubectl.get("/logs")
+async def stream_merged_logs(
+    namespace: str,
+    label_selector: Annotated[str, Query(description="e.g. app=api; all matching pods")],
+    container: str | None = None,
+    tail_lines: TAIL_LINES_DESC = 100,
+    since_seconds: SINCE_SECONDS_DESC = None,
+    follow: bool = FOLLOW_DESC,
+    limit_bytes: LIMIT_BYTES_DESC = k8s_pods.LOG_STREAM_MAX_BYTES,
+    format: Literal["ndjson", "sse"] = STREAM_FORMAT_DESC,
+):
+    """
+    Tail logs of every pod matching a label selector as one stream ordered by timestamp,
+    each line tagged with its pod ({"ts", "pod", "line"})
+    """
+    merged = await run_kube(
+        k8s_pods.merged_pod_logs,
+        namespace,
+        label_selector,
+        container,
+        tail_lines,
+        since_seconds,
+        follow,
+        limit_bytes,
+    )
+    frame = sse if format == "sse" else ndjson
+
+    async def body():
+        async for batch in relay(iter(merged), limiter=LOG_STREAM_LIMITER):
+            yield "".join(frame(rec) for rec in batch)
+
+    if format == "sse":
+        return UpstreamStreamingResponse(
+            body(), close=merged.close, media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS
+        )
+    return UpstreamStreamingResponse(body(), close=merged.close, media_type=NDJSON_MEDIA_TYPE)
+
+
 @kubectl.get("/nodes")
-def get_nodes(
+async def get_nodes(
+    request: Request,
     label_selector: str | None = LABEL_SELECTOR_DESC,
     field_selector: str | None = FIELD_SELECTOR_DESC,
     limit: LIMIT_DESC = 200,
     _continue: str | None = CONTINUE_DESC,
     include_metrics: bool = INCLUDE_METRICS_DESC,
+    consistent: bool = CONSISTENT_DESC,
+    fields: str | None = FIELDS_DESC,
+    all_pages: bool = ALL_PAGES_DESC,
+    format: Literal["json", "ndjson"] = LIST_FORMAT_DESC,
+    max_items: MAX_ITEMS_DESC = None,
+    since_resource_version: str | None = SINCE_RESOURCE_VERSION_DESC,
 ):
     """
     Get details of a specific node.
     """
-    node_info = k8s_nodes.list_nodes(
-        label_selector, field_selector, limit, _continue, include_metrics
+
+    fetch = partial(
+        k8s_nodes.list_nodes,
+        label_selector=label_selector,
+        field_selector=field_selector,
+        include_metrics=include_metrics,
+        consistent=consistent,
+        fields=fields,
+        since_resource_version=since_resource_version,
+    )
+
+    return await _list_response(
+        request,
+        fetch,
+        limit=limit,
+        _continue=_continue,
+        all_pages=all_pages,
+        max_items=max_items,
+        format=format,
+        since_resource_version=since_resource_version,
     )
-    if node_info:
-        return node_info
-    return {"error": "Nodes not found"}
 
 
 @kubectl.get("/nodes/{name}")
-def get_node(name: str):
-    node = k8s_nodes.get_node(name)
+async def get_node(request: Request, name: str, consistent: bool = CONSISTENT_DESC):
+    node = await run_shared(partial(k8s_nodes.get_node, name, consistent=consistent))
     if node:
-        return node
+        return conditional_response(request, node)
     return {"error": "Node not found"}
 
 
 @kubectl.get("/nodes/{name}/metrics")
-def get_node_metrics(name: str):
-    node = k8s_nodes.get_node_metrics(name)
+async def get_node_metrics(name: str):
+    node = await run_shared(k8s_nodes.get_node_metrics, name)
     if node:
         return node
     return {"error": "Node not found"}
 
 
+@kubectl.get("/nodes/{name}/usage")
+async def get_node_usage(
+    name: str,
+    window_seconds: WINDOW_SECONDS_DESC = 3600,
+    points: POINTS_DESC = 60,
+):
+    """
+    CPU (cores) / memory (bytes) history of a node from the background sampler, with p95
+    """
+    return k8s_nodes.get_node_usage(name, window_seconds, points)
+
+
 @kubectl.get("/nodes/{name}/pods")
-def list_node_pods(
+async def list_node_pods(
+    request: Request,
     name: str,
-    namespace: str | None = NAMESPACE_DESC,
+    namespace: str | None = NAMESPACES_DESC,
     label_selector: str | None = LABEL_SELECTOR_DESC,
     limit: LIMIT_DESC = 200,
     _continue: str | None = CONTINUE_DESC,
+    consistent: bool = CONSISTENT_DESC,
+    namespace_selector: str | None = NAMESPACE_SELECTOR_DESC,
 ):
-    node = k8s_nodes.list_node_pods(name, namespace, label_selector, limit, _continue)
+    node = await run_shared(
+        partial(
+            k8s_nodes.list_node_pods,
+            name,
+            namespace,
+            label_selector,
+            limit,
+            _continue,
+            consistent=consistent,
+            namespace_selector=namespace_selector,
+        )
+    )
     if node:
-        return node
+        return conditional_response(request, node)
     return {"error": "Node not found"}
 
 
 @kubectl.get("/events")
-def list_events(
-    namespace: str | None = NAMESPACE_DESC,
+async def list_events(
+    request: Request,
+    namespace: str | None = NAMESPACES_DESC,
     label_selector: str | None = LABEL_SELECTOR_DESC,
     field_selector: str | None = FIELD_SELECTOR_DESC,
     limit: LIMIT_DESC = 200,
@@ -130,17 +487,72 @@ def list_events(
     since_seconds: SINCE_SECONDS_DESC = None,
     since_time: str | None = SINCE_TIME_DESC,
     only_warning: bool = ONLY_WARNING_DESC,
+    consistent: bool = CONSISTENT_DESC,
+    fields: str | None = FIELDS_DESC,
+    all_pages: bool = ALL_PAGES_DESC,
+    format: Literal["json", "ndjson"] = LIST_FORMAT_DESC,
+    max_items: MAX_ITEMS_DESC = None,
+    namespace_selector: str | None = NAMESPACE_SELECTOR_DESC,
+    until_time: str | None = UNTIL_TIME_DESC,
+    since_resource_version: str | None = SINCE_RESOURCE_VERSION_DESC,
 ):
     """
     Get events of a specific namespace if provide or all namespace
+    Time windows are answered from the event archive (newest first), so they reach
+    past the apiserver's event TTL.
     """
-    return k8s_events.list_events(
-        namespace,
-        label_selector,
-        field_selector,
-        limit,
-        _continue,
-        since_seconds,
-        since_time,
-        only_warning,
+
+    fetch = partial(
+        k8s_events.list_events,
+        namespace=namespace,
+        label_selector=label_selector,
+        field_selector=field_selector,
+        since_seconds=since_seconds,
+        since_time=since_time,
+        only_warning=only_warning,
+        consistent=consistent,
+        fields=fields,
+        namespace_selector=namespace_selector,
+        until_time=until_time,
+        since_resource_version=since_resource_version,
+    )
+
+    return await _list_response(
+        request,
+        fetch,
+        limit=limit,
+        _continue=_continue,
+        all_pages=all_pages,
+        max_items=max_items,
+        format=format,
+        since_resource_version=since_resource_version,
     )
+
+
+@kubectl.get("/events/stream")
+def stream_events_sse(
+    namespace: str | None = NAMESPACE_DESC,
+    only_warning: bool = ONLY_WARNING_DESC,
+):
+    """
+    Server-Sent Events fallback of the live events WebSocket
+    """
+    return StreamingResponse(
+        sse_stream(k8s_events.EVENT_STREAM, (namespace or None, only_warning)),
+        media_type=SSE_MEDIA_TYPE,
+        headers=SSE_HEADERS,
+    )
+
+
+@kubectl.websocket("/events/stream")
+@ws_kubectl.websocket("/events/stream")
+async def stream_events_ws(
+    websocket: WebSocket,
+    namespace: str | None = None,
+    only_warning: bool = False,
+):
+    """
+    Live events; all clients with the same filter share one apiserver watch
+    """
+    await websocket.accept()
+    await serve_websocket(websocket, k8s_events.EVENT_STREAM, (namespace or None, only_warning))
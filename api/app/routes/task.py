@@ -1,61 +1,178 @@
+from datetime import datetime
 from typing import Annotated, TypeAlias
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from opsbox_common.database import get_db
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, WebSocket, status
+from fastapi.responses import StreamingResponse
+from opsbox_common.database import get_async_db
+from opsbox_common.models import TaskStatus
 from prometheus_client import Counter, Histogram
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.crud import task as task_crud
-from app.schemas import TaskCreate, TaskOut, TaskUpdate
+from app.infra import task_stream
+from app.infra.broadcast import serve_websocket, sse_stream
+from app.infra.streaming import SSE_HEADERS, SSE_MEDIA_TYPE
+from app.schemas import (
+    TaskBatchCreate,
+    TaskBatchCreated,
+    TaskBatchRun,
+    TaskCreate,
+    TaskJob,
+    TaskOut,
+    TaskPage,
+    TaskStats,
+    TaskUpdate,
+)
 
 # Define metrics
 REQS = Counter("api_requests_total", "API requests", ["method", "path", "status"])
 LAT = Histogram("api_request_latency_seconds", "API request latency", ["method", "path"])
 
 
-DBSession: TypeAlias = Annotated[Session, Depends(get_db)]
+DBSession: TypeAlias = Annotated[AsyncSession, Depends(get_async_db)]
 
 route = APIRouter(prefix="/tasks", tags=["tasks"])
+# the web client opens sockets under /api/ws/..., so websocket routes are mounted twice
+ws_route = APIRouter(prefix="/ws/tasks", tags=["tasks"])
+
+LIMIT_DESC = Annotated[int, Query(ge=1, le=500, description="Page size")]
+CURSOR_DESC = Query(None, description="next_cursor of the previous page")
+STATUS_DESC = Query(None, description="Only these statuses; repeat for several")
+CREATED_AFTER_DESC = Query(None, description='Created at or after, e.g. "2025-09-26T04:00:00Z"')
+CREATED_BEFORE_DESC = Query(None, description="Created strictly before")
+SORT_DESC = Query("created_at", description="Sort column; id breaks ties")
+ORDER_DESC = Query("desc", description="asc or desc")
+SEARCH_DESC = Query(
+    None,
+    min_length=1,
+    max_length=255,
+    description="Title contains this (case-insensitive); under 3 characters, starts with it",
+)
+TASK_ID_DESC = Query(None, description="Only these tasks; repeat for several")
+IDEMPOTENCY_KEY_DESC = Annotated[
+    str | None,
+    Header(
+        alias="Idempotency-Key",
+        max_length=255,
+        description="Retries with the same key get the first run's job back",
+    ),
+]
+WINDOW_DESC = Annotated[
+    int, Query(ge=1, le=1440, description="Minutes covered by throughput and durations")
+]
 
 
 @route.post("", response_model=TaskOut)
-def create_task(payload: TaskCreate, db: DBSession):
-    return task_crud.create(db, payload)
-
-
-@route.get("", response_model=list[TaskOut])
-def list_tasks(db: DBSession):
-    return task_crud.list_tasks(db)
+async def create_task(payload: TaskCreate, db: DBSession):
+    return await task_crud.create(db, payload)
+
+
+@route.post(":batch", response_model=TaskBatchCreated, status_code=status.HTTP_201_CREATED)
+async def create_tasks(payload: TaskBatchCreate, db: DBSession):
+    """
+    Create up to TASK_BATCH_MAX tasks in one INSERT and commit; returns their ids
+    """
+    return {"ids": await task_crud.create_many(db, payload.items)}
+
+
+@route.post(":run-batch", response_model=list[TaskJob], status_code=status.HTTP_201_CREATED)
+async def run_tasks(payload: TaskBatchRun, db: DBSession):
+    """
+    Claim the tasks in one UPDATE and enqueue all of them over one broker connection
+    """
+    return await task_crud.run_many(db, payload.ids)
+
+
+@route.get("", response_model=TaskPage)
+async def list_tasks(
+    db: DBSession,
+    limit: LIMIT_DESC = 100,
+    cursor: str | None = CURSOR_DESC,
+    status: list[TaskStatus] | None = STATUS_DESC,
+    created_after: datetime | None = CREATED_AFTER_DESC,
+    created_before: datetime | None = CREATED_BEFORE_DESC,
+    sort: task_crud.TaskSort = SORT_DESC,
+    order: task_crud.SortOrder = ORDER_DESC,
+    q: str | None = SEARCH_DESC,
+):
+    """
+    Tasks one page at a time, newest first by default; follow `next_cursor` for more.
+    With `q`, matching tasks only: exact titles, then prefixes, then the rest
+    """
+    return await task_crud.list_tasks_cached(
+        db, limit, cursor, status, created_after, created_before, sort, order, q
+    )
+
+
+@route.get("/stats", response_model=TaskStats)
+async def get_task_stats(db: DBSession, window_minutes: WINDOW_DESC = 15):
+    """
+    Task counts by status, throughput, success ratio and run durations, from counters
+    """
+    return await task_crud.stats(db, window_minutes)
+
+
+@route.get("/stream")
+def stream_tasks_sse(
+    task_id: list[UUID] | None = TASK_ID_DESC,
+    status: list[TaskStatus] | None = STATUS_DESC,
+):
+    """
+    Server-Sent Events of task status changes; with task_id, their current state first
+    """
+    match, initial = task_stream.subscription(task_id, status)
+    return StreamingResponse(
+        sse_stream(task_stream.TASK_STREAM, task_stream.TOPIC, match, initial),
+        media_type=SSE_MEDIA_TYPE,
+        headers=SSE_HEADERS,
+    )
+
+
+@route.websocket("/stream")
+@ws_route.websocket("/stream")
+async def stream_tasks_ws(
+    websocket: WebSocket,
+    task_id: list[UUID] | None = TASK_ID_DESC,
+    status: list[TaskStatus] | None = STATUS_DESC,
+):
+    """
+    Task status changes; all clients of an API pod share one database listener
+    """
+    match, initial = task_stream.subscription(task_id, status)
+    await websocket.accept()
+    await serve_websocket(websocket, task_stream.TASK_STREAM, task_stream.TOPIC, match, initial)
 
 
 @route.get("/{task_id}", response_model=TaskOut)
-def get_task(task_id: UUID, db: DBSession):
-    task = task_crud.get_task(db, task_id)
+async def get_task(task_id: UUID, db: DBSession):
+    task = await task_crud.get_task_cached(db, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     return task
 
 
 @route.put("/{task_id}", response_model=TaskOut)
-def update_task(task_id: UUID, payload: TaskUpdate, db: DBSession):
-    task = task_crud.update(db, task_id, payload)
+async def update_task(task_id: UUID, payload: TaskUpdate, db: DBSession):
+    task = await task_crud.update(db, task_id, payload)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     return task
 
 
 @route.delete("/{task_id}", response_model=dict)
-def delete_task(task_id: UUID, db: DBSession):
-    status = task_crud.delete(db, task_id)
+async def delete_task(task_id: UUID, db: DBSession):
+    status = await task_crud.delete(db, task_id)
     if not status:
         raise HTTPException(status_code=404, detail="Task not found")
     return {"status": "deleted"}
 
 
-@route.post("/{task_id}/run", status_code=status.HTTP_201_CREATED)
-def run_task_endpoint(task_id: UUID, db: DBSession):
-    task = get_task(task_id, db)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    return task_crud.run_task(db, task_id)
+@route.post("/{task_id}/run", response_model=TaskJob, status_code=status.HTTP_201_CREATED)
+async def run_task_endpoint(
+    task_id: UUID, db: DBSession, idempotency_key: IDEMPOTENCY_KEY_DESC = None
+):
+    """
+    Claim a NEW task (-> PENDING) and enqueue its run; 409 once claimed, 404 if unknown
+    """
+    return await task_crud.run_task(db, task_id, idempotency_key)
@@ -4,6 +4,20 @@ from opsbox_common.settings import CELERY_QUEUE
 celery_client = make_celery("opsbox")
 
 
-def enqueue_run_task(task_id: str) -> str:
-    r = celery_client.send_task("tasks.run_task", args=[task_id], queue=CELERY_QUEUE)
+def enqueue_run_task(task_id: str, job_id: str | None = None) -> str:
+    """Publish one run message; `job_id` sets the Celery task id (else a fresh one)."""
+    r = celery_client.send_task(
+        "tasks.run_task", args=[task_id], queue=CELERY_QUEUE, task_id=job_id
+    )
     return r.id
+
+
+def enqueue_run_tasks(task_ids: list[str]) -> list[str]:
+    """Publish one run message per task over a single broker connection and channel."""
+    with celery_client.producer_or_acquire() as producer:
+        return [
+            celery_client.send_task(
+                "tasks.run_task", args=[task_id], queue=CELERY_QUEUE, producer=producer
+            ).id
+            for task_id in task_ids
+        ]
@@ -1,8 +1,12 @@
+import os
 from datetime import datetime
+from typing import Annotated
 from uuid import UUID
 
 from opsbox_common.models import TaskStatus
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
+
+TASK_BATCH_MAX = int(os.getenv("TASK_BATCH_MAX", "10000"))
 
 
 # Table for tasks
@@ -27,3 +31,38 @@ class TaskOut(BaseModel):
     result: str | None
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class TaskBatchCreate(BaseModel):
+    items: Annotated[list[TaskCreate], Field(min_length=1, max_length=TASK_BATCH_MAX)]
+
+
+class TaskBatchCreated(BaseModel):
+    ids: list[UUID]  # in the order of the request items
+
+
+class TaskBatchRun(BaseModel):
+    ids: Annotated[list[UUID], Field(min_length=1, max_length=TASK_BATCH_MAX)]
+
+
+class TaskJob(BaseModel):
+    task_id: UUID
+    job_id: str
+
+
+class TaskPage(BaseModel):
+    items: list[TaskOut]
+    # pass back as `cursor` for the next page; None on the last one
+    next_cursor: str | None
+
+
+class TaskStats(BaseModel):
+    counts: dict[TaskStatus, int]
+    total: int
+    # the rest covers tasks finished within the last window_minutes
+    window_minutes: int
+    completed: int
+    throughput_per_minute: float
+    success_ratio: float | None
+    duration_p50_seconds: float | None  # estimated from duration buckets
+    duration_p95_seconds: float | None
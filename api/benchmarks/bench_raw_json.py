@@ -0,0 +1,108 @@
+"""Model vs raw-JSON path for a large pod LIST, end to end (parse -> project -> encode).
+
+Run from the repo root:  PYTHONPATH=shared:api python api/benchmarks/bench_raw_json.py [pods]
+"""
+
+import datetime
+import json
+import sys
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from kubernetes import client
+
+from app.crud.k8s_pods import _pod, _pod_raw
+from app.infra.kube import json_body
+
+
+class _Response:
+    """Stands in for the urllib3 response of a `_preload_content=False` call."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def release_conn(self) -> None:
+        pass
+
+
+def _fake_pod(i: int) -> dict:
+    t = datetime.datetime(2025, 9, 26, 4, 0, tzinfo=datetime.UTC).isoformat()
+    container = {
+        "name": "app",
+        "image": "registry.local/web:1.2.3",
+        "resources": {
+            "requests": {"cpu": "100m", "memory": "128Mi"},
+            "limits": {"cpu": "500m", "memory": "256Mi"},
+        },
+        "env": [{"name": f"VAR_{k}", "value": "x" * 20} for k in range(10)],
+    }
+    return {
+        "metadata": {
+            "name": f"web-{i}",
+            "namespace": "dev",
+            "uid": f"uid-{i}",
+            "resourceVersion": str(1000 + i),
+            "creationTimestamp": t,
+            "labels": {"app": "web", "pod-template-hash": "abc123"},
+            "annotations": {"prometheus.io/scrape": "true"},
+            "ownerReferences": [
+                {"apiVersion": "apps/v1", "kind": "ReplicaSet", "name": "web", "uid": "rs"}
+            ],
+        },
+        "spec": {"nodeName": f"node-{i % 10}", "containers": [container, dict(container)]},
+        "status": {
+            "phase": "Running",
+            "startTime": t,
+            "qosClass": "Burstable",
+            "hostIP": "10.0.0.1",
+            "podIP": "10.1.0.1",
+            "conditions": [{"type": "Ready", "status": "True", "lastTransitionTime": t}],
+            "containerStatuses": [
+                {
+                    "name": "app",
+                    "image": "registry.local/web:1.2.3",
+                    "imageID": "sha256:abc",
+                    "ready": True,
+                    "restartCount": 0,
+                    "state": {"running": {"startedAt": t}},
+                }
+            ]
+            * 2,
+        },
+    }
+
+
+def main(n: int = 2000, rounds: int = 5) -> None:
+    body = json.dumps(
+        {"kind": "PodList", "metadata": {}, "items": [_fake_pod(i) for i in range(n)]}
+    ).encode()
+    api = client.ApiClient()
+
+    class _Rest:
+        data = body
+
+    def model_path() -> bytes:
+        res = api.deserialize(_Rest, "V1PodList")
+        out = {"items": [_pod(p) for p in res.items], "continue": res.metadata._continue}
+        return JSONResponse(jsonable_encoder(out)).body
+
+    def raw_path() -> bytes:
+        data = json_body(_Response(body))
+        out = {"items": [_pod_raw(p) for p in data["items"]], "continue": None}
+        return ORJSONResponse(out).body
+
+    assert model_path() == raw_path(), "outputs differ"
+    for name, fn in (("model", model_path), ("raw", raw_path)):
+        best = min(_timed(fn) for _ in range(rounds))
+        print(f"{name:>5}: {best * 1000:8.1f} ms for {n} pods ({len(body) / 1e6:.1f} MB)")
+
+
+def _timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -1,5 +1,5 @@
 # shared/opsbox_common/__init__.py
-from .database import SessionLocal, get_db, init_db
+from .database import AsyncSessionLocal, SessionLocal, get_async_db, get_db, init_db
 from .models import Base, Task, TaskStatus
 from .settings import (
     BROKER_URL,
@@ -25,6 +25,8 @@ __all__ = [
     "DATABASE_URL",
     "CELERY_RESULT_BACKEND",
     "SessionLocal",
+    "AsyncSessionLocal",
     "get_db",
+    "get_async_db",
     "init_db",
 ]
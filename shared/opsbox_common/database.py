@@ -1,14 +1,70 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 from contextlib import contextmanager
+from typing import Any
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
-from .settings import DATABASE_URL
+from . import db_metrics
+from .settings import (
+    ASYNC_DATABASE_URL,
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_PGBOUNCER,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+)
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# async drivers for the sync URLs we deploy with; psycopg 3 serves both
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "psycopg"}
+
+
+def async_url(url: str) -> str:
+    """DATABASE_URL with its driver swapped for the async one of the same backend."""
+    u = make_url(url)
+    driver = ASYNC_DRIVERS.get(u.get_backend_name())
+    if driver is None:
+        return url
+    return u.set(drivername=f"{u.get_backend_name()}+{driver}").render_as_string(
+        hide_password=False
+    )
+
+
+def engine_options(url: str, is_async: bool = False) -> dict[str, Any]:
+    """create_engine kwargs for the DB_POOL_* / DB_PGBOUNCER settings."""
+    if make_url(url).get_backend_name() != "postgresql":
+        return {"pool_pre_ping": DB_POOL_PRE_PING}  # SQLite keeps SQLAlchemy's default pool
+    if DB_PGBOUNCER:
+        # PgBouncer pools the server connections; prepared statements do not survive
+        # transaction pooling, so psycopg must never prepare
+        return {
+            "poolclass": db_metrics.TimedAsyncNullPool if is_async else db_metrics.TimedNullPool,
+            "connect_args": {"prepare_threshold": None},
+        }
+    return {
+        "poolclass": db_metrics.TimedAsyncQueuePool if is_async else db_metrics.TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+# API only; the worker stays on the sync engine above
+_async_database_url = ASYNC_DATABASE_URL or async_url(DATABASE_URL)
+async_engine = create_async_engine(
+    _async_database_url, **engine_options(_async_database_url, is_async=True)
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -34,6 +90,12 @@ def get_db() -> Generator:
         db.close()
 
 
+# FastAPI dependency (async routes)
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     from . import models  # noqa: F401
 
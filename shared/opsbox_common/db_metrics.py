@@ -0,0 +1,83 @@
+"""Prometheus metrics for the SQLAlchemy connection pools.
+
+Kept in a registry of their own so the API (default registry) and the worker (its own
+registry) can both export them: `registry.register(db_metrics.registry)`. Checked-out
+and overflow connections are read from the pool at scrape time; checkout wait is timed
+by the pool classes below, which the engines in `database` are built with.
+"""
+
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, Pool, QueuePool
+
+# Define metrics
+registry = CollectorRegistry()
+POOL_SIZE = Gauge("db_pool_size", "Configured pool size", ["engine"], registry=registry)
+CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections currently checked out", ["engine"], registry=registry
+)
+OVERFLOW = Gauge(
+    "db_pool_overflow", "Connections open beyond the pool size", ["engine"], registry=registry
+)
+CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time to get a connection from the pool (a new connection without a pool)",
+    ["engine"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    registry=registry,
+)
+CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts_total",
+    "Checkouts that gave up after DB_POOL_TIMEOUT",
+    ["engine"],
+    registry=registry,
+)
+
+
+class TimedCheckout:
+    """Pool mixin observing how long `_do_get` (wait for, or open, a connection) takes."""
+
+    engine_label = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            CHECKOUT_TIMEOUTS.labels(self.engine_label).inc()
+            raise
+        finally:
+            CHECKOUT_WAIT.labels(self.engine_label).observe(time.perf_counter() - start)
+
+
+class TimedQueuePool(TimedCheckout, QueuePool):
+    engine_label = "sync"
+
+
+class TimedNullPool(TimedCheckout, NullPool):
+    engine_label = "sync"
+
+
+class TimedAsyncQueuePool(TimedCheckout, AsyncAdaptedQueuePool):
+    engine_label = "async"
+
+
+class TimedAsyncNullPool(TimedCheckout, NullPool):
+    engine_label = "async"
+
+
+def watch(engine, label: str) -> None:
+    """Export size/checked-out/overflow of `engine`'s pool, read at scrape time."""
+
+    def pool() -> Pool:
+        return engine.pool  # replaced by dispose(), so looked up on every scrape
+
+    if not isinstance(engine.pool, QueuePool):
+        return  # NullPool holds nothing; the checkout histogram still applies
+    POOL_SIZE.labels(label).set_function(lambda: pool().size())
+    CHECKED_OUT.labels(label).set_function(lambda: pool().checkedout())
+    # overflow() counts up from -pool_size
+    OVERFLOW.labels(label).set_function(lambda: max(pool().overflow(), 0))
+    CHECKOUT_TIMEOUTS.labels(label).inc(0)
@@ -2,7 +2,19 @@ import enum
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, Enum, String
+from sqlalchemy import (
+    DDL,
+    BigInteger,
+    Column,
+    DateTime,
+    Enum,
+    Index,
+    Integer,
+    SmallInteger,
+    String,
+    Text,
+    event,
+)
 from sqlalchemy.dialects.postgresql import UUID
 
 from .database import Base
@@ -17,10 +29,118 @@ class TaskStatus(enum.Enum):
 
 
 class Task(Base):
+    # on Postgres, Alembic range-partitions the table by created_at (c4e8a2f61d57) with
+    # primary key (id, created_at); ids are uuid4s, so the ORM keeps id as the key
     __tablename__ = "tasks"
+    __table_args__ = (
+        # keyset pagination of GET /tasks: (sort column, id), optionally within a status
+        Index("ix_tasks_created_at_id", "created_at", "id"),
+        Index("ix_tasks_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_tasks_updated_at_id", "updated_at", "id"),
+        # GET /tasks?q=: prefix and substring matches on title (pg_trgm, created below)
+        Index(
+            "ix_tasks_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     title = Column(String(255), index=True)
     status = Column(Enum(TaskStatus, name="task_status"), default=TaskStatus.NEW, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     result = Column(String(255), default=None, nullable=True)
+
+
+event.listen(
+    Task.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+
+# Postgres NOTIFY on every task status change, whoever writes it (API or worker);
+# the API's /tasks/stream listens on this channel. Migration 5a7c3e9d1b20 for Alembic.
+TASK_STATUS_CHANNEL = "task_status"
+TASK_STATUS_NOTIFY_SQL = f"""
+CREATE OR REPLACE FUNCTION tasks_notify_status() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{TASK_STATUS_CHANNEL}', json_build_object(
+        'id', NEW.id, 'status', NEW.status, 'result', NEW.result, 'updated_at', NEW.updated_at
+    )::text);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tasks_notify_status
+AFTER UPDATE OF status ON tasks
+FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+EXECUTE FUNCTION tasks_notify_status();
+"""
+event.listen(
+    Task.__table__, "after_create", DDL(TASK_STATUS_NOTIFY_SQL).execute_if(dialect="postgresql")
+)
+
+
+class K8sEvent(Base):
+    """Archived Kubernetes event, one row per event uid (count/last seen kept up to date)."""
+
+    __tablename__ = "k8s_events"
+    __table_args__ = (
+        Index("ix_k8s_events_last_seen", "last_seen"),
+        Index("ix_k8s_events_namespace_last_seen", "namespace", "last_seen"),
+        Index("ix_k8s_events_reason_last_seen", "reason", "last_seen"),
+    )
+    uid = Column(String(64), primary_key=True)
+    namespace = Column(String(253), nullable=True)
+    name = Column(String(253), nullable=False)
+    type = Column(String(32), nullable=True)
+    reason = Column(String(128), nullable=True)
+    message = Column(Text, nullable=True)
+    count = Column(Integer, nullable=True)
+    first_timestamp = Column(DateTime(timezone=True), nullable=True)
+    last_timestamp = Column(DateTime(timezone=True), nullable=True)
+    event_time = Column(DateTime(timezone=True), nullable=True)
+    # last_timestamp, else event_time, else first_timestamp: what time windows filter on
+    last_seen = Column(DateTime(timezone=True), nullable=False)
+    involved_kind = Column(String(64), nullable=True)
+    involved_name = Column(String(253), nullable=True)
+    involved_namespace = Column(String(253), nullable=True)
+    involved_uid = Column(String(64), nullable=True)
+    involved_field_path = Column(String(253), nullable=True)
+    source_component = Column(String(253), nullable=True)
+    source_host = Column(String(253), nullable=True)
+    reporting_controller = Column(String(253), nullable=True)
+    reporting_instance = Column(String(253), nullable=True)
+
+
+class TaskStatusCount(Base):
+    """Number of tasks per status, kept up to date by every writer (see task_stats)."""
+
+    __tablename__ = "task_status_counts"
+    status = Column(String(16), primary_key=True)
+    shard = Column(SmallInteger, primary_key=True, default=0)  # summed on read
+    count = Column(BigInteger, nullable=False, default=0)
+
+
+class TaskStatsMinute(Base):
+    """Tasks finished per minute, status and run-duration bucket."""
+
+    __tablename__ = "task_stats_minutes"
+    minute = Column(DateTime, primary_key=True)  # naive UTC, truncated to the minute
+    status = Column(String(16), primary_key=True)
+    bucket = Column(SmallInteger, primary_key=True)  # index into task_stats.BUCKETS
+    count = Column(BigInteger, nullable=False, default=0)
+
+
+class TaskRunKey(Base):
+    """Idempotency-Key of a POST /tasks/{id}/run that claimed its task, and the job it got."""
+
+    __tablename__ = "task_run_keys"
+    __table_args__ = (Index("ix_task_run_keys_created_at", "created_at"),)
+    key = Column(String(255), primary_key=True)
+    # no foreign key: tasks' primary key is (id, created_at) once partitioned
+    task_id = Column(UUID(as_uuid=True), nullable=False)
+    job_id = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)  # for retention
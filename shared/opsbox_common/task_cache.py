@@ -0,0 +1,73 @@
+"""Keys and invalidation of the Redis task read cache (off unless TASK_CACHE_URL is set).
+
+The API caches single tasks under `task_key(id)` and list pages under
+`list_key(generation, params)`. Every write drops the keys of the tasks it touched and
+bumps the list generation, so list pages cached before the write are never read
+again and just expire. A task is only stored if the generation is still the one read
+before loading it (SET_IF_GENERATION): a load that raced a write must not put the
+task back after the write dropped it. Both the API (async) and the worker (sync, below) invalidate;
+a cache that is down only costs the read-through, never a write.
+"""
+
+import hashlib
+import json
+from collections.abc import Iterable
+from typing import Any
+
+from redis import Redis, RedisError
+
+from .libs.loggin import get_logger
+from .settings import TASK_CACHE_URL
+
+PREFIX = "opsbox:tasks:"
+GENERATION_KEY = PREFIX + "generation"
+SOCKET_TIMEOUT = 0.5  # seconds; a slow cache must not be slower than the database
+
+# KEYS: task key, GENERATION_KEY; ARGV: value, ttl, generation read before the load
+SET_IF_GENERATION = """
+if (redis.call('GET', KEYS[2]) or '0') == ARGV[3] then
+    return redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+end
+return false
+"""
+
+log = get_logger(__name__)
+
+_client: Redis | None = None
+
+
+def enabled() -> bool:
+    return bool(TASK_CACHE_URL)
+
+
+def task_key(task_id: Any) -> str:
+    return f"{PREFIX}task:{task_id}"
+
+
+def list_key(generation: int, params: dict[str, Any]) -> str:
+    raw = json.dumps(params, sort_keys=True, default=str).encode()
+    return f"{PREFIX}list:{generation}:{hashlib.blake2b(raw, digest_size=16).hexdigest()}"
+
+
+def client() -> Redis:
+    global _client
+    if _client is None:
+        _client = Redis.from_url(
+            TASK_CACHE_URL, socket_timeout=SOCKET_TIMEOUT, socket_connect_timeout=SOCKET_TIMEOUT
+        )
+    return _client
+
+
+def invalidate(task_ids: Iterable[Any] = ()) -> None:
+    """Drop the cached tasks and every cached list page (sync, for the worker)."""
+    if not enabled():
+        return
+    keys = [task_key(i) for i in task_ids]
+    try:
+        pipe = client().pipeline(transaction=False)
+        if keys:
+            pipe.delete(*keys)
+        pipe.incr(GENERATION_KEY)
+        pipe.execute()
+    except RedisError:
+        log.warning("task cache invalidation failed; entries expire by TTL", exc_info=True)
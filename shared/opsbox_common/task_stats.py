@@ -0,0 +1,200 @@
+"""Incrementally maintained task statistics, for GET /tasks/stats.
+
+Every write that creates, deletes or changes the status of tasks also executes, in
+the same transaction, the statements built here: per-status counter upserts on
+`task_status_counts` and, when a task finishes, +1 in its minute's run-duration
+bucket of `task_stats_minutes` (duration = updated_at - created_at). Reading the
+stats is then a handful of rows whatever the size of `tasks`. The writers are the API
+crud, the worker's run_task_imp and retention; `reconcile`, run periodically by the
+worker, recounts the table to repair drift from writes made any other way.
+
+Each status has TASK_STATS_COUNTER_SHARDS counter rows, summed on read, and a write
+upserts into one of them picked at random, so concurrent task writers rarely wait on
+each other's row locks. A transaction records its changes in one call, hence one
+shard, where rows are upserted in status order: two transitions in opposite
+directions (NEW -> PENDING and PENDING -> NEW) lock them in the same order and cannot
+deadlock.
+"""
+
+import bisect
+import math
+import random
+from collections import Counter
+from collections.abc import Iterable, Mapping
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import BigInteger, cast, delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .models import Task, TaskStatsMinute, TaskStatus, TaskStatusCount
+from .settings import TASK_STATS_COUNTER_SHARDS
+
+FINISHED = (TaskStatus.SUCCEEDED, TaskStatus.FAILED)
+# upper bounds (seconds) of the run-duration buckets
+BUCKETS = (1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 21600, math.inf)
+
+
+def _insert(dialect: str):
+    return pg_insert if dialect == "postgresql" else sqlite_insert
+
+
+def _value(status: TaskStatus | str) -> str:
+    return status.value if isinstance(status, TaskStatus) else status
+
+
+def bucket(seconds: float) -> int:
+    return bisect.bisect_left(BUCKETS, seconds)
+
+
+def count_changes(dialect: str, deltas: Mapping[TaskStatus | str, int]) -> list[Any]:
+    """Upsert adding `deltas` ({status: +n/-n}) to the counters of one random shard."""
+    shard = random.randrange(TASK_STATS_COUNTER_SHARDS)
+    # status order: the lock order of the counter rows, the same for every writer
+    rows = sorted(
+        ({"status": _value(s), "shard": shard, "count": n} for s, n in deltas.items() if n),
+        key=lambda row: row["status"],
+    )
+    if not rows:
+        return []
+    stmt = _insert(dialect)(TaskStatusCount).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TaskStatusCount.status, TaskStatusCount.shard],
+        set_={"count": TaskStatusCount.count + stmt.excluded["count"]},
+    )
+    return [stmt]
+
+
+def finished(
+    dialect: str, status: TaskStatus, created_at: datetime, finished_at: datetime
+) -> list[Any]:
+    """Upsert counting one task that reached `status` at `finished_at`."""
+    seconds = max((finished_at - created_at).total_seconds(), 0.0)
+    stmt = _insert(dialect)(TaskStatsMinute).values(
+        minute=finished_at.replace(second=0, microsecond=0),
+        status=_value(status),
+        bucket=bucket(seconds),
+        count=1,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TaskStatsMinute.minute, TaskStatsMinute.status, TaskStatsMinute.bucket],
+        set_={"count": TaskStatsMinute.count + 1},
+    )
+    return [stmt]
+
+
+def transition(
+    dialect: str,
+    before: TaskStatus | None,
+    after: TaskStatus | None,
+    created_at: datetime | None = None,
+    at: datetime | None = None,
+) -> list[Any]:
+    """Statements recording one task going from `before` to `after` (None: no task)."""
+    if before == after:
+        return []
+    deltas: Counter[TaskStatus] = Counter()
+    if before is not None:
+        deltas[before] -= 1
+    if after is not None:
+        deltas[after] += 1
+    stmts = count_changes(dialect, deltas)
+    if after in FINISHED and created_at is not None and at is not None:
+        stmts += finished(dialect, after, created_at, at)
+    return stmts
+
+
+def removed(dialect: str, statuses: Iterable[TaskStatus | str]) -> list[Any]:
+    """Statements recording the deletion of tasks with these statuses."""
+    deltas = Counter(_value(s) for s in statuses)
+    return count_changes(dialect, {s: -n for s, n in deltas.items()})
+
+
+def record(db: Session, stmts: list[Any]) -> None:
+    """Execute the statements above in `db`'s transaction (sync sessions)."""
+    for stmt in stmts:
+        db.execute(stmt)
+
+
+# ---------- reads ----------
+# bigint sums are numeric in Postgres: cast back for plain ints
+COUNTS = select(TaskStatusCount.status, cast(func.sum(TaskStatusCount.count), BigInteger)).group_by(
+    TaskStatusCount.status
+)
+
+
+def window_query(since: datetime):
+    return (
+        select(TaskStatsMinute.status, TaskStatsMinute.bucket, func.sum(TaskStatsMinute.count))
+        .where(TaskStatsMinute.minute >= since)
+        .group_by(TaskStatsMinute.status, TaskStatsMinute.bucket)
+    )
+
+
+def quantile(histogram: Mapping[int, int], q: float) -> float | None:
+    """Estimate of the q-quantile from bucket counts, interpolating inside the bucket."""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank, seen = q * total, 0
+    for i, upper in enumerate(BUCKETS):
+        n = histogram.get(i, 0)
+        if n and seen + n >= rank:
+            lower = BUCKETS[i - 1] if i else 0.0
+            if math.isinf(upper):
+                return float(lower)  # no upper bound to interpolate towards
+            return lower + (upper - lower) * (rank - seen) / n
+        seen += n
+    return None
+
+
+def summarize(
+    counts: Iterable[tuple[str, int]], window: Iterable[tuple[str, int, int]], minutes: int
+) -> dict[str, Any]:
+    """The /tasks/stats body from the counter rows and the window's bucket rows."""
+    by_status = {s.value: 0 for s in TaskStatus}
+    by_status.update({status: max(n, 0) for status, n in counts})
+    histogram: Counter[int] = Counter()
+    done: Counter[str] = Counter()
+    for status, b, n in window:
+        histogram[b] += n
+        done[status] += n
+    completed = sum(done.values())
+    succeeded = done[TaskStatus.SUCCEEDED.value]
+    return {
+        "counts": by_status,
+        "total": sum(by_status.values()),
+        "window_minutes": minutes,
+        "completed": completed,
+        "throughput_per_minute": completed / minutes,
+        "success_ratio": succeeded / completed if completed else None,
+        "duration_p50_seconds": quantile(histogram, 0.5),
+        "duration_p95_seconds": quantile(histogram, 0.95),
+    }
+
+
+# ---------- reconciliation ----------
+def reconcile(db: Session, now: datetime, history: timedelta) -> dict[str, int]:
+    """Correct the counters from a recount of `tasks`; prune minutes older than `history`.
+
+    Returns the corrections applied ({status: actual - counted}).
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        # both reads from one snapshot, so the drift is exact as of it; it is then
+        # applied as an increment, keeping whatever writers committed since
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    recount = select(Task.status, func.count()).group_by(Task.status)
+    actual = {_value(s): n for s, n in db.execute(recount)}
+    counted = dict(db.execute(COUNTS).all())
+    db.commit()
+
+    statuses = {s.value for s in TaskStatus} | set(counted)
+    drift = {s: actual.get(s, 0) - counted.get(s, 0) for s in statuses}
+    for stmt in count_changes(dialect, drift):
+        db.execute(stmt)
+    db.execute(delete(TaskStatsMinute).where(TaskStatsMinute.minute < now - history))
+    db.commit()
+    return {s: d for s, d in drift.items() if d}
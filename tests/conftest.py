@@ -1,18 +1,24 @@
 import pytest
-from opsbox_common.database import Base, get_db
+from opsbox_common.database import Base, get_async_db, get_db
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
 from api.app.main import app
 
 
 @pytest.fixture(scope="session")
-def test_engine():
+def db_path(tmp_path_factory):
+    # a file, so the sync engine and the async (aiosqlite) one see the same tables
+    return tmp_path_factory.mktemp("db") / "test.db"
+
+
+@pytest.fixture(scope="session")
+def test_engine(db_path):
     engine = create_engine(
-        "sqlite+pysqlite:///:memory:",
+        f"sqlite+pysqlite:///{db_path}",
         connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
         future=True,
     )
     Base.metadata.create_all(bind=engine)
@@ -20,6 +26,13 @@ def test_engine():
     engine.dispose()
 
 
+@pytest.fixture(scope="session")
+def async_test_engine(db_path, test_engine):
+    # NullPool: TestClient runs every request on a fresh event loop
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool)
+    yield engine
+
+
 @pytest.fixture
 def db_session(test_engine):
     TestingSessionLocal = sessionmaker(
@@ -33,13 +46,22 @@ def db_session(test_engine):
 
 
 @pytest.fixture(autouse=True)
-def test_override_dependency(db_session):
+def test_override_dependency(db_session, async_test_engine):
+    TestingAsyncSessionLocal = async_sessionmaker(
+        bind=async_test_engine, autoflush=False, expire_on_commit=False
+    )
+
     def _get_db_override():
         try:
             yield db_session
         finally:
             pass
 
+    async def _get_async_db_override():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
+
     app.dependency_overrides[get_db] = _get_db_override
+    app.dependency_overrides[get_async_db] = _get_async_db_override
     yield
     app.dependency_overrides.clear()
@@ -0,0 +1,797 @@
+import asyncio
+import datetime
+import json
+import threading
+import time
+from functools import partial
+
+import pytest
+from dateutil.tz import tzutc
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.testclient import TestClient
+from kubernetes import client, config
+from opsbox_common import database
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import ClientDisconnect
+
+from api.app.main import app
+from app.crud import k8s_events, k8s_nodes, k8s_ns, k8s_pods, k8s_summary
+from app.infra import event_archive, kube as kube_infra, singleflight, usage_history, watch_cache
+from app.infra.broadcast import SLOW_CONSUMER, Subscriber
+from app.infra.streaming import UpstreamStreamingResponse
+from app.routes import k8s as k8s_routes
+
+
+def test_client_manager_loads_config_once(monkeypatch):
+    loads = []
+
+    def fake_incluster(client_configuration=None, **_):
+        loads.append(client_configuration)
+        client_configuration.host = "https://kube.test"
+
+    monkeypatch.setattr(config, "load_incluster_config", fake_incluster)
+    manager = kube_infra.KubeClientManager(pool_maxsize=7)
+
+    v1 = manager.core_v1()
+    co = manager.custom_objects()
+
+    assert len(loads) == 1
+    assert v1.api_client is co.api_client is manager.api_client
+    assert manager.api_client.configuration.connection_pool_maxsize == 7
+    assert manager.pool_stats() == {"in_use": 0, "idle": 0}
+
+    manager.reset()
+    manager.core_v1()
+    assert len(loads) == 2
+
+
+def test_timed_out_kube_call_keeps_its_token_until_the_thread_ends():
+    limiter = kube_infra.KUBE_LIMITER
+    unblock = threading.Event()
+
+    async def scenario():
+        before = limiter.borrowed_tokens
+        with pytest.raises(HTTPException) as e:
+            await kube_infra.run_kube(unblock.wait, 5, timeout=0.1)
+        assert e.value.status_code == 504
+        # the caller gave up, the thread is still in the call and still counts
+        assert limiter.borrowed_tokens == before + 1
+        unblock.set()
+        for _ in range(200):
+            if limiter.borrowed_tokens == before:
+                break
+            await asyncio.sleep(0.01)
+        assert limiter.borrowed_tokens == before
+        assert await kube_infra.run_kube(lambda: "ok") == "ok"
+        assert limiter.borrowed_tokens == before
+
+    asyncio.run(scenario())
+
+
+def test_client_manager_falls_back_to_kubeconfig(monkeypatch):
+    def no_incluster(client_configuration=None, **_):
+        raise config.ConfigException("not in a pod")
+
+    used = []
+    monkeypatch.setattr(config, "load_incluster_config", no_incluster)
+    monkeypatch.setattr(
+        config, "load_kube_config", lambda client_configuration=None, **_: used.append(1)
+    )
+
+    kube_infra.KubeClientManager().core_v1()
+    assert used == [1]
+
+
+def _pod(name, ns="default", node="node-a", phase="Running", labels=None, rv="1"):
+    return client.V1Pod(
+        metadata=client.V1ObjectMeta(
+            name=name, namespace=ns, labels=labels or {}, resource_version=rv
+        ),
+        spec=client.V1PodSpec(
+            node_name=node, containers=[client.V1Container(name="c", image="busybox")]
+        ),
+        status=client.V1PodStatus(phase=phase),
+    )
+
+
+def _pods_informer():
+    spec = watch_cache.INFORMERS["pods"]
+    return watch_cache.Informer(
+        "pods",
+        spec.list_method,
+        fields=spec.fields,
+        indexers=spec.indexers,
+        field_indexes=spec.field_indexes,
+    )
+
+
+def test_informer_applies_events_and_indexes():
+    inf = _pods_informer()
+    inf._replace(
+        [
+            _pod("api-1", labels={"app": "api"}),
+            _pod("api-2", node="node-b", labels={"app": "api", "canary": "1"}),
+            _pod("db-0", ns="data", phase="Pending", labels={"app": "db"}),
+        ],
+        "10",
+    )
+    inf.apply("ADDED", _pod("api-3", node="node-b", labels={"app": "api"}, rv="11"))
+    inf.apply("DELETED", _pod("api-1", rv="12"))
+    assert inf.resource_version == "12"
+
+    names = [o.metadata.name for _, o in inf.select(label_selector="app=api")]
+    assert names == ["api-2", "api-3"]
+    assert [o.metadata.name for _, o in inf.select(field_selector="spec.nodeName=node-b")] == [
+        "api-2",
+        "api-3",
+    ]
+    assert [o.metadata.name for _, o in inf.select(label_selector="app in (db),!canary")] == [
+        "db-0"
+    ]
+    pending = inf.select("data", field_selector="status.phase!=Running")
+    assert [o.metadata.name for _, o in pending] == ["db-0"]
+    assert inf.select(namespace="default", label_selector="canary") == [
+        ("default/api-2", inf.get("default/api-2"))
+    ]
+
+
+def test_informer_pages_with_cache_continue_token():
+    inf = _pods_informer()
+    inf._replace([_pod(f"p-{i}") for i in range(5)], "1")
+
+    first, token = inf.page(limit=2)
+    assert [p.metadata.name for p in first] == ["p-0", "p-1"]
+    assert token.startswith(watch_cache.CONTINUE_PREFIX)
+    second, token = inf.page(limit=2, _continue=token)
+    third, token = inf.page(limit=2, _continue=token)
+    assert [p.metadata.name for p in second + third] == ["p-2", "p-3", "p-4"]
+    assert token is None
+
+
+def test_get_pods_serves_from_synced_cache(monkeypatch):
+    inf = _pods_informer()
+    inf._replace([_pod("api-1", labels={"app": "api"}), _pod("web-1")], "5")
+    inf._synced.set()
+    monkeypatch.setattr(watch_cache, "get_informer", lambda resource: inf)
+
+    def live_read():
+        raise AssertionError("should not hit the apiserver")
+
+    monkeypatch.setattr(k8s_pods, "core_v1", live_read)
+    out = k8s_pods.get_pods(None, "app=api", None, 200, None, False)
+    assert [p["name"] for p in out["items"]] == ["api-1"]
+    assert out["continue"] is None
+    assert k8s_pods.get_pod("default", "web-1", False)["name"] == "web-1"
+
+    # unsupported field selector or consistent=true reads live
+    assert watch_cache.cached_list("pods", field_selector="spec.hostNetwork=true") is None
+    assert watch_cache.cached_list("pods", consistent=True) is None
+
+    # a token from the cache while it resyncs: 410, not a page from a half-filled store
+    _, token = watch_cache.cached_list("pods", limit=1)
+    inf._synced.clear()
+    with pytest.raises(HTTPException) as e:
+        watch_cache.cached_list("pods", limit=1, _continue=token)
+    assert e.value.status_code == 410
+    assert watch_cache.cached_list("pods", limit=1) is None  # a fresh list reads live
+
+
+def test_events_websocket_shares_one_upstream(monkeypatch):
+    started = []
+
+    def fake_producer(key, publish, stop):
+        started.append(key)
+        publish('{"reason": "BackOff"}')
+        publish('{"reason": "Failed"}')
+        stop.wait(5)
+
+    monkeypatch.setattr(k8s_events.EVENT_STREAM, "producer", fake_producer)
+    client_ = TestClient(app)
+    with (
+        client_.websocket_connect("/kubectl/events/stream?namespace=dev&only_warning=true") as a,
+        client_.websocket_connect("/ws/kubectl/events/stream?namespace=dev&only_warning=true") as b,
+    ):
+        first = a.receive_json()
+        items = first if isinstance(first, list) else [first, a.receive_json()]
+        assert [i["reason"] for i in items] == ["BackOff", "Failed"]
+        b.send_text('{"type":"ping"}')
+    assert started.count(("dev", True)) >= 1
+    assert k8s_events.EVENT_STREAM.topics().get(("dev", True), 0) == 0
+
+
+def test_slow_subscriber_is_dropped():
+    async def scenario():
+        sub = Subscriber("test", maxsize=2)
+        for i in range(5):
+            sub.offer(str(i))
+        return sub.dropped, await sub.next_batch()
+
+    dropped, batch = asyncio.run(scenario())
+    assert dropped and batch == [SLOW_CONSUMER]
+
+
+class _FakeLogResponse:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def stream(self, amt):
+        yield from self.chunks
+
+    def close(self):
+        self.closed = True
+
+    def release_conn(self):
+        pass
+
+
+def test_pod_logs_stream_as_ndjson(monkeypatch):
+    resp = _FakeLogResponse(
+        [b"2025-09-26T04:00:00Z first\n2025-09-26T04:00:01Z sec", b"ond\nno timestamp\n"]
+    )
+    calls = []
+
+    def fake_open(*args):
+        calls.append(args)
+        return resp
+
+    monkeypatch.setattr(k8s_pods, "open_pod_logs", fake_open)
+    r = TestClient(app).get("/kubectl/pods/dev/web-1/logs?tail_lines=10&follow=true")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert lines == [
+        {"ts": "2025-09-26T04:00:00Z", "line": "first"},
+        {"ts": "2025-09-26T04:00:01Z", "line": "second"},
+        {"ts": None, "line": "no timestamp"},
+    ]
+    assert calls[0][:2] == ("dev", "web-1") and calls[0][6] is True
+    assert resp.closed
+
+
+def test_log_upstream_closed_when_client_leaves_before_the_body():
+    closed = []
+
+    async def body():
+        yield "never sent"
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("client went away")
+
+    response = UpstreamStreamingResponse(body(), close=lambda: closed.append(True))
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(response(scope, receive, send))
+    assert closed == [True]
+
+
+def test_pod_logs_stop_at_byte_budget():
+    resp = _FakeLogResponse([b"a\n" * 4, b"b\n" * 4, b"c\n"])
+    batches = list(k8s_pods.iter_log_batches(resp, max_bytes=8))
+    assert batches == [[b"a"] * 4]
+
+
+def test_merged_logs_are_ordered_across_pods(monkeypatch):
+    streams = {
+        "web-1": [b"2025-09-26T04:00:00.5Z a1\n2025-09-26T04:00:02Z a2\n"],
+        "web-2": [b"2025-09-26T04:00:00.25Z b1\n", b"2025-09-26T04:00:01Z b2\n"],
+        "web-3": [],
+    }
+    opened = []
+
+    def fake_open(namespace, name, *args):
+        opened.append(name)
+        if name == "web-3":
+            raise HTTPException(status_code=400, detail="container is waiting to start")
+        return _FakeLogResponse(streams[name])
+
+    monkeypatch.setattr(k8s_pods, "open_pod_logs", fake_open)
+    merged = k8s_pods.MergedPodLogs("dev", sorted(streams), max_concurrent=2).start()
+    try:
+        records = [rec for batch in merged for rec in batch]
+    finally:
+        merged.close()
+    assert sorted(opened) == ["web-1", "web-2", "web-3"]
+    assert {"ts": None, "pod": "web-3", "error": "container is waiting to start"} in records
+    lines = [(r["pod"], r["line"]) for r in records if "line" in r]
+    assert lines == [("web-2", "b1"), ("web-1", "a1"), ("web-2", "b2"), ("web-1", "a2")]
+
+
+def test_slow_kube_call_times_out_without_blocking_api(monkeypatch):
+    release = threading.Event()
+
+    def slow_get_pod(namespace, name, consistent):
+        release.wait(5)
+        return {"name": name}
+
+    monkeypatch.setattr(k8s_pods, "get_pod", slow_get_pod)
+    monkeypatch.setattr(kube_infra, "KUBE_CALL_TIMEOUT", 0.2)
+    client_ = TestClient(app)
+    try:
+        r = client_.get("/kubectl/pods/dev/web-1")
+        assert r.status_code == 504
+        assert client_.get("/health").status_code == 200
+    finally:
+        release.set()
+
+
+def _node(name, ready=True, cpu="4", memory="8Gi"):
+    return client.V1Node(
+        metadata=client.V1ObjectMeta(name=name),
+        status=client.V1NodeStatus(
+            allocatable={"cpu": cpu, "memory": memory},
+            conditions=[client.V1NodeCondition(type="Ready", status="True" if ready else "False")],
+        ),
+    )
+
+
+def test_summary_aggregates_once_per_ttl(monkeypatch):
+    now = datetime.datetime.now(datetime.UTC)
+    warning = client.CoreV1Event(
+        metadata=client.V1ObjectMeta(name="e1", namespace="dev"),
+        involved_object=client.V1ObjectReference(kind="Pod", name="web-1"),
+        type="Warning",
+        reason="BackOff",
+        last_timestamp=now,
+    )
+    stale = client.CoreV1Event(
+        metadata=client.V1ObjectMeta(name="e2", namespace="dev"),
+        involved_object=client.V1ObjectReference(kind="Pod", name="web-1"),
+        type="Warning",
+        reason="Failed",
+        last_timestamp=now - datetime.timedelta(hours=1),
+    )
+    objects = {
+        "namespaces": [client.V1Namespace(metadata=client.V1ObjectMeta(name="dev"))],
+        "pods": [_pod("a"), _pod("b"), _pod("c", phase="Pending")],
+        "nodes": [_node("n1"), _node("n2", ready=False)],
+        "events": [warning, stale],
+    }
+    lists = []
+
+    def fake_cached_list(resource, consistent=False, **kwargs):
+        assert not k8s_summary._lock.locked()  # kube reads run outside the lock
+        lists.append(resource)
+        return objects[resource], None
+
+    monkeypatch.setattr(watch_cache, "cached_list", fake_cached_list)
+    monkeypatch.setattr(
+        k8s_summary, "_node_usage", lambda: {"n1": {"cpu": "500m", "memory": "1Gi"}}
+    )
+    monkeypatch.setattr(k8s_summary, "_cached", None)
+
+    client_ = TestClient(app)
+    body = client_.get("/kubectl/summary").json()
+    assert body["namespaces"] == 1
+    assert body["pods"] == {"total": 3, "by_phase": {"Running": 2, "Pending": 1}}
+    assert body["nodes"] == {"total": 2, "ready": 1, "not_ready": 1}
+    assert body["cpu"] == {"allocatable": 8.0, "usage": 0.5}
+    assert body["memory"]["usage"] == 1024**3
+    assert body["warnings"]["total"] == 1
+    assert body["warnings"]["top_reasons"] == {"BackOff": 1}
+
+    client_.get("/kubectl/summary")
+    assert len(lists) == 4  # second call served from the TTL cache
+
+
+def test_node_list_fields_with_metrics(monkeypatch):
+    monkeypatch.setattr(
+        watch_cache, "cached_list", lambda *a, **k: ([_node("n1"), _node("n2", ready=False)], None)
+    )
+    monkeypatch.setattr(
+        k8s_nodes, "_node_usage_map", lambda: {"n1": {"cpu": "500m", "memory": "1024Ki"}}
+    )
+
+    client_ = TestClient(app)
+    body = client_.get("/kubectl/nodes?fields=ready&include_metrics=true").json()
+    assert body["items"] == [
+        {"ready": True, "usage": {"cpu": "500m", "memory": "1024Ki"}},
+        {"ready": False, "usage": None},
+    ]
+    body = client_.get("/kubectl/nodes?fields=name&include_metrics=true").json()
+    assert body["items"][0] == {"name": "n1", "usage": {"cpu": "500m", "memory": "1024Ki"}}
+
+
+def test_usage_ring_buffer_wraps_and_reports_p95():
+    buf = usage_history.RingBuffer(4)
+    for i in range(6):
+        buf.append(float(i), float(i), float(i * 10))
+    ts, cpu, memory = buf.window(0.0)
+    assert list(ts) == [2.0, 3.0, 4.0, 5.0]
+    assert list(memory) == [20.0, 30.0, 40.0, 50.0]
+    assert usage_history.p95(cpu) == 5.0
+    assert usage_history.downsample(ts, cpu, 2) == [(3.0, 2.5), (5.0, 4.5)]
+
+
+def test_usage_history_endpoint(monkeypatch):
+    collector = usage_history.UsageCollector(interval=15, history_size=8)
+    now = time.time()
+    for i in range(10):
+        collector.record("pods", "dev/web-1", now - 10 + i, 0.1 * i, 1024.0 * i)
+    monkeypatch.setattr(usage_history, "collector", collector)
+
+    client_ = TestClient(app)
+    body = client_.get("/kubectl/pods/dev/web-1/usage?points=4").json()
+    assert body["samples"] == 8
+    assert body["cpu"]["latest"] == pytest.approx(0.9)
+    assert body["memory"]["max"] == 9216.0
+    assert len(body["cpu"]["points"]) == 4
+    assert client_.get("/kubectl/nodes/node-a/usage").status_code == 404
+
+    collector.evict(now + 1)
+    assert collector.latest("pods") == {}
+
+
+def _rich_pod(i):
+    started = datetime.datetime(2025, 9, 26, 4, 0, i % 60, tzinfo=tzutc())
+    return client.V1Pod(
+        metadata=client.V1ObjectMeta(
+            name=f"web-{i}",
+            namespace="dev",
+            labels={"app": "web"},
+            annotations={"note": "naïve ✓"},
+            creation_timestamp=started,
+        ),
+        spec=client.V1PodSpec(
+            node_name="node-a",
+            containers=[
+                client.V1Container(
+                    name="app",
+                    image="web:1",
+                    resources=client.V1ResourceRequirements(requests={"cpu": "100m"}),
+                ),
+                client.V1Container(name="sidecar", image="envoy:1"),
+                client.V1Container(name="init", image="busybox"),
+            ],
+        ),
+        status=client.V1PodStatus(
+            phase="Running",
+            start_time=started,
+            qos_class="Burstable",
+            host_ip="10.0.0.1",
+            pod_ip="10.1.0.7",
+            container_statuses=[
+                client.V1ContainerStatus(
+                    name="app",
+                    image="web:1",
+                    image_id="x",
+                    ready=True,
+                    restart_count=2,
+                    state=client.V1ContainerState(
+                        running=client.V1ContainerStateRunning(started_at=started)
+                    ),
+                ),
+                client.V1ContainerStatus(
+                    name="sidecar",
+                    image="envoy:1",
+                    image_id="y",
+                    ready=False,
+                    restart_count=0,
+                    state=client.V1ContainerState(
+                        terminated=client.V1ContainerStateTerminated(
+                            exit_code=1, reason="Error", finished_at=started
+                        )
+                    ),
+                ),
+            ],
+        ),
+    )
+
+
+def _rich_node():
+    t = datetime.datetime(2025, 9, 1, tzinfo=tzutc())
+    return client.V1Node(
+        metadata=client.V1ObjectMeta(name="node-a", labels={"zone": "a"}, creation_timestamp=t),
+        spec=client.V1NodeSpec(taints=[client.V1Taint(key="k", effect="NoSchedule")]),
+        status=client.V1NodeStatus(
+            addresses=[client.V1NodeAddress(type="InternalIP", address="10.0.0.1")],
+            capacity={"cpu": "4"},
+            allocatable={"cpu": "3900m"},
+            conditions=[
+                client.V1NodeCondition(type="Ready", status="True", last_transition_time=t)
+            ],
+            images=[client.V1ContainerImage(names=["web:1"], size_bytes=123)],
+            node_info=client.V1NodeSystemInfo(
+                architecture="amd64",
+                boot_id="b",
+                container_runtime_version="containerd://1.7",
+                kernel_version="6.1",
+                kube_proxy_version="v1.31",
+                kubelet_version="v1.31",
+                machine_id="m",
+                operating_system="linux",
+                os_image="Debian",
+                system_uuid="u",
+            ),
+        ),
+    )
+
+
+def _rich_event():
+    t = datetime.datetime(2025, 9, 26, 4, 0, tzinfo=tzutc())
+    return client.CoreV1Event(
+        metadata=client.V1ObjectMeta(name="web-1.abc", namespace="dev"),
+        involved_object=client.V1ObjectReference(
+            kind="Pod", name="web-1", namespace="dev", uid="u1", field_path="spec.containers{app}"
+        ),
+        type="Warning",
+        reason="BackOff",
+        message="Back-off restarting",
+        count=3,
+        first_timestamp=t,
+        last_timestamp=t,
+        event_time=datetime.datetime(2025, 9, 26, 4, 0, 0, 123456, tzinfo=tzutc()),
+        source=client.V1EventSource(component="kubelet", host="node-a"),
+        reporting_component="kubelet",
+    )
+
+
+def test_raw_json_projections_match_model_output():
+    raw = client.ApiClient().sanitize_for_serialization
+    ns = client.V1Namespace(
+        metadata=client.V1ObjectMeta(
+            name="dev", creation_timestamp=datetime.datetime(2025, 1, 1, tzinfo=tzutc())
+        ),
+        status=client.V1NamespaceStatus(phase="Active"),
+    )
+    pairs = [
+        (k8s_pods._pod(_rich_pod(1)), k8s_pods._pod_raw(raw(_rich_pod(1)))),
+        (k8s_nodes._node_summary(_rich_node()), k8s_nodes._node_summary_raw(raw(_rich_node()))),
+        (
+            k8s_events._event_to_dict(_rich_event()),
+            k8s_events._event_raw_to_dict(raw(_rich_event())),
+        ),
+        (k8s_ns._ns(ns), k8s_ns._ns_raw(raw(ns))),
+    ]
+    for model_out, raw_out in pairs:
+        # byte-identical to what the default JSONResponse produced before
+        assert ORJSONResponse(raw_out).body == JSONResponse(jsonable_encoder(model_out)).body
+        assert ORJSONResponse(model_out).body == JSONResponse(jsonable_encoder(model_out)).body
+
+
+def test_live_pod_list_parses_raw_json(monkeypatch):
+    pods = {
+        "kind": "PodList",
+        "metadata": {"continue": "abc"},
+        "items": [client.ApiClient().sanitize_for_serialization(_rich_pod(i)) for i in range(3)],
+    }
+
+    class FakeResponse:
+        data = json.dumps(pods).encode()
+
+        def release_conn(self):
+            pass
+
+    class FakeV1:
+        def list_namespaced_pod(self, **kwargs):
+            assert kwargs["_preload_content"] is False
+            return FakeResponse()
+
+    monkeypatch.setattr(k8s_pods, "core_v1", lambda: FakeV1())
+    out = k8s_pods.get_pods("dev", None, None, 3, None, True)
+    assert out["continue"] == "abc"
+    assert out["items"] == [k8s_pods._pod(_rich_pod(i)) for i in range(3)]
+
+
+def test_sparse_fieldsets(monkeypatch):
+    now = datetime.datetime.now(datetime.UTC)
+    fresh, stale = _rich_event(), _rich_event()
+    fresh.last_timestamp = fresh.event_time = fresh.first_timestamp = now
+    objects = {"pods": [_rich_pod(1)], "events": [fresh, stale]}
+    monkeypatch.setattr(
+        watch_cache, "cached_list", lambda resource, *a, **kw: (objects[resource], None)
+    )
+    client_ = TestClient(app)
+
+    pods = client_.get("/kubectl/pods?fields=name,containers.name,containers.state.state")
+    assert pods.json()["items"] == [
+        {
+            "name": "web-1",
+            "containers": [
+                {"name": "app", "state": {"state": "Running"}},
+                {"name": "sidecar", "state": {"state": "Terminated"}},
+                {"name": "init", "state": {"state": "Unknown"}},
+            ],
+        }
+    ]
+    # time filtering still works when the timestamps are not part of the fieldset
+    events = client_.get("/kubectl/events?fields=reason,involved_object.name&since_seconds=60")
+    assert events.json()["items"] == [{"reason": "BackOff", "involved_object": {"name": "web-1"}}]
+
+    bad = client_.get("/kubectl/pods?fields=name,bogus")
+    assert bad.status_code == 400 and "bogus" in bad.json()["detail"]
+
+
+def test_all_pages_stream_follows_continue_tokens(monkeypatch):
+    pods = [_pod(f"web-{i}") for i in range(7)]
+    pages = []
+
+    def fake_cached_list(resource, consistent=False, *, limit=None, _continue=None, **kw):
+        start = int(_continue or 0)
+        pages.append(limit)
+        end = start + limit
+        return pods[start:end], (str(end) if end < len(pods) else None)
+
+    kube_calls = []
+    real_run_kube = k8s_routes.run_kube
+
+    async def counting_run_kube(func, *args, timeout=None):
+        kube_calls.append(func)
+        return await real_run_kube(func, *args, timeout=timeout)
+
+    monkeypatch.setattr(watch_cache, "cached_list", fake_cached_list)
+    monkeypatch.setattr(k8s_routes, "LIST_STREAM_PAGE_SIZE", 3)
+    monkeypatch.setattr(k8s_routes, "run_kube", counting_run_kube)
+    client_ = TestClient(app)
+
+    r = client_.get("/kubectl/pods?all=true&format=ndjson&fields=name")
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in r.text.splitlines()] == [
+        {"name": f"web-{i}"} for i in range(7)
+    ]
+    assert pages == [3, 3, 3]
+    # every page, not just the first, goes through run_kube (its tokens and timeout)
+    assert kube_calls == [next, next, next]
+
+    # capped: the last page is shortened so the token resumes right after the cap
+    pages.clear()
+    body = client_.get("/kubectl/pods?all=true&max_items=4&fields=name").json()
+    assert [p["name"] for p in body["items"]] == ["web-0", "web-1", "web-2", "web-3"]
+    assert body["continue"] == "4" and pages == [3, 1]
+
+    # a single page can be streamed too; the trailer carries the token
+    lines = client_.get("/kubectl/pods?format=ndjson&limit=5&fields=name").text.splitlines()
+    assert len(lines) == 6 and json.loads(lines[-1]) == {"continue": "5"}
+
+
+def test_namespace_fan_out_merges_and_reports_errors(monkeypatch):
+    pods = {ns: [_pod(f"{ns}-{i}", ns=ns) for i in range(3)] for ns in ("dev", "prod")}
+
+    def fake_cached_list(resource, consistent=False, *, namespace=None, limit=None, **kw):
+        if resource == "namespaces":
+            return [client.V1Namespace(metadata=client.V1ObjectMeta(name="prod"))], None
+        if namespace == "secret":
+            raise kube_infra.ApiException(status=403, reason="Forbidden")
+        start = int(kw.get("_continue") or 0)
+        end = start + limit
+        return pods[namespace][start:end], (str(end) if end < 3 else None)
+
+    monkeypatch.setattr(watch_cache, "cached_list", fake_cached_list)
+    monkeypatch.setattr(k8s_ns, "core_v1", lambda: None)
+    client_ = TestClient(app)
+
+    body = client_.get("/kubectl/pods?namespace=secret,prod,dev&limit=2&fields=name").json()
+    assert [p["name"] for p in body["items"]] == ["dev-0", "dev-1", "prod-0", "prod-1"]
+    body_errors = {"secret": {"status": 403, "message": "Forbidden"}}
+    assert body["errors"] == body_errors
+    # the composite token resumes every namespace that has more
+    body = client_.get(
+        f"/kubectl/pods?namespace=secret,prod,dev&limit=2&fields=name&_continue={body['continue']}"
+    ).json()
+    assert [p["name"] for p in body["items"]] == ["dev-2", "prod-2"]
+    assert body["continue"] is None
+
+    # streamed lists report the failed namespaces at the end too
+    url = "/kubectl/pods?namespace=secret,prod,dev&limit=2&fields=name"
+    streamed = client_.get(url + "&all=true").json()
+    assert len(streamed["items"]) == 6 and streamed["errors"] == body_errors
+    lines = client_.get(url + "&all=true&format=ndjson").text.splitlines()
+    assert json.loads(lines[-1]) == {"errors": body_errors}
+
+    # selector-matched namespaces are intersected with the explicit list
+    body = client_.get("/kubectl/pods?namespace=dev,prod&namespace_selector=tier=prod").json()
+    assert {p["namespace"] for p in body["items"]} == {"prod"}
+
+    r = client_.get("/kubectl/pods?namespace=secret,secret2")
+    assert r.status_code == 403 and set(r.json()["detail"]["errors"]) == {"secret", "secret2"}
+
+
+def test_event_archive_dedupes_and_serves_time_windows(monkeypatch, test_engine):
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=test_engine))
+    monkeypatch.setattr(event_archive, "serving", lambda: True)
+    t0 = datetime.datetime(2025, 9, 26, 4, 0, tzinfo=tzutc())
+
+    def event(uid, minutes, ns="dev", count=1):
+        e = _rich_event()
+        e.metadata.uid, e.metadata.namespace, e.count = uid, ns, count
+        e.last_timestamp = t0 + datetime.timedelta(minutes=minutes)
+        return e
+
+    archiver = event_archive.EventArchiver(flush_seconds=0.01)
+    for ev in (event("a", 0), event("b", 10), event("c", 20, ns="prod"), event("a", 30, count=4)):
+        archiver.offer("ADDED", ev)
+    archiver.offer("ADDED", event("a", 5, count=2))  # stale replay: must not win
+    archiver.offer("DELETED", event("d", 40))  # TTL expiry upstream: ignored
+    archiver.write(list(archiver._drain().values()))
+    archiver.write([event_archive.event_row(event("a", 5, count=2))])
+
+    client_ = TestClient(app)
+    url = "/kubectl/events?since_time=2025-09-26T04:00:00Z&fields=namespace,count,last_timestamp"
+    page = client_.get(url + "&limit=2").json()
+    assert [i["count"] for i in page["items"]] == [4, 1]  # newest first, "a" updated in place
+    assert page["items"][0]["last_timestamp"] == "2025-09-26T04:30:00+00:00"
+    rest = client_.get(url + f"&limit=2&_continue={page['continue']}").json()
+    assert [i["namespace"] for i in rest["items"]] == ["dev"] and rest["continue"] is None
+
+    window = client_.get(url + "&namespace=dev,prod&until_time=2025-09-26T04:25:00Z").json()
+    assert [i["namespace"] for i in window["items"]] == ["prod", "dev"]
+    assert window["errors"] == {}
+
+
+def test_lists_are_conditional_and_support_deltas(monkeypatch):
+    inf = _pods_informer()
+    inf._replace([_pod("api-1", labels={"app": "api"}), _pod("web-1")], "5")
+    inf._synced.set()
+    monkeypatch.setattr(watch_cache, "get_informer", lambda resource: inf)
+    client_ = TestClient(app)
+
+    first = client_.get("/kubectl/pods?label_selector=app=api&fields=name,phase")
+    etag, rv = first.headers["etag"], first.headers["x-resource-version"]
+    assert rv == "5" and "resource_version" not in first.json()
+    again = client_.get(
+        "/kubectl/pods?label_selector=app=api&fields=name,phase", headers={"If-None-Match": etag}
+    )
+    assert again.status_code == 304 and not again.content
+
+    inf.apply("MODIFIED", _pod("api-1", labels={"app": "api"}, phase="Failed", rv="6"))
+    inf.apply("ADDED", _pod("api-2", labels={"app": "api"}, rv="7"))
+    inf.apply("MODIFIED", _pod("web-1", phase="Failed", rv="8"))  # not selected
+    inf.apply("MODIFIED", _pod("api-2", labels={"app": "old"}, rv="9"))  # left the selector
+    inf.bookmark("10")
+
+    changed = client_.get(
+        "/kubectl/pods?label_selector=app=api&fields=name,phase", headers={"If-None-Match": etag}
+    )
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+    delta = client_.get(
+        f"/kubectl/pods?label_selector=app=api&fields=name,phase&since_resource_version={rv}"
+    )
+    assert delta.json() == {
+        "items": [{"name": "api-1", "phase": "Failed"}],
+        "deleted": [],  # api-2 came and went within the window
+        "continue": None,
+    }
+    assert delta.headers["x-resource-version"] == "10"
+    # from rv 7 api-2 was visible, so its relabel is a deletion for this selector
+    delta = client_.get("/kubectl/pods?label_selector=app=api&since_resource_version=7").json()
+    assert delta["items"] == [] and delta["deleted"] == [{"namespace": "default", "name": "api-2"}]
+    nothing = client_.get("/kubectl/pods?since_resource_version=10").json()
+    assert nothing["items"] == [] and nothing["deleted"] == []
+
+    assert client_.get("/kubectl/pods?since_resource_version=3").status_code == 410
+    assert client_.get("/kubectl/pods?since_resource_version=5&all=true").status_code == 400
+
+    # a namespace selector matching nothing selects nothing, not every namespace
+    monkeypatch.setattr(k8s_pods, "resolve_namespaces", lambda namespace, selector: [])
+    none = client_.get("/kubectl/pods?namespace_selector=tier=none&since_resource_version=5")
+    assert none.json()["items"] == [] and none.json()["deleted"] == []
+
+
+def test_identical_concurrent_reads_share_one_upstream_call():
+    calls = []
+
+    def slow_list(namespace=None, limit=200, _continue=None, consistent=False):
+        calls.append(namespace)
+        time.sleep(0.2)
+        return {"items": [namespace], "continue": None}
+
+    async def burst():
+        same = [
+            singleflight.run_shared(partial(slow_list, namespace="dev", limit=50)) for _ in range(5)
+        ]
+        other = singleflight.run_shared(partial(slow_list, namespace="prod", limit=50))
+        fresh = singleflight.run_shared(partial(slow_list, namespace="dev", consistent=True))
+        return await asyncio.gather(*same, other, fresh)
+
+    before = singleflight.CALLS.labels("slow_list", "coalesced")._value.get()
+    results = asyncio.run(burst())
+    assert sorted(calls) == ["dev", "dev", "prod"]  # shared, other key, consistent read
+    assert all(r is results[0] for r in results[:5])
+    assert singleflight.CALLS.labels("slow_list", "coalesced")._value.get() - before == 4
+    assert not singleflight._inflight
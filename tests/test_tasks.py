@@ -1,6 +1,19 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from uuid import UUID
+
 from fastapi.testclient import TestClient
+from opsbox_common import database, db_metrics, task_cache as shared_task_cache, task_stats
+from opsbox_common.models import Task, TaskRunKey, TaskStatus, TaskStatusCount
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
 
 from api.app.main import app
+from app.crud import task as task_crud
+from app.infra import task_cache, task_stream
+from worker.app import job_logic, retention
 
 client = TestClient(app)
 
@@ -29,7 +42,7 @@ def test_list_and_update_and_delete():
     # list
     L = client.get("/tasks/")
     assert L.status_code == 200
-    items = L.json()
+    items = L.json()["items"]
     assert len(items) >= 2
     ids = [i["id"] for i in items]
     assert t1["id"] in ids and t2["id"] in ids
@@ -59,3 +72,351 @@ def test_put_not_found():
         json={"title": "test11", "status": "SUCCEEDED", "result": "ok"},
     )
     assert r.status_code == 404
+
+
+def test_list_paginates_filters_and_orders(db_session):
+    created = [client.post("/tasks", json={"title": f"page-{i}"}).json() for i in range(5)]
+    # same created_at for two rows: id breaks the tie without skipping or repeating
+    tie = db_session.get(Task, UUID(created[1]["id"])).created_at
+    db_session.get(Task, UUID(created[2]["id"])).created_at = tie
+    db_session.get(Task, UUID(created[4]["id"])).status = TaskStatus.FAILED
+    db_session.commit()
+    ids = {t["id"] for t in created}
+
+    def walk(**params):
+        seen, cursor = [], None
+        while True:
+            page = client.get("/tasks", params={**params, "limit": 2, "cursor": cursor}).json()
+            assert len(page["items"]) <= 2
+            seen += [t["id"] for t in page["items"] if t["id"] in ids]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return seen
+
+    newest_first = walk()
+    assert sorted(newest_first) == sorted(ids) and len(newest_first) == 5
+    assert walk(order="asc") == newest_first[::-1]
+    assert walk(status="FAILED") == [created[4]["id"]]
+    assert set(walk(status=["NEW", "FAILED"])) == ids
+
+    since = created[3]["created_at"]
+    assert set(walk(created_after=since, order="asc")) >= {created[3]["id"], created[4]["id"]}
+
+    first = client.get("/tasks", params={"limit": 1}).json()
+    mismatch = client.get("/tasks", params={"cursor": first["next_cursor"], "order": "asc"})
+    assert mismatch.status_code == 400
+    assert client.get("/tasks", params={"cursor": "nope"}).status_code == 400
+
+
+def test_search_ranks_and_paginates():
+    titles = ["Zq-deploy", "zq-deploy api", "zq-deploy", "rollback zq-deploy", "zq_d", "zqxd"]
+    ids = {client.post("/tasks", json={"title": t}).json()["id"]: t for t in titles}
+
+    def search(q, **params):
+        seen, cursor = [], None
+        while True:
+            params.update(q=q, limit=2, cursor=cursor)
+            page = client.get("/tasks", params=params).json()
+            seen += [ids[t["id"]] for t in page["items"] if t["id"] in ids]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return seen
+
+    # exact (ties by id), then prefixes (shortest first), then substrings
+    found = search("ZQ-DEPLOY")
+    assert sorted(found[:2]) == ["Zq-deploy", "zq-deploy"]
+    assert found[2:] == ["zq-deploy api", "rollback zq-deploy"]
+    # wildcards are literal; short queries only match prefixes
+    assert search("zq_") == ["zq_d"]
+    assert search("q-") == []
+    assert "rollback zq-deploy" not in search("zq")
+
+    first = client.get("/tasks", params={"q": "zq", "limit": 1}).json()
+    other = client.get("/tasks", params={"q": "zqx", "cursor": first["next_cursor"]})
+    assert other.status_code == 400
+
+
+def test_batch_create_and_run(monkeypatch):
+    created = client.post("/tasks:batch", json={"items": [{"title": f"b-{i}"} for i in range(50)]})
+    assert created.status_code == 201, created.text
+    ids = created.json()["ids"]
+    assert len(set(ids)) == 50
+    assert [client.get(f"/tasks/{i}").json()["title"] for i in ids[:3]] == ["b-0", "b-1", "b-2"]
+
+    enqueued = []
+
+    def fake_enqueue(task_ids):
+        enqueued.append(list(task_ids))
+        return [f"job-{n}" for n in range(len(task_ids))]
+
+    monkeypatch.setattr(task_crud, "enqueue_run_tasks", fake_enqueue)
+    r = client.post("/tasks:run-batch", json={"ids": ids[:3] + ids[:1]})
+    assert r.status_code == 201, r.text
+    assert [j["task_id"] for j in r.json()] == ids[:3] and len(enqueued) == 1
+    assert client.get(f"/tasks/{ids[0]}").json()["status"] == "PENDING"
+    # claimed: neither another batch nor a single run enqueues them again
+    again = client.post("/tasks:run-batch", json={"ids": ids[2:4]})
+    assert again.status_code == 409 and list(again.json()["detail"]["tasks"]) == [ids[2]]
+    assert client.post(f"/tasks/{ids[1]}/run").status_code == 409
+    assert client.get(f"/tasks/{ids[3]}").json()["status"] == "NEW"
+
+    client.put(f"/tasks/{ids[5]}", json={"title": "b-5", "status": "RUNNING", "result": None})
+    blocked = client.post("/tasks:run-batch", json={"ids": ids[4:6]})
+    assert blocked.status_code == 409 and list(blocked.json()["detail"]["tasks"]) == [ids[5]]
+    unknown = "c5256521-1111-43e8-9748-6f033cd4a3af"
+    missing = client.post("/tasks:run-batch", json={"ids": [ids[4], unknown]})
+    assert missing.status_code == 404 and missing.json()["detail"]["ids"] == [unknown]
+    assert len(enqueued) == 1  # nothing enqueued on failure
+
+    def broken_enqueue(task_ids):
+        raise ConnectionError("broker down")
+
+    monkeypatch.setattr(task_crud, "enqueue_run_tasks", broken_enqueue)
+    failed = client.post("/tasks:run-batch", json={"ids": ids[6:8]})
+    assert failed.status_code == 503
+    assert {client.get(f"/tasks/{i}").json()["status"] for i in ids[6:8]} == {"NEW"}
+
+    assert client.post("/tasks:batch", json={"items": []}).status_code == 422
+
+
+def test_run_claims_once_and_replays_idempotency_key(monkeypatch, db_session):
+    enqueued = []
+
+    def fake_enqueue(task_id, job_id):
+        enqueued.append((task_id, job_id))
+        return job_id
+
+    monkeypatch.setattr(task_crud, "enqueue_run_task", fake_enqueue)
+    task_id = client.post("/tasks", json={"title": "run-once"}).json()["id"]
+    other_id = client.post("/tasks", json={"title": "run-other"}).json()["id"]
+
+    key = {"Idempotency-Key": f"run-{task_id}"}
+    first = client.post(f"/tasks/{task_id}/run", headers=key)
+    assert first.status_code == 201, first.text
+    assert client.get(f"/tasks/{task_id}").json()["status"] == "PENDING"
+    retry = client.post(f"/tasks/{task_id}/run", headers=key)
+    assert retry.status_code == 201 and retry.json() == first.json()
+    assert client.post(f"/tasks/{task_id}/run").status_code == 409
+    assert client.post(f"/tasks/{other_id}/run", headers=key).status_code == 422
+    assert len(enqueued) == 1 and enqueued[0][1] == first.json()["job_id"]
+
+    unknown = "c5256521-1111-43e8-9748-6f033cd4a3af"
+    assert client.post(f"/tasks/{unknown}/run").status_code == 404
+
+    def broken_enqueue(task_id, job_id):
+        raise ConnectionError("broker down")
+
+    monkeypatch.setattr(task_crud, "enqueue_run_task", broken_enqueue)
+    failed = client.post(f"/tasks/{other_id}/run", headers={"Idempotency-Key": "k-other"})
+    assert failed.status_code == 503
+    # released: runnable again, and the key was not kept
+    assert client.get(f"/tasks/{other_id}").json()["status"] == "NEW"
+    assert db_session.get(TaskRunKey, "k-other") is None
+
+    stale = db_session.get(TaskRunKey, f"run-{task_id}")
+    stale.created_at = datetime.utcnow() - timedelta(hours=retention.TASK_RUN_KEY_TTL_HOURS + 1)
+    db_session.commit()
+    retention.cleanup(db_session, timedelta(days=1))
+    db_session.expire_all()
+    assert db_session.get(TaskRunKey, f"run-{task_id}") is None
+
+
+def test_pool_options_and_metrics(monkeypatch):
+    pg = "postgresql+psycopg://u:p@db:5432/opsbox"
+    opts = database.engine_options(pg, is_async=True)
+    assert opts["poolclass"] is db_metrics.TimedAsyncQueuePool and opts["pool_size"] == 5
+    monkeypatch.setattr(database, "DB_PGBOUNCER", True)
+    opts = database.engine_options(pg)
+    assert opts["poolclass"] is db_metrics.TimedNullPool
+    assert opts["connect_args"] == {"prepare_threshold": None}
+    assert database.async_url(pg) == pg
+    assert database.async_url("sqlite:///x.db") == "sqlite+aiosqlite:///x.db"
+
+    engine = create_engine("sqlite://", poolclass=db_metrics.TimedQueuePool, pool_size=1)
+    db_metrics.watch(engine, "test")
+    with engine.connect() as conn:
+        conn.execute(text("select 1"))
+        assert db_metrics.registry.get_sample_value("db_pool_checked_out", {"engine": "test"}) == 1
+    assert db_metrics.registry.get_sample_value("db_pool_checked_out", {"engine": "test"}) == 0
+    count = {"engine": "sync"}  # TimedQueuePool's label
+    assert db_metrics.registry.get_sample_value("db_pool_checkout_wait_seconds_count", count) >= 1
+    assert b"db_pool_size" in client.get("/metrics").content
+
+
+class FakeRedis:
+    """The few redis.asyncio calls the task cache makes, in memory."""
+
+    def __init__(self):
+        self.data, self.ops = {}, []
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def mget(self, *keys):
+        return [self.data.get(k) for k in keys]
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def register_script(self, source):
+        assert source == shared_task_cache.SET_IF_GENERATION
+
+        async def set_if_generation(keys, args):
+            key, generation_key = keys
+            if int(self.data.get(generation_key, 0)) == args[2]:
+                self.data[key] = args[0]
+
+        return set_if_generation
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def delete(self, *keys):
+        self.ops.append(lambda: [self.data.pop(k, None) for k in keys])
+
+    def incr(self, key):
+        self.ops.append(lambda: self.data.update({key: int(self.data.get(key, 0)) + 1}))
+
+    async def execute(self):
+        for op in self.ops:
+            op()
+        self.ops = []
+
+
+def test_task_cache_reads_through_and_invalidates(monkeypatch, db_session):
+    fake = FakeRedis()
+    monkeypatch.setattr(shared_task_cache, "TASK_CACHE_URL", "redis://cache")
+    monkeypatch.setattr(task_cache, "_client", fake)
+
+    def looked_up(kind, result):
+        return task_cache.LOOKUPS.labels(kind, result)._value.get()
+
+    task_id = client.post("/tasks", json={"title": "cached"}).json()["id"]
+    misses = looked_up("task", "miss")
+    assert client.get(f"/tasks/{task_id}").json()["title"] == "cached"
+    assert looked_up("task", "miss") == misses + 1
+    # a write behind the cache's back is not seen until the TTL...
+    db_session.get(Task, UUID(task_id)).title = "changed"
+    db_session.commit()
+    hits = looked_up("task", "hit")
+    assert client.get(f"/tasks/{task_id}").json()["title"] == "cached"
+    assert looked_up("task", "hit") == hits + 1
+    # ...but an update through the API drops it
+    body = {"title": "updated", "status": "PENDING", "result": None}
+    client.put(f"/tasks/{task_id}", json=body)
+    assert client.get(f"/tasks/{task_id}").json()["title"] == "updated"
+
+    page = client.get("/tasks", params={"limit": 1}).json()
+    assert client.get("/tasks", params={"limit": 1}).json() == page
+    assert looked_up("list", "hit") >= 1
+    newest = client.post("/tasks", json={"title": "newest"}).json()["id"]
+    assert client.get("/tasks", params={"limit": 1}).json()["items"][0]["id"] == newest
+
+    client.delete(f"/tasks/{task_id}")
+    assert client.get(f"/tasks/{task_id}").status_code == 404
+
+    # a load racing a write does not put the old task back after the write's invalidate
+    async def racing_load():
+        await task_cache.invalidate(["raced"])
+        return {"title": "before the write"}
+
+    asyncio.run(task_cache.cached_task("raced", racing_load))
+    assert shared_task_cache.task_key("raced") not in fake.data
+
+
+def test_status_stream_polls_sqlite_and_filters(monkeypatch, test_engine, async_test_engine):
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=test_engine))
+    monkeypatch.setattr(database, "AsyncSessionLocal", async_sessionmaker(bind=async_test_engine))
+    monkeypatch.setattr(task_stream, "TASK_STREAM_POLL_SECONDS", 0.05)
+    watched = client.post("/tasks", json={"title": "watched"}).json()["id"]
+    other = client.post("/tasks", json={"title": "other"}).json()["id"]
+
+    with client.websocket_connect(f"/ws/tasks/stream?task_id={watched}") as ws:
+        assert ws.receive_json() | {"updated_at": None} == {
+            "id": watched,
+            "status": "NEW",
+            "result": None,
+            "updated_at": None,
+        }
+        time.sleep(0.2)  # let the poller take its starting point
+        for task_id in (other, watched):
+            body = {"title": "x", "status": "SUCCEEDED", "result": "done"}
+            client.put(f"/tasks/{task_id}", json=body)
+        change = ws.receive_json()
+        assert (change["id"], change["status"], change["result"]) == (watched, "SUCCEEDED", "done")
+    assert task_stream.TASK_STREAM.topics().get(task_stream.TOPIC, 0) == 0
+
+    match, initial = task_stream.subscription(None, [TaskStatus.FAILED])
+    assert initial is None and match((other, "FAILED")) and not match((other, "RUNNING"))
+    assert client.get("/tasks/stream", params={"status": "BOGUS"}).status_code == 422
+
+
+def test_retention_deletes_expired_finished_tasks_in_batches(monkeypatch, db_session, test_engine):
+    old = datetime.utcnow() - timedelta(hours=1)
+    statuses = [TaskStatus.SUCCEEDED] * 3 + [TaskStatus.FAILED, TaskStatus.RUNNING]
+    expired = [Task(title="old", status=s, created_at=old) for s in statuses]
+    fresh = Task(title="fresh", status=TaskStatus.SUCCEEDED)
+    db_session.add_all([*expired, fresh])
+    db_session.commit()
+    ids = [t.id for t in [*expired, fresh]]
+
+    monkeypatch.setattr(job_logic, "SessionLocal", sessionmaker(bind=test_engine))
+    monkeypatch.setattr(retention, "TASK_CLEANUP_BATCH", 2)
+    monkeypatch.setattr(retention, "TASK_CLEANUP_PAUSE", 0)
+    batches = retention.CLEANUP_ROWS.labels("batch")._value.get()
+    assert job_logic.cleanup_old_tasks_impl(retention_mins=5) == 4
+    assert retention.CLEANUP_ROWS.labels("batch")._value.get() == batches + 4
+
+    db_session.expire_all()
+    left = db_session.scalars(select(Task.id).where(Task.id.in_(ids))).all()
+    assert set(left) == {expired[4].id, fresh.id}  # unfinished and recent tasks stay
+
+    bound = "FOR VALUES FROM (MINVALUE) TO ('2026-10-20 00:00:00')"
+    assert retention.UPPER_BOUND.search(bound).group(1) == "2026-10-20 00:00:00"
+    assert retention.partition_name(datetime(2026, 10, 20)) == "tasks_p20261020"
+
+
+def test_stats_are_maintained_incrementally_and_reconciled(monkeypatch, test_engine):
+    monkeypatch.setattr(job_logic, "SessionLocal", sessionmaker(bind=test_engine))
+    job_logic.reconcile_task_stats_impl()  # rows inserted behind the API's back
+    before = client.get("/tasks/stats").json()
+
+    batch = [{"title": f"s-{i}"} for i in range(4)]
+    ids = client.post("/tasks:batch", json={"items": batch}).json()["ids"]
+    doomed = client.post("/tasks", json={"title": "doomed"}).json()["id"]
+    for task_id, status in zip(ids, ["SUCCEEDED", "SUCCEEDED", "FAILED", "RUNNING"], strict=True):
+        client.put(f"/tasks/{task_id}", json={"title": None, "status": status, "result": None})
+    client.delete(f"/tasks/{doomed}")
+
+    after = client.get("/tasks/stats", params={"window_minutes": 15}).json()
+    delta = {s: after["counts"][s] - before["counts"][s] for s in after["counts"]}
+    assert delta == {"NEW": 0, "PENDING": 0, "RUNNING": 1, "SUCCEEDED": 2, "FAILED": 1}
+    assert after["total"] - before["total"] == 4
+    assert after["completed"] - before["completed"] == 3
+    assert after["duration_p50_seconds"] <= 1  # finished right after creation
+    assert job_logic.reconcile_task_stats_impl() == {}
+
+    # counter rows are locked in status order whichever way a task moves
+    for before_, after_ in (
+        (TaskStatus.NEW, TaskStatus.PENDING),
+        (TaskStatus.PENDING, TaskStatus.NEW),
+    ):
+        params = task_stats.transition("postgresql", before_, after_)[0].compile().params
+        assert [params["status_m0"], params["status_m1"]] == ["NEW", "PENDING"]
+        assert params["shard_m0"] == params["shard_m1"]  # one shard per transaction
+
+    # the stats sum the counter shards (these two are past the ones writers pick)
+    spare = task_stats.TASK_STATS_COUNTER_SHARDS
+    with sessionmaker(bind=test_engine)() as db:
+        db.add_all(
+            [
+                TaskStatusCount(status="FAILED", shard=spare, count=5),
+                TaskStatusCount(status="FAILED", shard=spare + 1, count=-5),
+            ]
+        )
+        db.commit()
+    assert client.get("/tasks/stats").json()["counts"] == after["counts"]
+
+    assert task_stats.quantile({0: 10}, 0.5) == 0.5
+    assert task_stats.quantile({1: 1, 12: 1}, 0.95) == 21600
+    assert client.get("/tasks/stats", params={"window_minutes": 0}).status_code == 422
@@ -4,43 +4,52 @@ import { api } from "@/lib/api";
 type Props = {
   namespace: string;
   name: string;
+  container?: string;
   tailLines?: number;
-  intervalMs?: number;
 };
 
+type LogLine = { ts: string | null; line: string };
+
 export default function LogsViewer({
   namespace,
   name,
+  container,
   tailLines = 1000,
-  intervalMs = 2000,
 }: Props) {
-  const [text, setText] = useState<string>("");
+  const [lines, setLines] = useState<string[]>([]);
   const [paused, setPaused] = useState(false);
   const ref = useRef<HTMLDivElement>(null);
+  const pausedRef = useRef(paused);
+  pausedRef.current = paused;
 
+  // follow the server-side stream; lines are capped at tailLines on the client too
   useEffect(() => {
-    let timer: number | undefined;
-    const fetchLogs = async () => {
-      try {
-        const res = await api.get<string>(
-          `/kubectl/pods/${namespace}/${name}/logs`,
-          {
-            params: { tail_lines: tailLines },
-          },
-        );
-        setText(res.data);
-        if (ref.current && !paused)
-          ref.current.scrollTop = ref.current.scrollHeight;
-      } catch {}
-    };
-    fetchLogs();
-    timer = window.setInterval(() => {
-      if (!paused) fetchLogs();
-    }, intervalMs);
-    return () => {
-      if (timer) window.clearInterval(timer);
+    const qs = new URLSearchParams({
+      tail_lines: String(tailLines),
+      follow: "true",
+      format: "sse",
+    });
+    if (container) qs.set("container", container);
+    const es = new EventSource(
+      `${api.defaults.baseURL}/kubectl/pods/${namespace}/${name}/logs?${qs}`,
+    );
+    es.onmessage = (msg) => {
+      if (pausedRef.current) return;
+      const { line } = JSON.parse(msg.data) as LogLine;
+      setLines((prev) => {
+        const next = prev.length >= tailLines ? prev.slice(1) : prev.slice();
+        next.push(line);
+        return next;
+      });
     };
-  }, [namespace, name, tailLines, intervalMs, paused]);
+    setLines([]);
+    return () => es.close();
+  }, [namespace, name, container, tailLines]);
+
+  useEffect(() => {
+    if (ref.current && !paused)
+      ref.current.scrollTop = ref.current.scrollHeight;
+  }, [lines, paused]);
 
   return (
     <div className="rounded-xl border border-zinc-300 bg-white shadow">
@@ -55,9 +64,9 @@ export default function LogsViewer({
       </div>
       <div
         ref={ref}
-        className="h-80 overflow-auto p-3 font-mono text-xs bg-zinc-900 text-zinc-50"
+        className="h-80 overflow-auto whitespace-pre p-3 font-mono text-xs bg-zinc-900 text-zinc-50"
       >
-        {text || "No logs."}
+        {lines.length ? lines.join("\n") : "No logs."}
       </div>
     </div>
   );
@@ -1,69 +1,36 @@
 import KPICard from "@/components/KPICard";
 import DataTable from "@/components/DataTable";
 import { useQuery } from "@tanstack/react-query";
-import { get, listAllCount, list } from "@/lib/api";
-import type { ListResponse, Event, Node, Pod } from "@/types";
+import { get, list } from "@/lib/api";
+import type { ClusterSummary, Event } from "@/types";
+
+const pct = (used: number | null, total: number) =>
+  used == null || !total ? "—" : `${Math.round((used / total) * 100)}%`;
 
 export default function DashboardPage() {
+  // all KPIs come from one server-side aggregate (cached there for a few seconds)
+  const summaryQ = useQuery({
+    queryKey: ["summary"],
+    queryFn: () => get<ClusterSummary>("/kubectl/summary"),
+    refetchInterval: 15_000,
+  });
+
   // last 15m warnings
   const eventsQ = useQuery({
     queryKey: ["events", "warnings"],
     queryFn: () =>
       list<Event>("/kubectl/events", {
-        only_warnings: true,
+        only_warning: true,
         since_seconds: 900,
         limit: 20,
       }),
   });
-  console.log("eventsQ:", eventsQ);
-
-  // counts
-  const namespacesCountQ = useQuery({
-    queryKey: ["namespaces-count"],
-    queryFn: () => listAllCount("/kubectl/namespaces", {}),
-  });
-  console.log("namespacesCountQ:", namespacesCountQ);
-
-  const nodesQ = useQuery({
-    queryKey: ["nodes-summary"],
-    queryFn: () =>
-      list<Node>("/kubectl/nodes", { include_metrics: true, limit: 200 }),
-  });
-
-  const podsPhaseQ = useQuery({
-    queryKey: ["pods-phase-counts"],
-    queryFn: async () => {
-      // up to 10 pages x 200
-      let token: string | undefined = undefined;
-      const counts: Record<string, number> = {};
-      for (let i = 0; i < 10; i++) {
-        const resp: ListResponse<Pod> = await list<Pod>("/kubectl/pods", {
-          limit: 200,
-          continue: token,
-        });
-        for (const p of (resp.items ?? []) as any[]) {
-          counts[p.phase] = (counts[p.phase] || 0) + 1;
-        }
-        token = resp.continue;
-        if (!token) break;
-      }
-      return counts;
-    },
-  });
-
-  const nodes = nodesQ.data?.items ?? [];
-  const ready = nodes.filter((n) => (n as any).ready).length;
-  const total = nodes.length;
 
-  const podsCounts = podsPhaseQ.data ?? {};
-  const podsTotal = Object.values(podsCounts).reduce(
-    (a, b) => a + (b as number),
-    0,
-  );
-  const podsSummary = Object.keys(podsCounts).length
-    ? Object.entries(podsCounts)
+  const s = summaryQ.data;
+  const podsSummary = s
+    ? Object.entries(s.pods.by_phase)
         .map(([k, v]) => `${k}:${v}`)
-        .join(" · ")
+        .join(" · ") || "—"
     : "—";
 
   return (
@@ -71,19 +38,23 @@ export default function DashboardPage() {
       <div className="grid gap-4 sm:grid-cols-2 lg:grid-cols-4">
         <KPICard
           label="Namespaces"
-          value={namespacesCountQ.data ?? "—"}
+          value={s?.namespaces ?? "—"}
           hint="Total namespaces"
         />
         <KPICard
           label="Nodes"
-          value={`${ready}/${total}`}
-          hint="Ready / Total"
-        />
-        <KPICard label="Pods" value={podsTotal || "—"} hint={podsSummary} />
-        <KPICard
-          label="Warnings (15m)"
-          value={eventsQ.data?.items?.length ?? 0}
+          value={s ? `${s.nodes.ready}/${s.nodes.total}` : "—"}
+          hint={
+            s
+              ? `Ready / Total · CPU ${pct(s.cpu.usage, s.cpu.allocatable)} · Mem ${pct(
+                  s.memory.usage,
+                  s.memory.allocatable,
+                )}`
+              : "Ready / Total"
+          }
         />
+        <KPICard label="Pods" value={s?.pods.total ?? "—"} hint={podsSummary} />
+        <KPICard label="Warnings (15m)" value={s?.warnings.total ?? "—"} />
       </div>
 
       <section className="space-y-3">
@@ -9,7 +9,7 @@ export default function EventsPage() {
     {
       maxRows: 2000,
       fallbackPollMs: 3000,
-      params: { only_warnings: true, since_seconds: 900 },
+      params: { only_warning: true, since_seconds: 900 },
     },
   );
 
@@ -12,12 +12,22 @@ type Options = {
   fallbackPollMs?: number;
   /** Query params for initial/fallback fetches */
   params?: {
-    only_warnings?: boolean;
+    namespace?: string;
+    only_warning?: boolean;
     since_seconds?: number;
     [k: string]: any;
   };
 };
 
+/** The stream is filtered server-side by namespace / only_warning, like /kubectl/events */
+function streamPath(path: string, params: Options["params"] = {}) {
+  const qs = new URLSearchParams();
+  if (params.namespace) qs.set("namespace", params.namespace);
+  if (params.only_warning) qs.set("only_warning", "true");
+  const q = qs.toString();
+  return q ? `${path}?${q}` : path;
+}
+
 function eventKey(e: Event) {
   // Composite key good enough for dedupe
   const o = e.involved_object || ({} as any);
@@ -68,7 +78,7 @@ export function useEventStream(
     let abort = false;
     (async () => {
       try {
-        const d = await get<{ items: Event[] }>("/k8s/events", {
+        const d = await get<{ items: Event[] }>("/kubectl/events", {
           limit: 50,
           ...params,
         });
@@ -88,7 +98,7 @@ export function useEventStream(
     pollTimer.current = window.setInterval(async () => {
       if (paused) return;
       try {
-        const d = await get<{ items: Event[] }>("/k8s/events", {
+        const d = await get<{ items: Event[] }>("/kubectl/events", {
           limit: 20,
           ...params,
         });
@@ -108,7 +118,7 @@ export function useEventStream(
     stopPolling();
     setState(paused ? "paused" : "connecting");
     try {
-      const ws = makeWS(path);
+      const ws = makeWS(streamPath(path, params));
       wsRef.current = ws;
 
       ws.onopen = () => {
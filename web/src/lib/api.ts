@@ -57,24 +57,28 @@ export async function list<T>(
   return { items, continue: cont, total };
 }
 
-/** Count items across pages (bounded to avoid overload). */
+/**
+ * Count items across all pages. The API follows continue tokens itself
+ * (all=true) and streams one name per line, so this is a single request.
+ */
 export async function listAllCount(
   url: string,
   params?: Omit<ListParams, "continue">,
-  safety = { maxPages: 10, pageSize: 200 },
+  safety = { maxItems: 100_000 },
 ) {
-  let token: string | undefined = undefined;
-  let pages = 0;
-  let total = 0;
-  do {
-    const resp: ListResponse<any> = await list<any>(url, {
+  const res = await api.get<string>(url, {
+    params: {
       ...params,
-      limit: safety.pageSize,
-      continue: token,
-    });
-    total += resp.items?.length ?? 0;
-    token = resp.continue;
-    pages += 1;
-  } while (token && pages < safety.maxPages);
-  return total;
+      all: true,
+      format: "ndjson",
+      fields: "name",
+      max_items: safety.maxItems,
+    },
+    responseType: "text",
+    transformResponse: (d) => d,
+  });
+  // a trailing {"continue": ...} line means the cap was hit; it is not an item
+  return res.data
+    .split("\n")
+    .filter((line) => line && !line.startsWith('{"continue"')).length;
 }
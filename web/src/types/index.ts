@@ -40,4 +40,18 @@ export interface Event {
   last_timestamp: string;
 }
 
+export interface ClusterSummary {
+  namespaces: number;
+  pods: { total: number; by_phase: Record<string, number> };
+  nodes: { total: number; ready: number; not_ready: number };
+  cpu: { allocatable: number; usage: number | null }; // cores
+  memory: { allocatable: number; usage: number | null }; // bytes
+  warnings: {
+    window_seconds: number;
+    total: number;
+    top_reasons: Record<string, number>;
+  };
+  generated_at: string;
+}
+
 export type ListResponse<T> = { items: T[]; continue?: string; total?: number };
@@ -1,10 +1,16 @@
+import os
 import random
 import time
 from datetime import UTC, datetime, timedelta
 
+from opsbox_common import task_cache, task_stats
 from opsbox_common.database import SessionLocal
 from opsbox_common.models import Task, TaskStatus
-from sqlalchemy import delete
+
+from . import retention
+from .metrics import CLEANUP_DURATION, STATS_CORRECTIONS
+
+TASK_STATS_HISTORY_HOURS = int(os.getenv("TASK_STATS_HISTORY_HOURS", "24"))
 
 
 def run_task_imp(task_id: str) -> str:
@@ -14,10 +20,13 @@ def run_task_imp(task_id: str) -> str:
         if not task:
             return "Task not found"
 
+        dialect = db.get_bind().dialect.name
         # mark running (idempotent)
-        task.status = TaskStatus.RUNNING
+        before, task.status = task.status, TaskStatus.RUNNING
         db.add(task)
+        task_stats.record(db, task_stats.transition(dialect, before, TaskStatus.RUNNING))
         db.commit()
+        task_cache.invalidate([task_id])
 
         time.sleep(random.uniform(0.5, 1.5))
         if random.random() < 0.5:
@@ -27,26 +36,37 @@ def run_task_imp(task_id: str) -> str:
             task.status = TaskStatus.FAILED
             task.result = "simulated failure"
         db.add(task)
+        task_stats.record(
+            db,
+            task_stats.transition(
+                dialect, TaskStatus.RUNNING, task.status, task.created_at, datetime.utcnow()
+            ),
+        )
         db.commit()
+        task_cache.invalidate([task_id])
         return task.result or "ok"
     finally:
         db.close()
 
 
 def cleanup_old_tasks_impl(retention_mins: int = 5) -> int:
-    """Delete tasks older than N minutes. Returns number of rows deleted."""
-    cutoff = datetime.now(UTC) - timedelta(minutes=retention_mins)  ##  5 minutes for testing
+    """Remove finished tasks older than N minutes. Returns the number of tasks removed."""
     db = SessionLocal()
     try:
-        q = (
-            delete(Task)
-            .where(Task.created_at < cutoff)
-            .where(Task.status.in_([TaskStatus.SUCCEEDED, TaskStatus.FAILED]))
-        )
-        res = db.execute(q)
-        db.commit()
+        with CLEANUP_DURATION.time():
+            return retention.cleanup(db, timedelta(minutes=retention_mins))
+    finally:
+        db.close()
+
 
-        deleted = res.rowcount if res.rowcount is not None and res.rowcount >= 0 else 0
-        return deleted
+def reconcile_task_stats_impl() -> dict[str, int]:
+    """Repair the task_stats counters from a recount. Returns the corrections by status."""
+    db = SessionLocal()
+    try:
+        now = datetime.now(UTC).replace(tzinfo=None)
+        drift = task_stats.reconcile(db, now, timedelta(hours=TASK_STATS_HISTORY_HOURS))
     finally:
         db.close()
+    for status, n in drift.items():
+        STATS_CORRECTIONS.labels(status).inc(abs(n))
+    return drift
@@ -1,6 +1,7 @@
 import threading
 from wsgiref.simple_server import make_server
 
+from opsbox_common import database, db_metrics
 from prometheus_client import (
     CONTENT_TYPE_LATEST,
     CollectorRegistry,
@@ -16,6 +17,37 @@ for r in ("SUCCEEDED", "FAILED", "unknown"):
     JOBS.labels(r).inc(0)
 JOB_LATENCY = Histogram("worker_job_latency_seconds", "Job latency in seconds", registry=registry)
 CLEANUPS = Counter("worker_cleanups_total", "Total number of cleanups", registry=registry)
+CLEANUP_ROWS = Counter(
+    "worker_cleanup_deleted_rows_total",
+    "Tasks removed by retention",
+    ["method"],  # partition (dropped/detached whole) or batch (chunked delete)
+    registry=registry,
+)
+CLEANUP_PARTITIONS = Counter(
+    "worker_cleanup_partitions_total",
+    "Expired task partitions removed by retention",
+    registry=registry,
+)
+CLEANUP_LOCK_TIMEOUTS = Counter(
+    "worker_cleanup_lock_timeouts_total",
+    "Partition maintenance attempts that gave up waiting for a table lock",
+    ["operation"],  # create or detach
+    registry=registry,
+)
+STATS_CORRECTIONS = Counter(
+    "worker_task_stats_corrections_total",
+    "Task counts corrected by reconciliation",
+    ["status"],
+    registry=registry,
+)
+CLEANUP_DURATION = Histogram(
+    "worker_cleanup_duration_seconds",
+    "Duration of a retention run",
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300),
+    registry=registry,
+)
+registry.register(db_metrics.registry)
+db_metrics.watch(database.engine, "sync")
 
 
 def metrics_app(environ, start_response):
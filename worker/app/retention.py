@@ -0,0 +1,226 @@
+"""Retention of finished tasks without long locks or WAL spikes.
+
+On Postgres, `tasks` is range-partitioned by created_at (one partition per UTC day,
+see migration c4e8a2f61d57). Each run first makes sure the next
+TASK_PARTITION_PREMAKE_DAYS partitions exist, then removes whole partitions that lie
+entirely before the cutoff and hold only finished tasks: DETACH, then DROP unless
+TASK_RETENTION_MODE=detach keeps them around for archiving. Whatever is left (rows
+in partitions still in use, or a deployment without partitions such as SQLite) is
+deleted in batches of TASK_CLEANUP_BATCH rows, one short transaction each, with a
+pause in between. Idempotency keys of task runs are kept TASK_RUN_KEY_TTL_HOURS.
+
+A DEFAULT partition, tasks_default, takes rows no daily partition covers, so inserts
+keep working when the worker has been down longer than the pre-created days; the
+next run moves such rows into the partition it creates for them. Creating and
+detaching partitions lock the parent table (DETACH ... CONCURRENTLY is not allowed
+next to a DEFAULT partition), so those transactions wait at most
+TASK_PARTITION_LOCK_TIMEOUT for their locks and are retried later instead of
+queueing every task write behind a long-running reader.
+"""
+
+import os
+import re
+import time
+from collections.abc import Callable
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from opsbox_common import task_cache, task_stats
+from opsbox_common.models import Task, TaskRunKey, TaskStatus
+from sqlalchemy import delete, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from .metrics import CLEANUP_LOCK_TIMEOUTS, CLEANUP_PARTITIONS, CLEANUP_ROWS
+
+TASK_PARTITION_PREMAKE_DAYS = int(os.getenv("TASK_PARTITION_PREMAKE_DAYS", "7"))
+TASK_RETENTION_MODE = os.getenv("TASK_RETENTION_MODE", "drop")  # drop | detach
+TASK_CLEANUP_BATCH = int(os.getenv("TASK_CLEANUP_BATCH", "5000"))
+TASK_CLEANUP_PAUSE = float(os.getenv("TASK_CLEANUP_PAUSE", "0.1"))  # seconds between batches
+TASK_RUN_KEY_TTL_HOURS = int(os.getenv("TASK_RUN_KEY_TTL_HOURS", "24"))
+TASK_PARTITION_LOCK_TIMEOUT = os.getenv("TASK_PARTITION_LOCK_TIMEOUT", "2s")
+TASK_PARTITION_LOCK_RETRIES = int(os.getenv("TASK_PARTITION_LOCK_RETRIES", "5"))
+
+FINISHED = (TaskStatus.SUCCEEDED, TaskStatus.FAILED)
+
+PARTITIONS_SQL = text(
+    """
+    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'tasks'::regclass
+    """
+)
+UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+DEFAULT_PARTITION = "tasks_default"
+LOCK_NOT_AVAILABLE = "55P03"  # SQLSTATE of a lock_timeout
+
+
+def is_partitioned(db: Session) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    kind = db.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('tasks')"))
+    return kind.scalar() == "p"
+
+
+def partitions(db: Session) -> list[tuple[str, datetime | None]]:
+    """(name, exclusive upper bound) of every range partition, None for MAXVALUE."""
+    out = []
+    for name, bound in db.execute(PARTITIONS_SQL):
+        if bound == "DEFAULT":
+            continue
+        m = UPPER_BOUND.search(bound)
+        out.append((name, datetime.fromisoformat(m.group(1)) if m else None))
+    return sorted(out, key=lambda p: (p[1] is None, p[1] or datetime.min))
+
+
+def partition_name(day: datetime) -> str:
+    return f"tasks_p{day:%Y%m%d}"
+
+
+def _with_lock_timeout(db: Session, operation: str, work: Callable[[], Any]) -> Any:
+    """
+    `work()` in a transaction whose lock waits give up after TASK_PARTITION_LOCK_TIMEOUT,
+    retried with backoff; None if it never got its locks (the next run tries again).
+    """
+    for attempt in range(TASK_PARTITION_LOCK_RETRIES):
+        try:
+            db.execute(text(f"SET LOCAL lock_timeout = '{TASK_PARTITION_LOCK_TIMEOUT}'"))
+            return work()
+        except OperationalError as e:
+            db.rollback()
+            if getattr(e.orig, "sqlstate", None) != LOCK_NOT_AVAILABLE:
+                raise
+            CLEANUP_LOCK_TIMEOUTS.labels(operation).inc()
+            time.sleep(TASK_CLEANUP_PAUSE * 2**attempt)
+    return None
+
+
+def _create_default_partition(db: Session) -> None:
+    # deployments partitioned before tasks_default was added to the migration
+    db.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF tasks DEFAULT"))
+    db.commit()
+
+
+def _create_partition(db: Session, day: datetime) -> str:
+    name, upper = partition_name(day), day + timedelta(days=1)
+    bounds = f"FOR VALUES FROM ('{day.isoformat()}') TO ('{upper.isoformat()}')"
+    in_range = f"created_at >= '{day.isoformat()}' AND created_at < '{upper.isoformat()}'"
+    # creating a partition locks the parent anyway; taken first, nothing reaches
+    # the default partition between the check and the create
+    db.execute(text("LOCK TABLE tasks IN ACCESS EXCLUSIVE MODE"))
+    stray = db.execute(text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})"))
+    if not stray.scalar():
+        db.execute(text(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF tasks {bounds}'))
+    else:
+        # rows inserted while this partition was missing move from the default one
+        db.execute(text(f"ALTER TABLE tasks DETACH PARTITION {DEFAULT_PARTITION}"))
+        db.execute(text(f'CREATE TABLE "{name}" PARTITION OF tasks {bounds}'))
+        db.execute(text(f"INSERT INTO tasks SELECT * FROM {DEFAULT_PARTITION} WHERE {in_range}"))
+        db.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}"))
+        db.execute(text(f"ALTER TABLE tasks ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    db.commit()
+    return name
+
+
+def ensure_partitions(db: Session, now: datetime, days_ahead: int) -> list[str]:
+    """Create the daily partitions missing up to `days_ahead` days after `now`."""
+    _with_lock_timeout(db, "create", lambda: _create_default_partition(db))
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    uppers = [upper for _, upper in partitions(db)]
+    if None in uppers:
+        return []  # an open-ended partition already takes every future row
+    day = max(uppers, default=today)
+    created = []
+    while day <= today + timedelta(days=days_ahead):
+        name = _with_lock_timeout(db, "create", lambda day=day: _create_partition(db, day))
+        if name is None:
+            break  # later days would leave a gap; the next run carries on from here
+        created.append(name)
+        day += timedelta(days=1)
+    return created
+
+
+def _detach_expired(db: Session, name: str, mode: str) -> int | None:
+    """Detach (and drop) partition `name` if it holds only finished tasks; rows removed."""
+    # no writer can touch the rows between the check and the detach
+    db.execute(text(f'LOCK TABLE "{name}" IN SHARE ROW EXCLUSIVE MODE'))
+    counts = dict(db.execute(text(f'SELECT status, count(*) FROM "{name}" GROUP BY status')))
+    if set(counts) - {s.value for s in FINISHED}:
+        db.rollback()  # unfinished tasks; the batched delete takes its finished rows
+        return None
+    db.execute(text(f'ALTER TABLE tasks DETACH PARTITION "{name}"'))
+    if mode == "drop":
+        db.execute(text(f'DROP TABLE "{name}"'))
+    task_stats.record(
+        db, task_stats.count_changes("postgresql", {s: -n for s, n in counts.items()})
+    )
+    db.commit()
+    return sum(counts.values())
+
+
+def remove_expired_partitions(db: Session, cutoff: datetime, mode: str) -> int:
+    """Detach (and drop) partitions entirely before `cutoff` holding only finished tasks."""
+    removed = 0
+    for name, upper in partitions(db):
+        if upper is None or upper > cutoff:
+            break
+        rows = _with_lock_timeout(db, "detach", lambda name=name: _detach_expired(db, name, mode))
+        if rows is None:
+            continue
+        CLEANUP_PARTITIONS.inc()
+        CLEANUP_ROWS.labels("partition").inc(rows)
+        removed += rows
+    if removed:
+        task_cache.invalidate()  # list pages; the dropped tasks themselves expire by TTL
+    return removed
+
+
+def delete_in_batches(db: Session, cutoff: datetime, batch: int, pause: float) -> int:
+    """Delete finished tasks created before `cutoff`, `batch` rows per transaction."""
+    deleted = 0
+    while True:
+        expired = (
+            select(Task.id)
+            .where(Task.created_at < cutoff)
+            .where(Task.status.in_(FINISHED))
+            .limit(batch)
+        )
+        stmt = (
+            delete(Task)
+            .where(Task.created_at < cutoff)  # lets Postgres prune partitions
+            .where(Task.id.in_(expired))
+            .returning(Task.id, Task.status)
+        )
+        rows = db.execute(stmt).all()
+        ids = [row.id for row in rows]
+        statuses = [row.status for row in rows]
+        task_stats.record(db, task_stats.removed(db.get_bind().dialect.name, statuses))
+        db.commit()
+        if ids:
+            task_cache.invalidate(ids)
+            CLEANUP_ROWS.labels("batch").inc(len(ids))
+        deleted += len(ids)
+        if len(ids) < batch:
+            return deleted
+        time.sleep(pause)
+
+
+def delete_expired_run_keys(db: Session, cutoff: datetime) -> int:
+    """Forget Idempotency-Keys of runs requested before `cutoff`."""
+    stmt = delete(TaskRunKey).where(TaskRunKey.created_at < cutoff)
+    deleted = db.execute(stmt).rowcount
+    db.commit()
+    return deleted
+
+
+def cleanup(db: Session, retention: timedelta) -> int:
+    """One retention run; returns the number of tasks removed."""
+    # created_at is naive UTC
+    now = datetime.now(UTC).replace(tzinfo=None)
+    cutoff = now - retention
+    removed = 0
+    if is_partitioned(db):
+        ensure_partitions(db, now, TASK_PARTITION_PREMAKE_DAYS)
+        removed += remove_expired_partitions(db, cutoff, TASK_RETENTION_MODE)
+    delete_expired_run_keys(db, now - timedelta(hours=TASK_RUN_KEY_TTL_HOURS))
+    return removed + delete_in_batches(db, cutoff, TASK_CLEANUP_BATCH, TASK_CLEANUP_PAUSE)
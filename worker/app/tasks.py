@@ -4,7 +4,7 @@ import time
 from celery.schedules import crontab
 
 from .celery_app import celery_app
-from .job_logic import cleanup_old_tasks_impl, run_task_imp
+from .job_logic import cleanup_old_tasks_impl, reconcile_task_stats_impl, run_task_imp
 from .metrics import CLEANUPS, JOB_LATENCY, JOBS
 
 RETENTION_MINUTES = int(os.getenv("RETENTION_MINUTES", "5"))
@@ -32,11 +32,21 @@ def cleanup_old_tasks() -> int:
     return n
 
 
+@celery_app.task(name="tasks.reconcile_task_stats")
+def reconcile_task_stats() -> dict[str, int]:
+    return reconcile_task_stats_impl()
+
+
 # Configure Beat schedule (hourly). You can change to every N minutes if desired.
 celery_app.conf.beat_schedule = {
     "five-minutes-cleanup-old-tasks": {
         "task": "tasks.cleanup_old_tasks",
         "schedule": crontab(minute="*/5"),  # every 5 min
         "options": {"queue": os.getenv("QUEUE_NAME", "default")},
-    }
+    },
+    "fifteen-minutes-reconcile-task-stats": {
+        "task": "tasks.reconcile_task_stats",
+        "schedule": crontab(minute="*/15"),
+        "options": {"queue": os.getenv("QUEUE_NAME", "default")},
+    },
 }